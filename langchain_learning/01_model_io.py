@@ -1,7 +1,9 @@
 import os
+import sys
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from model_factory import get_model
+from streaming import stdout_sink, stream_chain
 from dotenv import load_dotenv
 
 # 0. 加载环境变量
@@ -18,12 +20,14 @@ load_dotenv()
 
 # 1. 选择你的 "Flavor" (这里你可以修改为 'deepseek' 或 'google' 来测试)
 #CURRENT_PROVIDER = "openai" 
-CURRENT_PROVIDER = "deepseek"
+# 显式传入的 provider 不会被环境变量覆盖，所以这里自己读取 LLM_PROVIDER (LLM_PROVIDER=stub 离线运行)
+CURRENT_PROVIDER = os.getenv("LLM_PROVIDER") or "deepseek"
 # CURRENT_PROVIDER = "google"
 
-try:
+# chain 的组装放在函数里：import 本模块没有任何副作用 (不构造 client、不发请求)
+def build_chain(provider=CURRENT_PROVIDER):
     # 初始化 Model
-    model = get_model(CURRENT_PROVIDER)
+    model = get_model(provider)
 
     # 2. 定义 Prompt (Intent)
     prompt_template = ChatPromptTemplate.from_messages([
@@ -35,17 +39,42 @@ try:
     parser = StrOutputParser()
 
     # 4. 构建 Chain (LCEL Stream)
-    chain = prompt_template | model | parser
+    return prompt_template | model | parser
 
-    # 5. 执行
-    print(f"--- 开始翻译任务 [{CURRENT_PROVIDER}] ---")
+def run_demo():
+    try:
+        chain = build_chain()
+
+        # 5. 执行
+        print(f"--- 开始翻译任务 [{CURRENT_PROVIDER}] ---")
+        input_data = {"language": "英文", "text": "LangChain 让切换大模型变得像切换 Android 主题一样简单。"}
+        
+        result = chain.invoke(input_data)
+        
+        print(f"原文: {input_data['text']}")
+        print(f"译文: {result}")
+
+    except Exception as e:
+        print(f"❌ 发生错误: {e}")
+        print("提示: 请检查 .env 文件是否配置了对应的 API Key")
+
+def run_stream_demo(sink=stdout_sink):
+    """
+    流式版本：译文一边生成一边推给 sink (默认打印到终端)，并记录首 Token 延迟与 tokens/sec。
+    sink 可换成 streaming.QueueSink / streaming.SSESink 或任意 callable(str)。
+    """
+    chain = build_chain()
     input_data = {"language": "英文", "text": "LangChain 让切换大模型变得像切换 Android 主题一样简单。"}
-    
-    result = chain.invoke(input_data)
-    
+    print(f"--- 开始流式翻译任务 [{CURRENT_PROVIDER}] ---")
     print(f"原文: {input_data['text']}")
-    print(f"译文: {result}")
+    print("译文: ", end="", flush=True)
+    result = stream_chain(chain, input_data, sink=sink)
+    print(f"\n⏱️ {result.metrics.summary_line()}")
+    return result
 
-except Exception as e:
-    print(f"❌ 发生错误: {e}")
-    print("提示: 请检查 .env 文件是否配置了对应的 API Key")
+if __name__ == "__main__":
+    # python 01_model_io.py --stream  → 流式输出
+    if "--stream" in sys.argv:
+        run_stream_demo()
+    else:
+        run_demo()
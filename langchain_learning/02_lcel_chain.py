@@ -1,17 +1,19 @@
-import os
+import sys
+import time
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from utils import get_model
+from streaming import stdout_sink, stream_chain
+from dag_scheduler import AssignDAG
+from telemetry import DEFAULT_JSONL_PATH, TelemetryHandler
 
 # ==========================================
 # Helper: 获取模型 (复用 01 的逻辑)
 # ==========================================
-# 优先尝试读取 DeepSeek，如果没配置则回退到 OpenAI
-if os.getenv("DEEPSEEK_API_KEY"):
-    model = get_model("deepseek")
-else:
-    model = get_model("openai")
+# lazy=True: import 本模块只组装 chain，不构造 client、不发请求
+# 不指定 provider: LLM_PROVIDER (如 stub) 优先，否则有 DEEPSEEK_API_KEY 用 DeepSeek，再回退到 OpenAI
+model = get_model(lazy=True)
 
 # ==========================================
 # 知识点讲解： `|` 符号 (Operator Overloading)
@@ -83,20 +85,94 @@ full_chain = (
     | summary_chain
 )
 
+# ==========================================
+# 进阶：依赖感知的并行调度 (dag_scheduler.py)
+# ==========================================
+# full_chain 里每个 assign 都要等上一个结束。再加两个派生字段后：
+#   pitfalls  只依赖 topic          → 可以和 explanation 同时跑
+#   interview 只依赖 explanation    → 可以和 code 同时跑
+# AssignDAG 从每个 prompt 的变量名推导依赖，依赖满足就立即启动。
+pitfalls_prompt = ChatPromptTemplate.from_template(
+    "列出 Android 开发中使用 {topic} 时最常见的 3 个坑，每条一句话。"
+)
+interview_prompt = ChatPromptTemplate.from_template(
+    "基于以下关于 {topic} 的解释，出一道面试题 (只输出题目):\n{explanation}"
+)
+
+dag_chain = AssignDAG({
+    "explanation": explain_chain,
+    "code": code_chain,
+    "pitfalls": pitfalls_prompt | model | StrOutputParser(),
+    "interview": interview_prompt | model | StrOutputParser(),
+    "summary": summary_chain,
+})
+
+def run_dag_demo(topic="LiveData"):
+    print(f"--- DAG 并行执行: {topic} ---")
+    print(f"依赖关系: {dag_chain.deps}")
+    result, trace = dag_chain.invoke_with_trace({"topic": topic})
+    print(f"\n[学习卡片]:\n{result['summary']}")
+    print(f"\n[常见坑]:\n{result['pitfalls']}")
+    print(f"\n{trace.format()}")
+
+def run_dag_batch_demo(topics=("LiveData", "ViewModel", "Room", "WorkManager"), max_concurrency=6):
+    # 多个 topic 同时进入 DAG，不同 topic 的 step 交错执行 (流水线)
+    print(f"--- DAG 批量执行: {len(topics)} topics, max_concurrency={max_concurrency} ---")
+    start = time.perf_counter()
+    runs = dag_chain.run_many([{"topic": t} for t in topics], max_concurrency=max_concurrency)
+    wall = time.perf_counter() - start
+    for run in runs:
+        if run.ok:
+            print(f"✅ {run.input['topic']:<12} wall={run.trace.wall_s * 1000:.0f}ms "
+                  f"critical path: {' → '.join(run.trace.critical_path())}")
+        else:
+            print(f"❌ {run.input['topic']:<12} {run.error!r}")
+    serial = sum(r.trace.serial_s for r in runs if r.ok)
+    print(f"📊 total wall={wall * 1000:.0f}ms vs. serial step time={serial * 1000:.0f}ms")
+
 # ==========================================
 # 执行
 # ==========================================
-print("--- 开始执行多步链 ---")
-topic = "LiveData"
-print(f"正在生成关于 {topic} 的解释和代码...")
+def run_demo(callbacks=None):
+    print("--- 开始执行多步链 ---")
+    topic = "LiveData"
+    print(f"正在生成关于 {topic} 的解释和代码...")
 
-# invoke 触发整个管道
-result = full_chain.invoke({"topic": topic})
+    # invoke 触发整个管道 (callbacks 用于挂 telemetry 等观察者)
+    result = full_chain.invoke({"topic": topic}, config={"callbacks": callbacks or []})
 
-print(f"\n[最终生成的代码]:\n{result}")
+    print(f"\n[最终生成的代码]:\n{result}")
+
+    # ==========================================
+    # 调试技巧：查看中间步骤
+    # ==========================================
+    # 如果你想看到每一步的输出，可以单独运行 explain_chain
+    # print("\n[Debug] 解释内容:", explain_chain.invoke({"topic": topic}))
 
 # ==========================================
-# 调试技巧：查看中间步骤
+# 流式执行：前两步 (assign) 跑完后，summary_chain 的 token 一产生就推给 sink
 # ==========================================
-# 如果你想看到每一步的输出，可以单独运行 explain_chain
-# print("\n[Debug] 解释内容:", explain_chain.invoke({"topic": topic}))
+def run_stream_demo(topic="LiveData", sink=stdout_sink):
+    print(f"--- 开始流式执行多步链: {topic} ---")
+    result = stream_chain(full_chain, {"topic": topic}, sink=sink)
+    # 这里的 TTFT 包含 explain + code 两步的完整耗时，真正 "逐字" 输出的只有最后一步
+    print(f"\n⏱️ {result.metrics.summary_line()}")
+    return result
+
+if __name__ == "__main__":
+    # python 02_lcel_chain.py --stream  → 流式输出
+    # python 02_lcel_chain.py --dag / --dag-batch  → 并行 DAG 调度 (单个 / 批量)
+    if "--stream" in sys.argv:
+        run_stream_demo()
+    elif "--dag" in sys.argv:
+        run_dag_demo()
+    elif "--dag-batch" in sys.argv:
+        run_dag_batch_demo()
+    elif "--telemetry" in sys.argv:
+        # 每一步 (explain / code / summary 及其内部的 prompt、model、parser) 的耗时与 token
+        telemetry = TelemetryHandler(jsonl_path=DEFAULT_JSONL_PATH)
+        run_demo(callbacks=[telemetry])
+        print(f"\n{telemetry.aggregator.report(max_depth=3)}")
+        print(f"\n📄 spans → {DEFAULT_JSONL_PATH}")
+    else:
+        run_demo()
@@ -1,4 +1,3 @@
-import os
 from typing import List
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
@@ -8,10 +7,9 @@ from utils import get_model
 # ==========================================
 # Helper: 获取模型
 # ==========================================
-if os.getenv("DEEPSEEK_API_KEY"):
-    model = get_model("deepseek")
-else:
-    model = get_model("openai")
+# lazy=True: import 本模块时不构造 client，第一次 invoke 时才初始化
+# 不指定 provider: LLM_PROVIDER (如 stub) 优先，否则有 DEEPSEEK_API_KEY 用 DeepSeek，再回退到 OpenAI
+model = get_model(lazy=True)
 
 # ==========================================
 # 核心概念：结构化输出 (Structured Output)
@@ -1,31 +1,16 @@
-import os
 from typing import List
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
 from pydantic import BaseModel, Field
-
-# 加载环境变量
-load_dotenv()
+from utils import get_model
+from providers import default_chat_provider
 
 # ==========================================
-# Helper: 获取模型
+# Helper: 获取模型 (统一走 utils.get_model，支持 LLM_PROVIDER=stub 离线运行)
 # ==========================================
-def get_model():
-    if os.getenv("DEEPSEEK_API_KEY"):
-        print("🤖 使用 DeepSeek 模型")
-        return ChatOpenAI(
-            model="deepseek-chat",
-            openai_api_key=os.getenv("DEEPSEEK_API_KEY"),
-            openai_api_base=os.getenv("DEEPSEEK_API_BASE"),
-            temperature=0.7
-        )
-    else:
-        print("🤖 使用 OpenAI 模型")
-        return ChatOpenAI(model="gpt-3.5-turbo", temperature=0.7)
-
-model = get_model()
+# 不指定 provider: LLM_PROVIDER (如 stub) 优先，否则有 DEEPSEEK_API_KEY 用 DeepSeek，再回退到 OpenAI
+print(f"🤖 使用 {default_chat_provider()} 模型")
+model = get_model(lazy=True)
 
 # ==========================================
 # 编程题：食谱推荐助手
@@ -1,4 +1,3 @@
-import os
 from typing import List
 from pydantic import BaseModel, Field
 from langchain_core.prompts import ChatPromptTemplate
@@ -6,10 +5,8 @@ from langchain_core.output_parsers import PydanticOutputParser
 from langchain_classic.output_parsers import OutputFixingParser
 from utils import get_model
 
-if os.getenv("DEEPSEEK_API_KEY"):
-    model = get_model("deepseek")
-else:
-    model = get_model("openai")
+# 不指定 provider: LLM_PROVIDER (如 stub) 优先，否则有 DEEPSEEK_API_KEY 用 DeepSeek，再回退到 OpenAI
+model = get_model(lazy=True)
 
 class ContactCard(BaseModel):
     name: str = Field(description="联系人姓名")
@@ -1,14 +1,11 @@
-import os
 from typing import List
 from pydantic import BaseModel, Field
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
 from utils import get_model
 
-if os.getenv("DEEPSEEK_API_KEY"):
-    model = get_model("deepseek")
-else:
-    model = get_model("openai")
+# 不指定 provider: LLM_PROVIDER (如 stub) 优先，否则有 DEEPSEEK_API_KEY 用 DeepSeek，再回退到 OpenAI
+model = get_model(lazy=True)
 
 # ==========================================
 # 05 主题：Prompt partial 与格式注入
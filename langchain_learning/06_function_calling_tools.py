@@ -1,27 +1,14 @@
-import os
 from datetime import datetime, timezone, timedelta
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
 from langchain_core.tools import tool
+from utils import get_model
+from providers import default_chat_provider
 
-load_dotenv()
-
-def get_model():
-    if os.getenv("DEEPSEEK_API_KEY"):
-        print("🤖 使用 DeepSeek 模型")
-        return ChatOpenAI(
-            model="deepseek-chat",
-            openai_api_key=os.getenv("DEEPSEEK_API_KEY"),
-            openai_api_base=os.getenv("DEEPSEEK_API_BASE"),
-            temperature=0.7
-        )
-    else:
-        print("🤖 使用 OpenAI 模型")
-        return ChatOpenAI(model="gpt-3.5-turbo", temperature=0.7)
-
-model = get_model()
+# 统一走 utils.get_model (client 复用 + 支持 LLM_PROVIDER=stub 离线运行)
+# 不指定 provider: LLM_PROVIDER (如 stub) 优先，否则有 DEEPSEEK_API_KEY 用 DeepSeek，再回退到 OpenAI
+print(f"🤖 使用 {default_chat_provider()} 模型")
+model = get_model(lazy=True)
 
 @tool
 def now_beijing() -> str:
@@ -1,8 +1,11 @@
 import os
+import sys
 from typing import List, Callable
 from langchain_core.tools import tool
 from langchain_core.messages import HumanMessage, SystemMessage
 from utils import get_model
+from providers import get_embeddings
+from client_registry import get_registry
 
 # ==========================================
 # 1. 模拟“工具海” (假设这里有成百上千个工具)
@@ -72,6 +75,25 @@ def get_relevant_tools(query: str) -> List[Callable]:
     # 如果没匹配到，返回通用工具或空（这里为了演示返回空）
     return selected_tools
 
+
+# 语义检索版本：工具描述做 embedding，按与问题的相似度选工具。
+# 默认使用本地 hashing embedding (hashing_embeddings.py)：离线、确定性、不花 token，
+# 工具多达成百上千个时也能在毫秒级完成检索。EMBEDDINGS_PROVIDER 可以换成真实模型。
+_tool_index = None
+
+def get_relevant_tools_semantic(query: str, k: int = 2, min_score: float = 0.0) -> List[Callable]:
+    global _tool_index
+    import numpy as np
+    embeddings = get_embeddings(os.getenv("EMBEDDINGS_PROVIDER") or "hashing")
+    if _tool_index is None:
+        # 索引只建一次：每个工具的 "名字 + 描述" 一行向量
+        texts = [f"{t.name}: {t.description}" for t in ALL_TOOLS]
+        _tool_index = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    print(f"\n🔍 [System] 正在根据问题 '{query}' 语义检索相关工具...")
+    scores = _tool_index @ np.asarray(embeddings.embed_query(query), dtype=np.float32)
+    top = np.argsort(-scores)[:k]
+    return [ALL_TOOLS[i] for i in top if scores[i] >= min_score]
+
 # ==========================================
 # 3. 运行演示
 # ==========================================
@@ -81,8 +103,8 @@ def run_dynamic_tool_demo(question: str, use_all_tools: bool = False):
         print(f"\n🚀 [Mode] 强制使用所有工具 (All Tools Strategy)...")
         relevant_tools = ALL_TOOLS
     else:
-        # 1. 检索阶段：只获取相关的工具
-        relevant_tools = get_relevant_tools(question)
+        # 1. 检索阶段：只获取相关的工具 (--semantic: 按 embedding 相似度检索)
+        relevant_tools = get_relevant_tools_semantic(question) if "--semantic" in sys.argv else get_relevant_tools(question)
     
     if not relevant_tools:
         print("⚠️ 未找到相关工具，直接回答...")
@@ -92,11 +114,10 @@ def run_dynamic_tool_demo(question: str, use_all_tools: bool = False):
         tools_to_bind = relevant_tools
 
     # 2. 绑定阶段：只绑定筛选后的工具 (Context Window 优化)
-    # 注意：这里我们动态创建了一个新的 model 实例或绑定
-    if os.getenv("DEEPSEEK_API_KEY"):
-        llm = get_model("deepseek")
-    else:
-        llm = get_model("openai")
+    # 注意：get_model 命中 client_registry 缓存，每次提问复用同一个 model 实例和连接池，
+    # 只有 bind_tools 产生的轻量 RunnableBinding 是新的
+    # 不指定 provider: LLM_PROVIDER 优先，否则有 DEEPSEEK_API_KEY 用 DeepSeek，再回退到 OpenAI
+    llm = get_model()
         
     if tools_to_bind:
         llm_with_tools = llm.bind_tools(tools_to_bind)
@@ -117,9 +138,14 @@ def run_dynamic_tool_demo(question: str, use_all_tools: bool = False):
         print(f"🗣️ 模型直接回答: {result.content}")
 
 if __name__ == "__main__":
+    # python 06b_dynamic_tool_selection.py --semantic → 按 embedding 相似度检索工具
     print("--- 场景1：询问库存 (动态筛选) ---")
     run_dynamic_tool_demo("帮我查一下 iPhone15(产品id) 的库存")
     
     print("\n--- 场景2：询问税务 (强制使用所有工具) ---")
     # 这里演示：虽然没做筛选，但把所有工具都给它，它也能从5个里挑出 calculate_tax
     run_dynamic_tool_demo("计算 1000 元的税", use_all_tools=True)
+
+    # 两次提问只构造了一次 model：hits 应为 1，misses 为 1
+    stats = get_registry().stats()
+    print(f"\n📊 [ClientRegistry] hits={stats['hits']} misses={stats['misses']} size={stats['size']}")
@@ -1,14 +1,11 @@
-import os
 from datetime import datetime, timezone, timedelta
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
 from langchain_core.tools import tool
 from langchain_core.chat_history import InMemoryChatMessageHistory
 from utils import get_model
 
-if os.getenv("DEEPSEEK_API_KEY"):
-    model = get_model("deepseek")
-else:
-    model = get_model("openai")
+# 不指定 provider: LLM_PROVIDER (如 stub) 优先，否则有 DEEPSEEK_API_KEY 用 DeepSeek，再回退到 OpenAI
+model = get_model(lazy=True)
 
 @tool
 def now_beijing() -> str:
@@ -1,4 +1,3 @@
-import os
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from langchain_core.tools import tool
 from langchain_core.prompts import ChatPromptTemplate
@@ -9,10 +8,9 @@ from utils import get_model
 # 1. 定义两组具体的工具 (Specific Tools)
 # ==========================================
 
-if os.getenv("DEEPSEEK_API_KEY"):
-    model = get_model("deepseek", temperature=0.1)
-else:
-    model = get_model("openai", temperature=0.1)
+# lazy=True: 模块顶层只声明依赖，第一次调用时才构造 client (冷启动不付费)
+# 不指定 provider: LLM_PROVIDER (如 stub) 优先，否则有 DEEPSEEK_API_KEY 用 DeepSeek，再回退到 OpenAI
+model = get_model(temperature=0.1, lazy=True)
 
 # --- 数学工具组 ---
 @tool
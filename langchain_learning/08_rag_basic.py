@@ -1,43 +1,133 @@
 import os
-from langchain_community.document_loaders import TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain.chains import create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
+import sys
+import time
+from contextlib import nullcontext
+try:
+    from langchain.chains import create_retrieval_chain
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+    from langchain.retrievers import ContextualCompressionRetriever
+except ImportError:
+    # langchain >= 1.0 moved the legacy chains into langchain-classic
+    from langchain_classic.chains import create_retrieval_chain
+    from langchain_classic.chains.combine_documents import create_stuff_documents_chain
+    from langchain_classic.retrievers import ContextualCompressionRetriever
 from langchain_core.prompts import ChatPromptTemplate
 from utils import get_model, get_embeddings_model
+from batch_runner import run_batch
+from rag_ann import AnnSpec
+from rag_batch_search import BatchVectorRetriever
+from rag_cache import SemanticAnswerCache
+from rag_compression import SentenceCompressor
+from rag_mmr import MMRRetriever
+from rag_quantized import QuantizedVectorStore
+from rag_embeddings import BatchedEmbeddings, CachedEmbeddings
+from rag_incremental import open_corpus_index
+from rag_index_store import DEFAULT_INDEX_DIR
+from rag_splitter import FastRecursiveSplitter
+from rag_retrievers import HybridRetriever
+from telemetry import DEFAULT_JSONL_PATH, TelemetryHandler
 
-def run_rag_pipeline():
-    print("--- 1. Loading Documents ---")
-    file_path = "rag_data/company_policy.txt"
-    loader = TextLoader(file_path)
-    docs = loader.load()
-    print(f"Loaded {len(docs)} document(s).")
-
-    print("\n--- 2. Splitting Documents ---")
-    # Split long text into smaller chunks for embedding
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,  # Characters per chunk
-        chunk_overlap=50, # Overlap to maintain context
-        add_start_index=True
+RAG_INDEX_DIR = os.getenv("RAG_INDEX_DIR", DEFAULT_INDEX_DIR)
+
+QUESTIONS = [
+    "How much is the home office budget?",
+    "Can I fly business class to New York (5 hour flight)?",
+    "What tech stack do we use?",
+    # Near-duplicate of the first question: answered by the semantic cache, no retrieval/LLM call
+    "how much is the home office budget?",
+]
+
+RAG_DATA_DIR = "rag_data"
+# chunk sizes are measured in tokens (tokens.py), so they line up with the model's limits
+SPLITTER_PARAMS = {"splitter": "fast-token", "chunk_size": 128, "chunk_overlap": 12, "add_start_index": True}
+INGEST_BATCH_SIZE = 64
+# Near-duplicate chunks (repeated boilerplate, copied paragraphs) are dropped before embedding
+# when their MinHash-estimated Jaccard similarity to an earlier chunk reaches this threshold
+# (rag_dedup.py); the canonical chunk records their sources. 0 disables dedup.
+DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.85"))
+# Vector index type: "flat" (exact) by default. For large corpora use e.g. RAG_INDEX_TYPE=hnsw,
+# ivf or ivfpq (options: "ivf:nprobe=32"); rag_ann.py trains it from a sample of the corpus and
+# falls back to flat below 2,000 chunks. Recall/latency/memory trade-offs: bench_ann.py.
+INDEX_SPEC = AnnSpec.parse(os.getenv("RAG_INDEX_TYPE", "flat"))
+# In-memory vector precision: "float32" keeps the FAISS store as is; "float16" / "int8" keep
+# 2 / 1 bytes per dimension in memory (rag_quantized.py) and re-score the top candidates with
+# the float32 vectors of the flat index, which load_index memory-maps (shared page cache, not
+# private memory). This trades speed for memory: the NumPy scoring is slower than FAISS
+# (20k x 1536d: int8 ~30ms/query vs IndexFlat ~13ms; float16 is slower still), so only switch
+# when the vectors dominate worker memory.
+VECTOR_DTYPE = os.getenv("RAG_VECTOR_DTYPE", "float32")
+# Retrieval mode: "hybrid" (BM25 + dense, rank fusion) or "mmr" (dense + maximal marginal
+# relevance: picks RAG_MMR_LAMBDA-weighted relevant but non-overlapping chunks out of RAG_MMR_FETCH_K).
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid")
+MMR_FETCH_K = int(os.getenv("RAG_MMR_FETCH_K", "20"))
+MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.5"))
+# Hard token budget for {context}: retrieved chunks are cut down to the query-relevant
+# sentences (rag_compression.py, local BM25 scoring, no LLM call). 0 disables compression.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKENS", "160"))
+COMPRESSOR = SentenceCompressor(token_budget=CONTEXT_TOKEN_BUDGET)
+# Dense side of the hybrid retriever (set by build_rag_chain). --batch mode prefetches every
+# question through it: one embedding request and one matrix search instead of one per question.
+DENSE_RETRIEVER = None
+
+def make_splitter():
+    # Split long text into smaller chunks for embedding.
+    # FastRecursiveSplitter (rag_splitter.py) uses the same separator hierarchy as
+    # RecursiveCharacterTextSplitter but sizes chunks in tokens and runs ~2x faster
+    # (see bench_splitter.py).
+    return FastRecursiveSplitter(
+        chunk_size=SPLITTER_PARAMS["chunk_size"],        # Tokens per chunk
+        chunk_overlap=SPLITTER_PARAMS["chunk_overlap"],  # Overlap to maintain context
+        add_start_index=SPLITTER_PARAMS["add_start_index"]
     )
-    splits = text_splitter.split_documents(docs)
-    print(f"Split into {len(splits)} chunks.")
-    print(f"Example chunk content: {splits[0].page_content[:100]}...")
 
-    print("\n--- 3. Indexing (Embedding + VectorStore) ---")
+def build_rag_chain():
+    global DENSE_RETRIEVER
     # Use OpenAI Embeddings to convert text to vectors
-    embeddings = get_embeddings_model()
-    
-    # Create VectorStore (FAISS) - This stores vectors in memory (or disk)
-    # We use FAISS (Facebook AI Similarity Search) for efficient similarity search
-    vectorstore = FAISS.from_documents(documents=splits, embedding=embeddings)
-    print("VectorStore created successfully.")
+    # CachedEmbeddings keys every vector by (embedding model, chunk text hash) in
+    # .cache/embeddings.sqlite, so a re-ingest only embeds new or changed chunks.
+    # BatchedEmbeddings sends the chunks that do need embedding in token-bounded batches,
+    # several at a time, and halves a batch when the provider rejects the payload size.
+    embeddings = CachedEmbeddings(
+        BatchedEmbeddings(get_embeddings_model(), max_batch_tokens=8000, max_concurrency=4))
+
+    # 1-3 (rag_incremental.open_corpus_index). The index is persisted to .cache/rag_index with a
+    # manifest (embedding model, splitter params, dedup threshold, source file hashes keyed relative
+    # to RAG_DATA_DIR):
+    # - manifest matches: steps 1-3 are skipped and the index file is memory-mapped (faiss
+    #   IO_FLAG_MMAP_IFC), so worker processes share its pages instead of each holding a private copy;
+    # - only source files changed: just those files are re-split and diffed against their old chunks
+    #   by stable chunk ID ("<source>:<start_index>"); new text is embedded, removed chunks are
+    #   tombstoned (filtered out of every search, compacted past 20%), the BM25 sidecar follows;
+    # - otherwise: one streaming pass reads, splits, dedups and embeds every INGEST_BATCH_SIZE chunks
+    #   into FAISS (peak memory depends on the batch size, not the corpus size) and feeds a BM25
+    #   inverted index for exact-term lookups.
+    corpus = open_corpus_index(RAG_DATA_DIR, RAG_INDEX_DIR, embeddings, make_splitter, SPLITTER_PARAMS,
+                               index_spec=INDEX_SPEC, dedup_threshold=DEDUP_THRESHOLD,
+                               batch_size=INGEST_BATCH_SIZE)
+    vectorstore, bm25 = corpus.vectorstore, corpus.bm25
+    if corpus.loaded:
+        print(f"--- 1-3. Loaded persisted index ({corpus.live_chunks} chunks, "
+              f"version {corpus.manifest.fingerprint()}) from {RAG_INDEX_DIR} ---")
+    if VECTOR_DTYPE != "float32":
+        vectorstore = QuantizedVectorStore.from_faiss(vectorstore, dtype=VECTOR_DTYPE)
+        print(f"--- Vector storage: {vectorstore.memory_report().summary_line()} ---")
 
     print("\n--- 4. Retrieval ---")
-    # Create a retriever interface from the vectorstore
-    # k=2 means we retrieve the top 2 most similar chunks
-    retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 2})
+    # Hybrid retrieval: dense similarity search and BM25 each return their top 8, then
+    # reciprocal rank fusion keeps the best 2. Exact terms ("business class", "4.1.2")
+    # that dense search misses still make it into the prompt without raising k.
+    # BatchVectorRetriever returns the same top 8 as as_retriever(search_kwargs={"k": 8}) and
+    # can also search many questions at once (rag_batch_search.py).
+    DENSE_RETRIEVER = BatchVectorRetriever(vectorstore=vectorstore, k=8)
+    retriever = HybridRetriever(vector_retriever=DENSE_RETRIEVER, bm25=bm25, k=2, fetch_k=8)
+    if RETRIEVAL_MODE == "mmr":
+        # Adjacent chunks share their overlap and are near-duplicates; MMR skips a candidate
+        # that is too similar to one already picked, so the 2 chunks cover different content.
+        retriever = MMRRetriever(vectorstore=vectorstore, k=2, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA)
+    if CONTEXT_TOKEN_BUDGET > 0:
+        # Compression stage between the retriever and the stuff chain: only sentences that
+        # match the question (plus the sentence after them) are kept, within the budget.
+        retriever = ContextualCompressionRetriever(base_compressor=COMPRESSOR, base_retriever=retriever)
     
     # Test retrieval alone
     query = "What is the policy for remote work equipment?"
@@ -46,13 +136,15 @@ def run_rag_pipeline():
     print(f"Retrieved {len(retrieved_docs)} relevant chunks.")
     for i, doc in enumerate(retrieved_docs):
         print(f"  [Chunk {i}] Source: {doc.metadata['source']} | Content: {doc.page_content.strip()[:100]}...")
+    if CONTEXT_TOKEN_BUDGET > 0:
+        print(f"  Context compression: {COMPRESSOR.last_report.summary_line()}")
 
     print("\n--- 5. Generation (RAG Chain) ---")
     # Define the LLM
-    if os.getenv("DEEPSEEK_API_KEY"):
-        llm = get_model("deepseek", temperature=0)
-    else:
-        llm = get_model("openai", temperature=0)
+    # temperature=0 → deterministic, so identical prompts are served from the on-disk
+    # response cache (llm_cache.py) instead of being paid for again. LLM_CACHE_BYPASS=1 disables it.
+    # No explicit provider: LLM_PROVIDER wins, then DeepSeek (if DEEPSEEK_API_KEY is set), then OpenAI.
+    llm = get_model(temperature=0, cache=True)
 
     # Define the Prompt Template
     # The 'context' variable will be filled by the retriever
@@ -76,19 +168,67 @@ def run_rag_pipeline():
     # 2. retrieval_chain: Takes query -> fetches docs -> passes to document_chain
     rag_chain = create_retrieval_chain(retriever, question_answer_chain)
 
-    # Run the Chain
-    questions = [
-        "How much is the home office budget?",
-        "Can I fly business class to New York (5 hour flight)?",
-        "What tech stack do we use?"
-    ]
+    # 3. semantic cache: near-identical questions reuse a previous answer (rag_cache.py).
+    # The index version is the manifest fingerprint (sources + splitter + embedding model),
+    # so re-indexing different content invalidates every cached answer.
+    return SemanticAnswerCache(rag_chain, embeddings, index_version=corpus.manifest.fingerprint())
+
+def run_rag_pipeline(callbacks=None):
+    rag_chain = build_rag_chain()
 
-    for q in questions:
+    # Run the Chain (sequential: total latency = sum of every retrieval + LLM round trip)
+    for q in QUESTIONS:
         print(f"\nUser: {q}")
-        response = rag_chain.invoke({"input": q})
+        response = rag_chain.invoke({"input": q}, config={"callbacks": callbacks or []})
         print(f"Agent: {response['answer']}")
+        if "cache_hit" in response:
+            print(f"  (semantic cache hit: {response['cache_hit']})")
+        elif CONTEXT_TOKEN_BUDGET > 0:
+            print(f"  (context: {COMPRESSOR.last_report.summary_line()})")
         # We can also inspect the source documents used
         # print(f"Source Docs: {[d.page_content[:20] for d in response['context']]}")
+    print(f"\n📊 Semantic cache: {rag_chain.stats()}")
+    if CONTEXT_TOKEN_BUDGET > 0:
+        print(f"📊 Context compression (all queries): {COMPRESSOR.totals.summary_line()}")
+
+def run_rag_batch(rag_chain, questions, max_concurrency=4):
+    """
+    Concurrent batch mode: all questions go through the retrieval chain at once
+    (bounded by max_concurrency). Results keep the input order and a failing
+    question only marks its own slot as failed.
+    """
+    print(f"\n--- 6. Batch Mode ({len(questions)} questions, max_concurrency={max_concurrency}) ---")
+    prefetch = nullcontext()
+    if DENSE_RETRIEVER is not None and RETRIEVAL_MODE == "hybrid":
+        # Dense retrieval for the whole batch up front; each chain run below picks up its result.
+        # Results nobody picked up (e.g. semantic cache hits) are dropped when the block exits.
+        prefetch = DENSE_RETRIEVER.prefetching(questions)
+    start = time.perf_counter()
+    with prefetch as prefetched:
+        if prefetched is not None:
+            print(f"Batched dense retrieval: {prefetched} questions in {(time.perf_counter() - start) * 1000:.1f}ms "
+                  f"(1 embedding request, 1 matrix search)")
+        report = run_batch(rag_chain, [{"input": q} for q in questions], max_concurrency=max_concurrency)
+    for item in report.results:
+        print(f"\nUser: {item.input['input']}")
+        if item.ok:
+            print(f"Agent: {item.output['answer']}  ({item.latency_s * 1000:.0f}ms)")
+        else:
+            print(f"❌ Failed: {item.error!r}")
+    print(f"\n📊 {report.summary_line()}")
+    if CONTEXT_TOKEN_BUDGET > 0:
+        print(f"📊 Context compression: {COMPRESSOR.totals.summary_line()}")
+    return report
 
 if __name__ == "__main__":
-    run_rag_pipeline()
+    # python 08_rag_basic.py --batch  → concurrent batch mode
+    # python 08_rag_basic.py --telemetry → per-step latency / token report (retrieval vs. generation)
+    if "--batch" in sys.argv:
+        run_rag_batch(build_rag_chain(), QUESTIONS)
+    elif "--telemetry" in sys.argv:
+        telemetry = TelemetryHandler(jsonl_path=DEFAULT_JSONL_PATH)
+        run_rag_pipeline(callbacks=[telemetry])
+        print(f"\n{telemetry.aggregator.report(max_depth=4)}")
+        print(f"\n📄 spans → {DEFAULT_JSONL_PATH}")
+    else:
+        run_rag_pipeline()
@@ -1,25 +1,17 @@
 import os
-from dotenv import load_dotenv
 from langchain_core.prompts import (
     ChatPromptTemplate,
     FewShotChatMessagePromptTemplate,
     SystemMessagePromptTemplate,
     HumanMessagePromptTemplate,
 )
-from langchain_openai import ChatOpenAI
+from utils import get_model
 
-# 1. Load Environment Variables
-load_dotenv()
-if not os.getenv("DEEPSEEK_API_KEY"):
-    print("⚠️ Please set DEEPSEEK_API_KEY in .env file")
-    exit(1)
-
-llm = ChatOpenAI(
-    model="deepseek-chat", 
-    temperature=0,
-    api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url=os.getenv("DEEPSEEK_API_BASE")
-)
+# 1. Model (lazy: nothing is constructed until the first demo runs)
+# utils.get_model loads .env; an explicit provider is never overridden by the environment,
+# so LLM_PROVIDER (e.g. LLM_PROVIDER=stub for offline runs) is applied here.
+# temperature=0 + cache=True: re-running the demos is served from the on-disk response cache
+llm = get_model(os.getenv("LLM_PROVIDER") or "deepseek", temperature=0, lazy=True, cache=True)
 
 def demo_system_prompt_best_practices():
     print("\n--- 1. System Prompt Best Practices ---")
@@ -100,6 +92,9 @@ def demo_chain_of_thought():
     print(f"Answer (Step-by-Step):\n{result.content}")
 
 if __name__ == "__main__":
+    if not os.getenv("DEEPSEEK_API_KEY") and not os.getenv("LLM_PROVIDER"):
+        print("⚠️ Please set DEEPSEEK_API_KEY in .env file (or LLM_PROVIDER=stub to run offline)")
+        exit(1)
     demo_system_prompt_best_practices()
     demo_few_shot_prompting()
     demo_chain_of_thought()
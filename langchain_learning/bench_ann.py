@@ -0,0 +1,118 @@
+"""
+ANN 索引基准：recall@k、查询延迟、索引内存
+
+对比 rag_ann 支持的索引类型 (flat / ivf / hnsw / ivfpq)，在不同语料规模上报告:
+    build      训练 + 写入耗时
+    recall@k   与 flat 精确检索结果的重合比例 (flat 本身恒为 1.0)
+    p50 / p95  单条查询延迟 (逐条 search，贴近在线检索的用法)
+    memory     序列化后的索引大小 (≈ 常驻内存 / mmap 文件大小)
+
+向量是合成的高斯混合 (固定随机种子)：真实 embedding 成簇分布、本征维度低，
+均匀随机向量会让 IVF/HNSW/PQ 的 recall 偏低，不具代表性。查询取自同一分布、但不在库里。
+参数默认按 AnnSpec.resolve 自动取值；也可以像 08_rag_basic 的 RAG_INDEX_TYPE 那样写选项。
+
+用法:
+    python bench_ann.py                                   # 10k,100k × flat,ivf,hnsw,ivfpq
+    python bench_ann.py --sizes 1000000 --dim 384 --specs "flat,ivf:nprobe=64,hnsw:ef_search=128"
+    python bench_ann.py --json ann.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from perf_metrics import summarize
+from rag_ann import AnnSpec, build_index, index_nbytes
+
+
+def make_vectors(n: int, dim: int, clusters: int = 256, intrinsic_dim: int = 32, seed: int = 0) -> np.ndarray:
+    """
+    clusters 个簇的高斯混合，簇内主要在一个 intrinsic_dim 维的子空间里变化 (真实 embedding 的本征维度远低于 dim)，
+    再叠加少量各向同性噪声。按块生成以控制峰值内存。
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    basis = rng.standard_normal((intrinsic_dim, dim), dtype=np.float32) / np.sqrt(intrinsic_dim)
+    out = np.empty((n, dim), dtype=np.float32)
+    for lo in range(0, n, 100_000):
+        hi = min(n, lo + 100_000)
+        labels = rng.integers(0, clusters, hi - lo)
+        latent = rng.standard_normal((hi - lo, intrinsic_dim), dtype=np.float32)
+        out[lo:hi] = (centers[labels] + latent @ basis
+                      + 0.05 * rng.standard_normal((hi - lo, dim), dtype=np.float32))
+    return out
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def run_spec(spec: AnnSpec, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int):
+    start = time.perf_counter()
+    index, params, train_s, add_s = build_index(vectors, spec)
+    build_s = time.perf_counter() - start
+    found = np.empty((len(queries), k), dtype=np.int64)
+    latencies = []
+    for i, q in enumerate(queries):
+        t = time.perf_counter()
+        _, ids = index.search(q[None, :], k)
+        latencies.append(time.perf_counter() - t)
+        found[i] = ids[0]
+    return {
+        "params": params,
+        "build_s": build_s,
+        "train_s": train_s,
+        "recall": recall_at_k(found, truth) if truth is not None else 1.0,
+        "latency": summarize(latencies),
+        "memory_mb": index_nbytes(index) / (1 << 20),
+    }, found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall / latency / memory of ANN index types.")
+    parser.add_argument("--sizes", default="10000,100000", help="comma separated corpus sizes")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--specs", default="flat,ivf,hnsw,ivfpq",
+                        help='index specs, e.g. "flat,ivf:nprobe=32,hnsw:ef_search=128"')
+    parser.add_argument("--json", dest="json_path", help="write results to this file")
+    args = parser.parse_args()
+
+    # 按顶层逗号拆分，但 "ivf:nlist=1024,nprobe=32" 里的逗号属于选项
+    specs, current = [], ""
+    for part in args.specs.split(","):
+        if "=" in part and ":" not in part and current:
+            current += "," + part
+        else:
+            if current:
+                specs.append(current)
+            current = part
+    specs.append(current)
+    if specs[0].split(":")[0] != "flat":
+        specs.insert(0, "flat")   # recall 以 flat 的结果为准
+
+    results = {}
+    header = f"{'n':>9} {'index':<22}{'build s':>9}{'recall@' + str(args.k):>10}{'p50 ms':>9}{'p95 ms':>9}{'mem MB':>9}  params"
+    print(header)
+    print("-" * len(header))
+    for size_text in args.sizes.split(","):
+        n = int(size_text)
+        vectors = make_vectors(n + args.queries, args.dim)
+        vectors, queries = vectors[:n], vectors[n:]
+        truth = None
+        for text in specs:
+            r, found = run_spec(AnnSpec.parse(text), vectors, queries, truth, args.k)
+            if truth is None:
+                truth = found
+            results[f"{n}/{text}"] = r
+            extra = {k: v for k, v in r["params"].items() if k != "index_type"}
+            print(f"{n:>9} {text:<22}{r['build_s']:>9.2f}{r['recall']:>10.3f}{r['latency']['p50'] * 1000:>9.3f}"
+                  f"{r['latency']['p95'] * 1000:>9.3f}{r['memory_mb']:>9.1f}  {extra}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n📄 Results written to {args.json_path}")
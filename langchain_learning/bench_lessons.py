@@ -0,0 +1,145 @@
+"""
+课程脚本性能基准 (对接离线 Stub Server)
+
+在本进程启动一个 stub_server，然后把 01~09 每个课程脚本作为子进程运行
+(LLM_PROVIDER=stub, STUB_API_BASE 指向同一个 server)，记录 wall-clock 与退出码。
+stub 的延迟/速率固定，所以两次运行之间的差异就是 "管线本身" 的开销变化。
+
+用法:
+    python bench_lessons.py                                  # 默认 stub_responses.json，每个脚本跑 3 次
+    python bench_lessons.py --latency-ms 0 --tokens-per-sec 0 # 去掉模拟延迟，只测框架开销
+    python bench_lessons.py --json baseline.json             # 保存结果
+    python bench_lessons.py --baseline baseline.json --tolerance 0.2  # 回归检查 (p50 变慢 >20% 则退出码 1)
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from perf_metrics import summarize
+from stub_server import StubConfig, StubServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+LESSONS = [
+    "01_model_io.py",
+    "02_lcel_chain.py",
+    "03_structured_output.py",
+    "03_structured_output_exercise.py",
+    "04_output_fixing_parser.py",
+    "05_prompt_partials.py",
+    "06_function_calling_tools.py",
+    "06b_dynamic_tool_selection.py",
+    "07_bonus_message_types.py",
+    "07_conversational_tools_memory.py",
+    "07b_hierarchical_tools.py",
+    "08_rag_basic.py",
+    "09_prompt_patterns.py",
+]
+
+
+def run_lesson(script: str, base_url: str, timeout: float):
+    env = dict(os.environ, LLM_PROVIDER="stub", STUB_API_BASE=base_url, PYTHONDONTWRITEBYTECODE="1")
+    start = time.perf_counter()
+    try:
+        proc = subprocess.run([sys.executable, script], cwd=HERE, env=env,
+                              capture_output=True, text=True, timeout=timeout)
+        returncode, stderr = proc.returncode, proc.stderr
+    except subprocess.TimeoutExpired:
+        returncode, stderr = -1, f"timeout after {timeout}s"
+    return (time.perf_counter() - start) * 1000, returncode, stderr
+
+
+def run_benchmark(lessons, server: StubServer, repeat: int, timeout: float):
+    results = {}
+    for script in lessons:
+        timings, failures, last_error = [], 0, None
+        before = server.requests
+        for _ in range(repeat):
+            ms, code, stderr = run_lesson(script, server.base_url, timeout)
+            if code == 0:
+                timings.append(ms)
+            else:
+                failures += 1
+                last_error = (stderr.strip().splitlines() or ["?"])[-1]
+        results[script] = {
+            **summarize(timings),
+            "failures": failures,
+            "requests_per_run": (server.requests - before) / repeat,
+            "error": last_error,
+        }
+    return results
+
+
+def print_report(results, baseline=None):
+    header = f"{'lesson':<36}{'p50(ms)':>10}{'p95(ms)':>10}{'req/run':>9}{'fail':>6}"
+    if baseline:
+        header += f"{'Δp50':>9}"
+    print(header)
+    print("-" * len(header))
+    for script, r in results.items():
+        line = f"{script:<36}{r['p50']:>10.0f}{r['p95']:>10.0f}{r['requests_per_run']:>9.1f}{r['failures']:>6}"
+        if baseline and script in baseline and baseline[script]["p50"]:
+            line += f"{(r['p50'] / baseline[script]['p50'] - 1) * 100:>8.1f}%"
+        print(line)
+        if r["error"]:
+            print(f"    ↳ {r['error']}")
+
+
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for script, r in results.items():
+        base = baseline.get(script)
+        if not base or not base["p50"] or not r["count"]:
+            continue
+        if r["p50"] > base["p50"] * (1 + tolerance):
+            regressions.append(script)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run every lesson against the offline stub and time it.")
+    parser.add_argument("lessons", nargs="*", default=LESSONS)
+    parser.add_argument("--config", default=os.path.join(HERE, "stub_responses.json"))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--latency-ms", type=float)
+    parser.add_argument("--tokens-per-sec", type=float)
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--json", dest="json_path", help="write results to this file")
+    parser.add_argument("--baseline", help="compare against a previous --json output")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    config = StubConfig.from_env(args.config)
+    overrides = {"latency_ms": args.latency_ms, "tokens_per_sec": args.tokens_per_sec,
+                 "error_rate": args.error_rate}
+    config.update(**{k: v for k, v in overrides.items() if v is not None})
+
+    server = StubServer(config).start()
+    print(f"🧪 Stub server at {server.base_url} "
+          f"(latency={config.latency_ms}ms, tokens/s={config.tokens_per_sec}, error_rate={config.error_rate})\n")
+    try:
+        results = run_benchmark(args.lessons, server, args.repeat, args.timeout)
+    finally:
+        server.shutdown()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n📄 Results written to {args.json_path}")
+
+    if baseline:
+        regressions = find_regressions(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ p50 regressions over {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\n✅ No regressions against baseline")
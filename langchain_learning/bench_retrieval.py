@@ -0,0 +1,165 @@
+"""
+检索质量 + 延迟基准：切分参数 × 检索器参数 扫描
+
+问题背景:
+    08_rag_basic 的 chunk_size / chunk_overlap / k 都是拍脑袋定的，改了以后答案是变好还是变差，只能凭感觉。
+
+做法:
+    - 标注集 (JSONL)：每行 {"question", "source", "passage"}，passage 是 source 文件里能回答问题的原文片段。
+      一个 chunk 覆盖了 passage 一半以上的字符，就算 "相关"。按字符区间判断，所以不受 chunk 参数影响。
+    - embedding 使用本地确定性后端 hashing_embeddings.HashingEmbeddings (字符 n-gram feature hashing)，
+      不需要网络，结果可复现；绝对分数不代表真实模型，但参数之间的相对比较有参考价值。
+    - 每个切分配置建一次索引 (rag_ingest.ingest_directory，同时构建 BM25)，统计建索引耗时；
+      然后对每种检索器 × k 跑完整个标注集，报告:
+        recall@k     问题的 passage 出现在前 k 个结果里的比例
+        MRR          第一个相关结果名次的倒数的均值 (前 k 内没有则记 0)
+        p50 / p95    单次检索延迟 (含 query embedding)
+        ctx tokens   前 k 个 chunk 拼成 {context} 的平均 token 数 (直接决定 prompt 成本)
+
+用法:
+    python bench_retrieval.py
+    python bench_retrieval.py --chunk-sizes 64,128,256 --overlaps 0,12,32 --retrievers dense,bm25,hybrid,mmr --ks 1,2,4
+    python bench_retrieval.py --splitter char --chunk-sizes 300,500,800 --overlaps 50 --json retrieval.json
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from typing import Dict, List, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from hashing_embeddings import HashingEmbeddings
+from perf_metrics import summarize
+from rag_ingest import ingest_directory
+from rag_mmr import MMRRetriever
+from rag_retrievers import BM25Index, HybridRetriever
+from rag_splitter import FastRecursiveSplitter
+from tokens import count_tokens
+
+DEFAULT_QA_PATH = os.path.join("rag_eval", "company_policy_qa.jsonl")
+RETRIEVERS = ("dense", "bm25", "hybrid", "mmr")
+
+
+def load_qa(path: str) -> List[Dict]:
+    """读取标注集，并把 passage 定位成 (source 绝对路径, start, end) 字符区间。"""
+    items = []
+    texts: Dict[str, str] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            source = os.path.abspath(item["source"])
+            if source not in texts:
+                with open(source, encoding="utf-8") as sf:
+                    texts[source] = sf.read()
+            start = texts[source].find(item["passage"])
+            if start < 0:
+                raise ValueError(f"Passage not found in {item['source']}: {item['passage'][:60]!r}")
+            items.append({**item, "span": (source, start, start + len(item["passage"]))})
+    return items
+
+
+def is_relevant(doc: Document, span: Tuple[str, int, int]) -> bool:
+    source, start, end = span
+    if os.path.abspath(doc.metadata.get("source", "")) != source:
+        return False
+    doc_start = doc.metadata.get("start_index", -1)
+    if doc_start < 0:   # 没有偏移信息无法定位，按不相关处理 (切分器需要 add_start_index=True)
+        return False
+    overlap = min(end, doc_start + len(doc.page_content)) - max(start, doc_start)
+    return overlap >= (end - start) / 2
+
+
+def make_splitter(kind: str, chunk_size: int, overlap: int):
+    if kind == "char":
+        return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap, add_start_index=True)
+    return FastRecursiveSplitter(chunk_size=chunk_size, chunk_overlap=overlap, add_start_index=True)
+
+
+def make_retriever(name: str, vectorstore, bm25: BM25Index, k: int):
+    if name == "dense":
+        return vectorstore.as_retriever(search_kwargs={"k": k}).invoke
+    if name == "bm25":
+        return lambda q: bm25.search(q, k)
+    if name == "hybrid":
+        return HybridRetriever(vector_retriever=vectorstore.as_retriever(search_kwargs={"k": max(8, k)}),
+                               bm25=bm25, k=k, fetch_k=max(8, k)).invoke
+    if name == "mmr":
+        return MMRRetriever(vectorstore=vectorstore, k=k, fetch_k=max(20, 4 * k)).invoke
+    raise ValueError(f"Unknown retriever {name!r}, expected one of {RETRIEVERS}")
+
+
+def evaluate(search, qa: List[Dict]) -> Dict:
+    hits, reciprocal_ranks, latencies, ctx_tokens = 0, [], [], []
+    for item in qa:
+        start = time.perf_counter()
+        docs = search(item["question"])
+        latencies.append(time.perf_counter() - start)
+        rank = next((i for i, d in enumerate(docs, start=1) if is_relevant(d, item["span"])), None)
+        hits += rank is not None
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+        ctx_tokens.append(count_tokens("\n\n".join(d.page_content for d in docs)))
+    return {
+        "recall": hits / len(qa),
+        "mrr": sum(reciprocal_ranks) / len(qa),
+        "latency": summarize(latencies),
+        "ctx_tokens": sum(ctx_tokens) / len(ctx_tokens),
+    }
+
+
+def ints(text: str) -> List[int]:
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep splitter / retriever parameters on a labelled QA set.")
+    parser.add_argument("--qa", default=DEFAULT_QA_PATH, help="JSONL with question / source / passage")
+    parser.add_argument("--data", default="rag_data", help="directory (or file) to index")
+    parser.add_argument("--splitter", choices=("fast-token", "char"), default="fast-token",
+                        help="fast-token: sizes in tokens; char: RecursiveCharacterTextSplitter, sizes in chars")
+    parser.add_argument("--chunk-sizes", default="64,128,256")
+    parser.add_argument("--overlaps", default="0,12")
+    parser.add_argument("--retrievers", default="dense,bm25,hybrid,mmr")
+    parser.add_argument("--ks", default="1,2,4")
+    parser.add_argument("--dim", type=int, default=384, help="local embedding dimension")
+    parser.add_argument("--json", dest="json_path", help="write results to this file")
+    args = parser.parse_args()
+
+    qa = load_qa(args.qa)
+    embeddings = HashingEmbeddings(dim=args.dim)
+    retrievers = [r.strip() for r in args.retrievers.split(",")]
+    print(f"{len(qa)} questions from {args.qa}, indexing {args.data} with {args.splitter} splitter\n")
+    header = (f"{'size':>5}{'ovl':>5}{'chunks':>7}{'build ms':>10}  {'retriever':<9}{'k':>3}"
+              f"{'recall':>8}{'MRR':>7}{'p50 ms':>8}{'p95 ms':>8}{'ctx tok':>9}")
+    print(header)
+    print("-" * len(header))
+    results = []
+    for chunk_size, overlap in itertools.product(ints(args.chunk_sizes), ints(args.overlaps)):
+        if overlap >= chunk_size:
+            continue
+        bm25 = BM25Index()
+        start = time.perf_counter()
+        vectorstore, report = ingest_directory(args.data, embeddings, make_splitter(args.splitter, chunk_size, overlap),
+                                               on_batch=bm25.add_documents)
+        bm25.finalize()
+        build_s = time.perf_counter() - start
+        for name, k in itertools.product(retrievers, ints(args.ks)):
+            r = evaluate(make_retriever(name, vectorstore, bm25, k), qa)
+            results.append({"splitter": args.splitter, "chunk_size": chunk_size, "chunk_overlap": overlap,
+                            "chunks": report.chunks, "build_s": build_s, "retriever": name, "k": k, **r})
+            print(f"{chunk_size:>5}{overlap:>5}{report.chunks:>7}{build_s * 1000:>10.1f}  {name:<9}{k:>3}"
+                  f"{r['recall']:>8.2f}{r['mrr']:>7.2f}{r['latency']['p50'] * 1000:>8.2f}"
+                  f"{r['latency']['p95'] * 1000:>8.2f}{r['ctx_tokens']:>9.0f}")
+
+    best = max(results, key=lambda r: (r["recall"], r["mrr"], -r["ctx_tokens"]))
+    print(f"\nBest (recall, then MRR, then fewest context tokens): {best['retriever']} k={best['k']} "
+          f"chunk_size={best['chunk_size']} overlap={best['chunk_overlap']} → recall={best['recall']:.2f} "
+          f"MRR={best['mrr']:.2f} ctx={best['ctx_tokens']:.0f} tokens")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n📄 Results written to {args.json_path}")
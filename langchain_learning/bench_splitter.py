@@ -0,0 +1,131 @@
+"""
+切分器基准：chunks/sec 与 chunk 大小分布
+
+对比三种切分方式在合成语料 (1MB ~ 1GB) 上的表现:
+    char-500        当前 08_rag_basic 的 RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    lc-token        同一个 RecursiveCharacterTextSplitter，但 length_function 换成 token 数
+    fast-token      rag_splitter.FastRecursiveSplitter (相同规则，基于下标 + 缓存长度)
+
+语料是中英混排的段落 (固定随机种子，可复现)，先写到临时文件，
+再用 rag_ingest.iter_segments 流式读取 —— 即使 1GB 也不会整体进内存。
+chunk 大小一律按 token 统计，并给出超出 token 预算的比例。
+
+用法:
+    python bench_splitter.py                         # 1MB,10MB
+    python bench_splitter.py --sizes 1MB,100MB,1GB --chunk-tokens 128
+    python bench_splitter.py --splitters fast-token --json splitter.json
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from perf_metrics import summarize
+from rag_ingest import iter_segments
+from rag_splitter import FastRecursiveSplitter
+from tokens import count_tokens
+
+_EN_WORDS = ("policy employee budget remote office travel flight class manager approval security laptop "
+             "password leave vacation expense receipt reimbursement contract team project deadline review "
+             "quarter engineering kotlin android python service cluster database release").split()
+_ZH_SENTENCES = ["员工每年享有十五天带薪年假。", "差旅费用需在出行后三十天内提交报销。", "所有笔记本电脑必须开启全盘加密。",
+                 "远程办公需要提前与直属经理确认。", "超过六小时的航班可以申请商务舱。", "代码合并前至少需要一位同事评审。"]
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().upper()
+    for unit, factor in (("GB", 1 << 30), ("MB", 1 << 20), ("KB", 1 << 10)):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def write_corpus(path: str, size_bytes: int, seed: int = 42):
+    """按段落写入，直到文件达到 size_bytes。"""
+    rng = random.Random(seed)
+    written = 0
+    section = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < size_bytes:
+            section += 1
+            parts = [f"{section}. Section {section}\n"]
+            for _ in range(rng.randint(2, 6)):
+                if rng.random() < 0.3:
+                    parts.append("".join(rng.choice(_ZH_SENTENCES) for _ in range(rng.randint(2, 8))))
+                else:
+                    lines = []
+                    for _ in range(rng.randint(1, 4)):
+                        words = [rng.choice(_EN_WORDS) for _ in range(rng.randint(8, 40))]
+                        lines.append(" ".join(words).capitalize() + ".")
+                    parts.append("\n".join(lines))
+            block = "\n\n".join(parts) + "\n\n"
+            f.write(block)
+            written += len(block.encode("utf-8"))
+
+
+def make_splitters(chunk_tokens: int, overlap_tokens: int):
+    return {
+        "char-500": lambda: RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50, add_start_index=True),
+        "lc-token": lambda: RecursiveCharacterTextSplitter(chunk_size=chunk_tokens, chunk_overlap=overlap_tokens,
+                                                           length_function=count_tokens, add_start_index=True),
+        "fast-token": lambda: FastRecursiveSplitter(chunk_size=chunk_tokens, chunk_overlap=overlap_tokens,
+                                                    add_start_index=True),
+    }
+
+
+def run_splitter(splitter, path: str, budget: int):
+    chunks = 0
+    split_s = 0.0
+    token_sizes = []
+    for _, segment in iter_segments(path):
+        start = time.perf_counter()
+        docs = splitter.create_documents([segment])
+        split_s += time.perf_counter() - start
+        chunks += len(docs)
+        token_sizes.extend(count_tokens(d.page_content) for d in docs)  # 统计不计入切分耗时
+    size_mb = os.path.getsize(path) / (1 << 20)
+    return {
+        "chunks": chunks,
+        "split_s": split_s,
+        "chunks_per_sec": chunks / split_s if split_s else 0.0,
+        "mb_per_sec": size_mb / split_s if split_s else 0.0,
+        "chunk_tokens": summarize(token_sizes),
+        "over_budget": sum(1 for n in token_sizes if n > budget) / len(token_sizes) if token_sizes else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare text splitters on synthetic corpora.")
+    parser.add_argument("--sizes", default="1MB,10MB", help="comma separated, e.g. 1MB,100MB,1GB")
+    parser.add_argument("--chunk-tokens", type=int, default=128)
+    parser.add_argument("--overlap-tokens", type=int, default=12)
+    parser.add_argument("--splitters", default="char-500,lc-token,fast-token")
+    parser.add_argument("--json", dest="json_path", help="write results to this file")
+    args = parser.parse_args()
+
+    factories = make_splitters(args.chunk_tokens, args.overlap_tokens)
+    names = [n.strip() for n in args.splitters.split(",")]
+    results = {}
+    header = f"{'corpus':>8} {'splitter':<11}{'chunks':>9}{'chunks/s':>11}{'MB/s':>8}{'tok p50':>9}{'tok p95':>9}{'tok max':>9}{'>budget':>9}"
+    print(header)
+    print("-" * len(header))
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_text in args.sizes.split(","):
+            path = os.path.join(tmp, f"corpus_{size_text}.txt")
+            write_corpus(path, parse_size(size_text))
+            for name in names:
+                r = run_splitter(factories[name](), path, args.chunk_tokens)
+                results[f"{size_text}/{name}"] = r
+                t = r["chunk_tokens"]
+                print(f"{size_text:>8} {name:<11}{r['chunks']:>9}{r['chunks_per_sec']:>11.0f}{r['mb_per_sec']:>8.1f}"
+                      f"{t['p50']:>9.0f}{t['p95']:>9.0f}{t['max']:>9.0f}{r['over_budget']:>9.1%}")
+            os.remove(path)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n📄 Results written to {args.json_path}")
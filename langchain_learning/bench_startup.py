@@ -0,0 +1,144 @@
+"""
+启动耗时基准 (Startup Benchmark)
+
+每个模块在一个全新的子进程里 import (避免 sys.modules 缓存互相污染)，同时开启 `-X importtime`：
+  - wall_ms:   子进程总耗时 (含解释器启动)，即 worker 冷启动能感知到的时间
+  - import_ms: 进程内 importlib.import_module() 本身的耗时
+  - top:       按 cumulative 排序最重的若干个依赖包 (来自 -X importtime)
+  - heavy:     是否在 import 阶段就加载了 provider SDK —— 懒加载生效时应为空
+
+用法:
+    python bench_startup.py                      # 默认测 helper 模块 + 课程脚本
+    python bench_startup.py utils 02_lcel_chain  # 只测指定模块
+    python bench_startup.py --repeat 5 --json startup.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_MODULES = [
+    "client_registry",
+    "providers",
+    "utils",
+    "model_factory",
+    "01_model_io",
+    "02_lcel_chain",
+    "03_structured_output",
+    "04_output_fixing_parser",
+    "05_prompt_partials",
+    "06b_dynamic_tool_selection",
+    "07_conversational_tools_memory",
+    "07b_hierarchical_tools",
+    "08_rag_basic",
+]
+
+# 这些包出现在 import 阶段，说明有人在模块顶层 eager import 了 provider SDK
+HEAVY_PACKAGES = ["langchain_openai", "openai", "langchain_google_genai", "faiss", "tiktoken"]
+
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+_PROBE = (
+    "import importlib, sys, time\n"
+    "t = time.perf_counter()\n"
+    "importlib.import_module(sys.argv[1])\n"
+    "print('__IMPORT_MS__', (time.perf_counter() - t) * 1000)\n"
+)
+
+
+def parse_importtime(stderr: str):
+    """解析 -X importtime 输出，返回 [(package, self_us, cumulative_us, depth)]"""
+    rows = []
+    for line in stderr.splitlines():
+        m = _IMPORTTIME_RE.match(line)
+        if m:
+            self_us, cum_us, indent, name = m.groups()
+            rows.append((name, int(self_us), int(cum_us), len(indent) // 2))
+    return rows
+
+
+def measure_module(module: str, top: int = 5):
+    env = dict(os.environ)
+    # 保证 import 阶段不会因为缺 key 走到奇怪的分支；也不会真的发请求
+    env.setdefault("PYTHONDONTWRITEBYTECODE", "1")
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE, module],
+        cwd=HERE, env=env, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    import_ms = None
+    for line in proc.stdout.splitlines():
+        if line.startswith("__IMPORT_MS__"):
+            import_ms = float(line.split()[1])
+
+    rows = parse_importtime(proc.stderr)
+    # 只看顶层包 (depth 最浅的那一条)，避免同一个包的子模块重复计数
+    top_level = {}
+    for name, self_us, cum_us, depth in rows:
+        root = name.split(".")[0]
+        if depth <= 1 and cum_us > top_level.get(root, 0):
+            top_level[root] = cum_us
+    heaviest = sorted(top_level.items(), key=lambda kv: kv[1], reverse=True)[:top]
+    loaded = {name.split(".")[0] for name, *_ in rows}
+
+    return {
+        "module": module,
+        "ok": proc.returncode == 0 and import_ms is not None,
+        "returncode": proc.returncode,
+        "wall_ms": wall_ms,
+        "import_ms": import_ms,
+        "top": [(name, us / 1000) for name, us in heaviest],
+        "heavy": [p for p in HEAVY_PACKAGES if p in loaded],
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode else None,
+    }
+
+
+def run_benchmark(modules, repeat: int = 3, top: int = 5):
+    results = []
+    for module in modules:
+        runs = [measure_module(module, top) for _ in range(repeat)]
+        last = runs[-1]
+        ok_runs = [r for r in runs if r["ok"]]
+        results.append({
+            **last,
+            # 取中位数，过滤掉第一次运行的磁盘缓存抖动
+            "wall_ms": statistics.median(r["wall_ms"] for r in runs),
+            "import_ms": statistics.median(r["import_ms"] for r in ok_runs) if ok_runs else None,
+        })
+    return results
+
+
+def print_report(results):
+    print(f"{'module':<34}{'wall(ms)':>10}{'import(ms)':>12}  heavy SDK at import / top packages (cumulative ms)")
+    print("-" * 110)
+    for r in results:
+        if not r["ok"]:
+            print(f"{r['module']:<34}{r['wall_ms']:>10.1f}{'FAILED':>12}  exit={r['returncode']} {r['error']}")
+            continue
+        heavy = ",".join(r["heavy"]) or "-"
+        top = ", ".join(f"{name}={ms:.0f}" for name, ms in r["top"])
+        print(f"{r['module']:<34}{r['wall_ms']:>10.1f}{r['import_ms']:>12.1f}  [{heavy}] {top}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure per-module import cost (cold start).")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--json", dest="json_path", help="write raw results to this file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.modules, repeat=args.repeat, top=args.top)
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n📄 Raw results written to {args.json_path}")
@@ -0,0 +1,195 @@
+"""
+进程级 Model Client 注册表。
+
+问题背景:
+    每次 get_model() 都 new 一个 ChatOpenAI，意味着每次请求都要重新构造 client，
+    并且底层 httpx 连接池是新的 —— 第一次请求必然付出 TCP + TLS 握手的冷启动成本。
+
+Android 类比:
+    这就是 OkHttpClient 单例 + ConnectionPool。官方建议全 App 共享一个 OkHttpClient，
+    原因完全一样：连接复用、线程池复用。这里的 registry 就是 Hilt 里 @Singleton 的那一层。
+
+用法:
+    registry = get_registry()
+    model = registry.get_or_create(ClientKey("chat", "openai", "gpt-3.5-turbo", 0.7, None), factory)
+    registry.stats()      # {"hits": .., "misses": .., ...}
+    registry.evict(provider="deepseek")
+    registry.shutdown()   # 进程退出时自动调用 (atexit)
+"""
+import atexit
+import threading
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+# 连接池参数：对 LLM API 这类 "少量 host + 长耗时请求" 的场景调优
+# - keepalive 连接数要覆盖常见并发度，避免并发请求结束后连接被关掉又重建
+# - keepalive_expiry 比服务端 idle timeout (通常 60~120s) 略短，避免复用到被对端关闭的连接
+POOL_MAX_CONNECTIONS = 64
+POOL_MAX_KEEPALIVE = 32
+POOL_KEEPALIVE_EXPIRY = 50.0
+# LLM 生成可能很慢，读超时放宽；连接超时保持较短以便快速失败
+POOL_CONNECT_TIMEOUT = 5.0
+POOL_READ_TIMEOUT = 120.0
+
+
+class ClientKey(NamedTuple):
+    """注册表的 key：同一个 key 永远拿到同一个 client 实例。"""
+    kind: str                      # "chat" / "embeddings"
+    provider: str
+    model: str
+    temperature: Optional[float]   # embeddings 没有 temperature，传 None
+    base_url: Optional[str]
+
+
+class HttpPool(NamedTuple):
+    """共享的 httpx 连接池 (同步 + 异步各一个)。"""
+    sync: Any
+    async_: Any
+
+
+class ClientRegistry:
+    """
+    线程安全的 client 缓存。
+    factory 只会在 miss 时调用，并拿到共享的 HttpPool 来构造 client。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clients: Dict[ClientKey, Any] = {}
+        self._pool: Optional[HttpPool] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ------------------------------------------
+    # 连接池
+    # ------------------------------------------
+    def http_pool(self) -> HttpPool:
+        """懒创建共享连接池 (httpx 是 openai SDK 的依赖，不需要额外安装)。"""
+        with self._lock:
+            if self._pool is None:
+                import httpx
+
+                limits = httpx.Limits(
+                    max_connections=POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=POOL_MAX_KEEPALIVE,
+                    keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+                )
+                timeout = httpx.Timeout(POOL_READ_TIMEOUT, connect=POOL_CONNECT_TIMEOUT)
+                self._pool = HttpPool(
+                    sync=httpx.Client(limits=limits, timeout=timeout),
+                    async_=httpx.AsyncClient(transport=_per_loop_transport(limits), timeout=timeout),
+                )
+            return self._pool
+
+    # ------------------------------------------
+    # Client 缓存
+    # ------------------------------------------
+    def get_or_create(self, key: ClientKey, factory: Callable[[HttpPool], Any]) -> Any:
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self.hits += 1
+                return client
+            self.misses += 1
+            client = factory(self.http_pool())
+            self._clients[key] = client
+            return client
+
+    def evict(self, kind: Optional[str] = None, provider: Optional[str] = None,
+              model: Optional[str] = None) -> int:
+        """
+        按条件淘汰缓存的 client (条件为 None 表示不限)，返回淘汰数量。
+        典型场景：轮换了 API Key / base_url 之后，需要让下次 get_model 重新构造。
+        """
+        with self._lock:
+            victims = [
+                k for k in self._clients
+                if (kind is None or k.kind == kind)
+                and (provider is None or k.provider == provider)
+                and (model is None or k.model == model)
+            ]
+            for k in victims:
+                del self._clients[k]
+            self.evictions += len(victims)
+            return len(victims)
+
+    def shutdown(self):
+        """关闭连接池并清空缓存。之后再调用 get_or_create 会重新建池。"""
+        with self._lock:
+            self.evictions += len(self._clients)
+            self._clients.clear()
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.sync.close()
+            _close_async_client(pool.async_)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._clients),
+                "evictions": self.evictions,
+                "keys": list(self._clients),
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+
+def _per_loop_transport(limits):
+    """
+    异步连接绑定在创建它的事件循环上。脚本里多次 asyncio.run() 会产生多个 loop，
+    直接共享一个 AsyncHTTPTransport 会在第二个 loop 里复用到旧 loop 的连接而报
+    "Event loop is closed"。这里按 loop 各维护一个连接池：同一个 loop 内照常 keep-alive 复用，
+    loop 被回收后对应的连接池随之释放。
+    """
+    import asyncio
+    import weakref
+
+    import httpx
+
+    class PerLoopAsyncTransport(httpx.AsyncBaseTransport):
+        def __init__(self):
+            self._transports = weakref.WeakKeyDictionary()
+
+        def _current(self):
+            loop = asyncio.get_running_loop()
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = httpx.AsyncHTTPTransport(limits=limits)
+                self._transports[loop] = transport
+            return transport
+
+        async def handle_async_request(self, request):
+            return await self._current().handle_async_request(request)
+
+        async def aclose(self):
+            transport = self._transports.pop(asyncio.get_running_loop(), None)
+            if transport is not None:
+                await transport.aclose()
+
+    return PerLoopAsyncTransport()
+
+
+def _close_async_client(client):
+    """AsyncClient.aclose() 需要事件循环；在 atexit 阶段没有运行中的 loop，这里临时起一个。"""
+    import asyncio
+
+    try:
+        asyncio.run(client.aclose())
+    except RuntimeError:
+        # 已处于运行中的事件循环 (例如 Jupyter)，交给 GC 回收即可
+        pass
+
+
+_registry = ClientRegistry()
+atexit.register(_registry.shutdown)
+
+
+def get_registry() -> ClientRegistry:
+    """进程级单例。"""
+    return _registry
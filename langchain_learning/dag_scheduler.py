@@ -0,0 +1,267 @@
+"""
+多步 assign chain 的依赖感知并行调度 (DAG)
+
+问题背景:
+    02 的 full_chain 是 `assign(explanation) | assign(code) | summary`，严格串行。
+    再加几个派生字段 (常见坑、面试题 ...)，即便它们互不依赖，总延迟也会线性增长。
+
+设计:
+    - AssignDAG({"字段名": chain, ...})：每个 step 的依赖从它的 Prompt 变量里推导
+      (prompt.input_variables ∩ 其他 step 的字段名)，推导不出来时保守地依赖前面声明的所有 step；
+      也可以用 deps= 显式指定。
+    - 调度：某个 step 的依赖全部完成就立刻启动 (不是按 "层" 整体推进)，互不依赖的 step 并发执行。
+      同步 invoke 走线程池，异步 ainvoke 走 asyncio。
+    - 批量模式 arun_many/run_many：多个 topic 同时进入 DAG，用一个全局 semaphore 限制
+      "正在执行的 step 数"，不同 topic 的 step 交错执行 (流水线)。
+    - DagTrace：每个 step 的起止时间 + 关键路径 (决定总延迟的那条依赖链)。
+
+Android 类比:
+    WorkManager 的 beginWith(listOf(a, b)).then(c)，或者 Gradle 的 task 依赖图：
+    Gradle 也是先算出 DAG，再把没有依赖关系的 task 并行跑。
+
+用法:
+    dag = AssignDAG({"explanation": explain_chain, "code": code_chain, "summary": summary_chain},
+                    output_key="summary")
+    result, trace = dag.invoke_with_trace({"topic": "LiveData"})
+    print(trace.format())
+"""
+import asyncio
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.prompts import BasePromptTemplate
+from langchain_core.runnables import Runnable, RunnableConfig
+
+
+def prompt_variables(runnable) -> Optional[List[str]]:
+    """沿着 RunnableSequence.first 找到第一个 Prompt，返回它的变量名；找不到返回 None。"""
+    node = runnable
+    for _ in range(16):
+        if isinstance(node, BasePromptTemplate):
+            return list(node.input_variables)
+        node = getattr(node, "first", None)
+        if node is None:
+            return None
+    return None
+
+
+# ==========================================
+# Trace
+# ==========================================
+
+@dataclass
+class StepSpan:
+    name: str
+    deps: Tuple[str, ...]
+    start: float = 0.0
+    end: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+@dataclass
+class DagTrace:
+    start: float = 0.0
+    end: float = 0.0
+    spans: Dict[str, StepSpan] = field(default_factory=dict)
+
+    @property
+    def wall_s(self) -> float:
+        return self.end - self.start
+
+    @property
+    def serial_s(self) -> float:
+        """如果串行执行，各 step 耗时之和 (用来对比并行收益)。"""
+        return sum(s.duration for s in self.spans.values())
+
+    def critical_path(self) -> List[str]:
+        """从最后结束的 step 往回找：每一步取 "最晚结束" 的那个依赖。"""
+        if not self.spans:
+            return []
+        node = max(self.spans.values(), key=lambda s: s.end)
+        path = [node.name]
+        while node.deps:
+            node = max((self.spans[d] for d in node.deps if d in self.spans), key=lambda s: s.end)
+            path.append(node.name)
+        return list(reversed(path))
+
+    def format(self, width: int = 40) -> str:
+        critical = set(self.critical_path())
+        scale = width / self.wall_s if self.wall_s else 0
+        lines = [f"DAG wall={self.wall_s * 1000:.0f}ms serial={self.serial_s * 1000:.0f}ms "
+                 f"critical path: {' → '.join(self.critical_path())}"]
+        for span in sorted(self.spans.values(), key=lambda s: s.start):
+            offset = int((span.start - self.start) * scale)
+            bar = "█" * max(1, int(span.duration * scale))
+            mark = "*" if span.name in critical else " "
+            lines.append(f" {mark}{span.name:<14}{' ' * offset}{bar} {span.duration * 1000:.0f}ms"
+                         + (f" ❌ {span.error}" if span.error else ""))
+        return "\n".join(lines)
+
+
+@dataclass
+class DagRun:
+    input: Any
+    output: Any = None
+    error: Optional[BaseException] = None
+    trace: Optional[DagTrace] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+# ==========================================
+# 调度器
+# ==========================================
+
+class AssignDAG(Runnable):
+    """
+    - steps:      {"字段名": Runnable}，声明顺序即 "无法推导依赖时" 的保守顺序
+    - deps:       可选，显式覆盖某些 step 的依赖 {"字段名": ["依赖字段", ...]}
+    - output_key: 只返回某个字段 (例如 "summary")；默认返回 input + 全部字段组成的 dict
+    - max_workers: 同步 invoke 时的线程数
+    """
+
+    def __init__(self, steps: Dict[str, Runnable], deps: Optional[Dict[str, Iterable[str]]] = None,
+                 output_key: Optional[str] = None, max_workers: int = 8):
+        self.steps = dict(steps)
+        self.output_key = output_key
+        self.max_workers = max_workers
+        self.deps = self._resolve_deps(deps or {})
+        self._check_acyclic()
+
+    def _resolve_deps(self, explicit: Dict[str, Iterable[str]]) -> Dict[str, Tuple[str, ...]]:
+        names = list(self.steps)
+        resolved = {}
+        for i, name in enumerate(names):
+            if name in explicit:
+                deps = tuple(explicit[name])
+            else:
+                variables = prompt_variables(self.steps[name])
+                deps = tuple(v for v in variables if v in self.steps) if variables is not None else tuple(names[:i])
+            unknown = [d for d in deps if d not in self.steps]
+            if unknown:
+                raise ValueError(f"Step '{name}' depends on unknown steps: {unknown}")
+            resolved[name] = deps
+        return resolved
+
+    def _check_acyclic(self):
+        state: Dict[str, int] = {}  # 1 = 访问中, 2 = 已完成
+
+        def visit(name, stack):
+            if state.get(name) == 2:
+                return
+            if state.get(name) == 1:
+                raise ValueError(f"Dependency cycle: {' → '.join(stack + [name])}")
+            state[name] = 1
+            for dep in self.deps[name]:
+                visit(dep, stack + [name])
+            state[name] = 2
+
+        for name in self.steps:
+            visit(name, [])
+
+    def _finish(self, input, values):
+        if self.output_key is not None:
+            return values[self.output_key]
+        return {**input, **values}
+
+    # ------------------------------------------
+    # 同步：线程池
+    # ------------------------------------------
+    def invoke_with_trace(self, input: Dict[str, Any], config: Optional[RunnableConfig] = None):
+        trace = DagTrace(start=time.perf_counter())
+        values: Dict[str, Any] = {}
+        remaining = dict(self.deps)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dag") as pool:
+            while remaining or running:
+                for name in [n for n, deps in remaining.items() if all(d in values for d in deps)]:
+                    del remaining[name]
+                    span = trace.spans[name] = StepSpan(name, self.deps[name], start=time.perf_counter())
+                    running[pool.submit(self.steps[name].invoke, {**input, **values}, config)] = span
+                if not running:
+                    raise ValueError(f"Steps can never run: {list(remaining)}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    span = running.pop(future)
+                    span.end = time.perf_counter()
+                    if future.exception() is not None:
+                        span.error = repr(future.exception())
+                        for other in running:
+                            other.cancel()
+                        raise future.exception()
+                    values[span.name] = future.result()
+        trace.end = time.perf_counter()
+        return self._finish(input, values), trace
+
+    def invoke(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        return self.invoke_with_trace(input, config)[0]
+
+    # ------------------------------------------
+    # 异步：asyncio
+    # ------------------------------------------
+    async def ainvoke_with_trace(self, input: Dict[str, Any], config: Optional[RunnableConfig] = None,
+                                 semaphore: Optional[asyncio.Semaphore] = None):
+        trace = DagTrace(start=time.perf_counter())
+        values: Dict[str, Any] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_step(name):
+            if self.deps[name]:
+                await asyncio.gather(*(tasks[d] for d in self.deps[name]))
+            span = trace.spans[name] = StepSpan(name, self.deps[name])
+            if semaphore is not None:
+                await semaphore.acquire()
+            try:
+                span.start = time.perf_counter()
+                values[name] = await self.steps[name].ainvoke({**input, **values}, config)
+            except Exception as e:
+                span.error = repr(e)
+                raise
+            finally:
+                span.end = time.perf_counter()
+                if semaphore is not None:
+                    semaphore.release()
+
+        for name in self.steps:
+            tasks[name] = asyncio.ensure_future(run_step(name))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        trace.end = time.perf_counter()
+        return self._finish(input, values), trace
+
+    async def ainvoke(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        return (await self.ainvoke_with_trace(input, config))[0]
+
+    # ------------------------------------------
+    # 批量 (流水线)
+    # ------------------------------------------
+    async def arun_many(self, inputs: List[Dict[str, Any]], max_concurrency: int = 8,
+                        config: Optional[RunnableConfig] = None) -> List[DagRun]:
+        """所有输入同时进入 DAG；max_concurrency 限制的是全局同时执行的 step 数。单条失败互不影响。"""
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run_one(item):
+            run = DagRun(input=item)
+            try:
+                run.output, run.trace = await self.ainvoke_with_trace(item, config, semaphore)
+            except Exception as e:
+                run.error = e
+            return run
+
+        return list(await asyncio.gather(*(run_one(item) for item in inputs)))
+
+    def run_many(self, inputs: List[Dict[str, Any]], max_concurrency: int = 8, config=None) -> List[DagRun]:
+        """同步入口。已经在事件循环里时请直接 await arun_many。"""
+        return asyncio.run(self.arun_many(inputs, max_concurrency, config))
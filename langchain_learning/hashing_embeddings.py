@@ -0,0 +1,127 @@
+"""
+本地 NumPy 哈希 embedding (离线、确定性、无需 API key)
+
+问题背景:
+    get_embeddings_model 最终总是落到 OpenAIEmbeddings(text-embedding-3-small) —— "deepseek" 分支也一样。
+    每次 ingest、测试、基准都要联网并按 token 付费；stub provider 虽然离线，但仍要起一个 HTTP 服务，
+    逐条在 Python 里算 hash，几千个 chunk 就要好几秒。
+
+设计:
+    - 字符 n-gram (默认 2~4) 做 feature hashing: 每个 n-gram 哈希到 dim 个桶之一，符号位决定 +1/-1
+      (signed hashing，桶冲突的期望贡献为 0)；计数做 sign·log1p 压缩后 L2 归一化。
+      字符 n-gram 对中文 (没有空格) 和英文都适用，也能容忍拼写变化。
+    - 整个 batch 一起向量化:
+        文本 → UTF-32 码点数组拼接 → 每种 n 一次性算出所有位置的 64 位哈希 (FNV 风格乘法 + 位混合)
+        → 去掉跨文本边界的 n-gram → 一次 np.bincount 同时得到 (文本, 桶) 的计数矩阵。
+      没有逐字符的 Python 循环；单核每秒可处理上万个 chunk (python hashing_embeddings.py 查看基准)。
+    - 哈希只依赖码点，不依赖 Python 的 hash() 随机种子：跨进程、跨机器结果一致，可以放心持久化。
+    - 通过 providers.py 注册为 "hashing"：EMBEDDINGS_PROVIDER=hashing 即可让 08_rag_basic、
+      bench_retrieval、06b 的工具检索全部离线运行；维度由 HASHING_EMBEDDING_DIM 配置 (默认 384)。
+
+Android 类比:
+    端侧的轻量模型 (如 TFLite 小模型) 代替云端 API：效果不如大模型，但零延迟、零费用、离线可用，适合开发和测试。
+
+用法:
+    embeddings = HashingEmbeddings(dim=384)
+    vectors = embeddings.embed_documents(["home office budget", "差旅报销"])
+"""
+import os
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_DIM = int(os.getenv("HASHING_EMBEDDING_DIM", "384"))
+DEFAULT_NGRAM_RANGE = (2, 4)
+
+_FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+_FNV_PRIME = np.uint64(0x100000001B3)
+_MIX = np.uint64(0xFF51AFD7ED558CCD)
+
+
+def ngram_hashes(codes: np.ndarray, n: int) -> np.ndarray:
+    """codes 中每个起始位置的 n-gram 的 64 位哈希 (长度 len(codes) - n + 1)。"""
+    count = len(codes) - n + 1
+    h = np.full(count, _FNV_OFFSET ^ np.uint64(n), dtype=np.uint64)
+    for j in range(n):
+        h ^= codes[j:j + count]
+        h *= _FNV_PRIME
+    # 末尾再做一次位混合 (murmur3 fmix)，让低位也充分依赖所有字符
+    h ^= h >> np.uint64(33)
+    h *= _MIX
+    h ^= h >> np.uint64(33)
+    return h
+
+
+class HashingEmbeddings(Embeddings):
+    def __init__(self, dim: int = DEFAULT_DIM, ngram_range: Tuple[int, int] = DEFAULT_NGRAM_RANGE,
+                 lowercase: bool = True):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.lowercase = lowercase
+        # embedding_model_id 读取 model / dimensions：参数不同的向量不会在 CachedEmbeddings 里混用
+        self.model = f"hashing-char{ngram_range[0]}-{ngram_range[1]}"
+        self.dimensions = dim
+
+    def embed_batch(self, texts: Sequence[str]) -> np.ndarray:
+        """(len(texts), dim) 的 float32 矩阵，每行 L2 归一化。"""
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        # 每个文本前后补一个空格，词首词尾的 n-gram 也有区分度
+        padded = [f" {t.lower() if self.lowercase else t} " for t in texts]
+        codes = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        lengths = np.fromiter((len(p) for p in padded), dtype=np.int64, count=len(padded))
+        doc_of = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+
+        rows, weights = [], []
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            if len(codes) < n:
+                continue
+            h = ngram_hashes(codes, n)
+            start_doc = doc_of[:len(h)]
+            valid = start_doc == doc_of[n - 1:]                  # 不跨越文本边界
+            h, start_doc = h[valid], start_doc[valid]
+            rows.append(start_doc * self.dim + (h % np.uint64(self.dim)).astype(np.int64))
+            weights.append(np.where(h >> np.uint64(63), 1.0, -1.0))
+        counts = np.bincount(np.concatenate(rows), weights=np.concatenate(weights),
+                             minlength=len(texts) * self.dim).reshape(len(texts), self.dim)
+        vectors = (np.sign(counts) * np.log1p(np.abs(counts))).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_batch(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_batch([text])[0].tolist()
+
+
+if __name__ == "__main__":
+    # 吞吐基准：python hashing_embeddings.py [chunk 数，默认 10000]
+    import random
+    import sys
+    import time
+
+    from stub_server import hash_embedding
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rng = random.Random(0)
+    words = ("policy employee budget remote office travel flight class manager approval security laptop "
+             "password leave vacation expense receipt 员工 年假 报销 差旅 加密 评审").split()
+    chunks = [" ".join(rng.choice(words) for _ in range(rng.randint(60, 100))) for _ in range(n)]
+    avg_chars = sum(map(len, chunks)) / n
+
+    embeddings = HashingEmbeddings()
+    start = time.perf_counter()
+    for lo in range(0, n, 256):
+        embeddings.embed_batch(chunks[lo:lo + 256])
+    elapsed = time.perf_counter() - start
+    print(f"HashingEmbeddings(dim={embeddings.dim}): {n:,} chunks (~{avg_chars:.0f} chars) in {elapsed:.2f}s "
+          f"→ {n / elapsed:,.0f} chunks/s")
+
+    sample = chunks[:1000]
+    start = time.perf_counter()
+    for text in sample:
+        hash_embedding(text, 256)
+    elapsed = time.perf_counter() - start
+    print(f"stub_server.hash_embedding (pure Python): {len(sample) / elapsed:,.0f} chunks/s")
@@ -0,0 +1,213 @@
+"""
+跨 Provider 的 Hedged Requests (对冲请求)
+
+问题背景:
+    get_model 根据 DEEPSEEK_API_KEY 选定一个 provider 后就一直用它。
+    一旦该 provider 的长尾延迟飙升，所有 chain 都会被拖住。
+
+思路 (The Tail at Scale, Dean & Barroso):
+    先只发给 primary；如果 primary 在 "自己历史延迟的 pXX" 之内还没回来，
+    再把同一个请求发给 secondary，谁先回来用谁，另一个取消掉。
+    因为只有落在尾部的那一小部分请求会被对冲，额外成本大约是 (100 - XX)%。
+
+Android 类比:
+    类似 OkHttp 的 Happy Eyeballs (IPv6/IPv4 竞速)：先连一个，超过阈值还没连上就并行连另一个，
+    先成功的胜出，另一个取消。
+
+用法:
+    model = get_hedged_model("deepseek", "openai", percentile=95)
+    chain = prompt | model | StrOutputParser()
+    model.stats.snapshot()   # hedge_rate / secondary_win_rate ...
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from perf_metrics import percentile
+
+# 同步 invoke 的竞速线程池 (所有 HedgedModel 共享)
+_EXECUTOR = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+
+
+class HedgeStats:
+    """线程安全的对冲统计 + primary 延迟滑动窗口 (用于计算对冲阈值)。"""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._primary_latencies = deque(maxlen=window)
+        self.requests = 0
+        self.hedged = 0
+        self.primary_wins = 0
+        self.secondary_wins = 0
+        self.failures = 0
+
+    def record_primary_latency(self, seconds: float):
+        with self._lock:
+            self._primary_latencies.append(seconds)
+
+    def primary_latencies(self):
+        with self._lock:
+            return list(self._primary_latencies)
+
+    def incr(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "hedge_rate": self.hedged / self.requests if self.requests else 0.0,
+                "primary_wins": self.primary_wins,
+                "secondary_wins": self.secondary_wins,
+                # 被对冲的请求里 secondary 先返回的比例：越高说明 primary 的尾部越差
+                "secondary_win_rate": self.secondary_wins / self.hedged if self.hedged else 0.0,
+                "failures": self.failures,
+            }
+
+
+class HedgedModel(Runnable):
+    """
+    包装两个 chat model 的 Runnable。
+    - percentile:      对冲阈值取 primary 历史延迟的第几百分位
+    - min_samples:     样本不足时使用 initial_delay_s 作为阈值
+    - primary 在阈值之前就失败时，立即改发 secondary (fail-over)
+    """
+
+    def __init__(self, primary, secondary, percentile: float = 95, min_samples: int = 20,
+                 initial_delay_s: float = 2.0, stats: Optional[HedgeStats] = None):
+        self.primary = primary
+        self.secondary = secondary
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay_s = initial_delay_s
+        self.stats = stats or HedgeStats()
+
+    def hedge_delay(self) -> float:
+        samples = self.stats.primary_latencies()
+        if len(samples) < self.min_samples:
+            return self.initial_delay_s
+        return percentile(samples, self.percentile)
+
+    def bind_tools(self, *args, **kwargs):
+        # 两边各自绑定工具，共享同一份统计与延迟窗口
+        return HedgedModel(self.primary.bind_tools(*args, **kwargs),
+                           self.secondary.bind_tools(*args, **kwargs),
+                           self.percentile, self.min_samples, self.initial_delay_s, self.stats)
+
+    async def ainvoke(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        self.stats.incr("requests")
+        start = time.perf_counter()
+        primary = asyncio.create_task(self.primary.ainvoke(input, config, **kwargs))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay())
+
+        if done and primary.exception() is None:
+            self.stats.record_primary_latency(time.perf_counter() - start)
+            self.stats.incr("primary_wins")
+            return primary.result()
+
+        # primary 超过阈值未返回 (或已失败) → 对冲到 secondary
+        self.stats.incr("hedged")
+        secondary = asyncio.create_task(self.secondary.ainvoke(input, config, **kwargs))
+        pending = {secondary} if done else {primary, secondary}
+        last_error: Optional[BaseException] = primary.exception() if done else None
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    last_error = task.exception()
+                    continue
+                # 必须在 cancel() 之前判断：Task 要等下一次调度处理完 CancelledError 才算 cancelled()
+                if task is primary or not primary.done():
+                    # secondary 胜出时 primary 仍未返回：记录一个下界样本，
+                    # 避免窗口只剩 "快" 样本而把阈值压得过低
+                    self.stats.record_primary_latency(time.perf_counter() - start)
+                for loser in pending:
+                    loser.cancel()
+                self.stats.incr("primary_wins" if task is primary else "secondary_wins")
+                return task.result()
+
+        self.stats.incr("failures")
+        assert last_error is not None
+        raise last_error
+
+    def invoke(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        """
+        同步版本：用线程池竞速。线程无法被强制中断，所以 loser 只是被 "放弃"
+        (它的 HTTP 请求会在后台跑完，结果丢弃)；需要真正取消 loser 时请走 ainvoke。
+        """
+        self.stats.incr("requests")
+        start = time.perf_counter()
+        primary = _EXECUTOR.submit(self.primary.invoke, input, config, **kwargs)
+        done, _ = wait({primary}, timeout=self.hedge_delay())
+
+        if done and primary.exception() is None:
+            self.stats.record_primary_latency(time.perf_counter() - start)
+            self.stats.incr("primary_wins")
+            return primary.result()
+
+        self.stats.incr("hedged")
+        secondary = _EXECUTOR.submit(self.secondary.invoke, input, config, **kwargs)
+        pending = {secondary} if done else {primary, secondary}
+        last_error: Optional[BaseException] = primary.exception() if done else None
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    last_error = future.exception()
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                if future is primary or not primary.done():
+                    # secondary 胜出时 primary 仍未返回：记录一个下界样本
+                    self.stats.record_primary_latency(time.perf_counter() - start)
+                self.stats.incr("primary_wins" if future is primary else "secondary_wins")
+                return future.result()
+
+        self.stats.incr("failures")
+        assert last_error is not None
+        raise last_error
+
+
+def get_hedged_model(primary: str = "deepseek", secondary: str = "openai", temperature: float = 0.7,
+                     percentile: float = 95, min_samples: int = 20, initial_delay_s: float = 2.0) -> HedgedModel:
+    """基于 utils.get_model 构造对冲 model (两个底层 client 都来自 client_registry)。"""
+    from utils import get_model
+
+    if primary == secondary:
+        raise ValueError(f"primary and secondary must be different providers, got {primary!r} twice")
+    return HedgedModel(get_model(primary, temperature), get_model(secondary, temperature),
+                       percentile=percentile, min_samples=min_samples, initial_delay_s=initial_delay_s)
+
+
+if __name__ == "__main__":
+    # 离线演示：primary 是一个偶尔 "卡顿" 的 stub (jitter 很大)，secondary 是稳定的 stub
+    from langchain_openai import ChatOpenAI
+
+    from stub_server import StubConfig, StubServer
+
+    slow = StubServer(StubConfig(latency_ms=50, jitter_ms=800, seed=7)).start()
+    fast = StubServer(StubConfig(latency_ms=120)).start()
+    model = HedgedModel(
+        ChatOpenAI(model="stub-chat", api_key="stub", base_url=slow.base_url),
+        ChatOpenAI(model="stub-chat", api_key="stub", base_url=fast.base_url),
+        percentile=80, min_samples=10, initial_delay_s=0.5,
+    )
+    latencies = []
+    for i in range(60):
+        t = time.perf_counter()
+        model.invoke(f"问题 {i}")
+        latencies.append(time.perf_counter() - t)
+    print(f"p50={percentile(latencies, 50) * 1000:.0f}ms p95={percentile(latencies, 95) * 1000:.0f}ms "
+          f"hedge_delay={model.hedge_delay() * 1000:.0f}ms")
+    print(model.stats.snapshot())
+    slow.shutdown()
+    fast.shutdown()
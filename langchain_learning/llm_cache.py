@@ -0,0 +1,196 @@
+"""
+持久化的确定性 LLM 响应缓存 (SQLite)
+
+问题背景:
+    08_rag_basic / 09_prompt_patterns 用 temperature=0 调模型，同样的 Prompt 每次运行都重新付费、重新等待。
+    temperature=0 时输出 (近似) 确定，完全可以按请求内容缓存。
+
+设计:
+    - 实现 langchain_core 的 BaseCache 接口，挂到 chat model 的 `cache` 字段上即可生效，
+      对 chain 透明 (LangChain 在 model.generate 内部先 lookup、未命中再请求并 update)。
+    - key = sha256(canonical(llm_string) + canonical(messages))
+      llm_string 已包含 model、temperature、bind_tools 绑定的 tools 以及其他调用参数；
+      messages 序列化后去掉每次运行都会变化的 message id。
+    - 淘汰策略: max_age_s (过期即删) + max_entries / max_bytes (超出后按最近访问时间 LRU 淘汰)
+    - 指标: hits / misses / writes / evictions / expired / bypassed
+    - 旁路: cache.bypass = True 或环境变量 LLM_CACHE_BYPASS=1 (既不读也不写)
+
+Android 类比:
+    OkHttp 的 Cache (DiskLruCache)：按请求生成 key，磁盘 LRU + max-age。
+
+用法:
+    llm = get_model("deepseek", temperature=0, cache=True)   # 使用默认的共享缓存文件
+    llm = get_model("deepseek", temperature=0, cache=SQLiteResponseCache("/tmp/x.sqlite"))
+    get_response_cache().stats()
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import warnings
+from typing import Any, Dict, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "llm_responses.sqlite")
+
+
+def _canonical(obj: Any, parent_key: Optional[str] = None) -> Any:
+    """递归排序 key，并去掉消息上的运行时 id (例如 AIMessage 的 "run-xxx")，保证同样的内容得到同样的 key。"""
+    if isinstance(obj, dict):
+        return {
+            k: _canonical(v, k) for k, v in sorted(obj.items())
+            if not (parent_key == "kwargs" and k == "id" and isinstance(v, str))
+        }
+    if isinstance(obj, list):
+        return [_canonical(v, parent_key) for v in obj]
+    return obj
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    try:
+        prompt = json.dumps(_canonical(json.loads(prompt)), sort_keys=True, ensure_ascii=False)
+    except ValueError:
+        pass  # 非 JSON 的 prompt (纯文本 LLM) 原样参与 hash
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+class SQLiteResponseCache(BaseCache):
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 10_000,
+                 max_bytes: int = 256 * 1024 * 1024, max_age_s: Optional[float] = 7 * 24 * 3600,
+                 bypass: bool = False):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.bypass = bypass
+        self.hits = self.misses = self.writes = self.evictions = self.expired = self.bypassed = 0
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+        self._conn.commit()
+
+    def _bypassed(self) -> bool:
+        if self.bypass or os.getenv("LLM_CACHE_BYPASS") == "1":
+            self.bypassed += 1
+            return True
+        return False
+
+    # ------------------------------------------
+    # BaseCache 接口
+    # ------------------------------------------
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if self._bypassed():
+            return None
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if self.max_age_s is not None and now - created_at > self.max_age_s:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # loads 处于 beta，反序列化的是我们自己写入的数据
+            return [loads(item) for item in json.loads(value)]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if self._bypassed():
+            return
+        key = cache_key(prompt, llm_string)
+        value = json.dumps([dumps(gen) for gen in return_val], ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            self.writes += 1
+            self._evict_locked(now)
+            self._conn.commit()
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    # ------------------------------------------
+    # 淘汰与统计
+    # ------------------------------------------
+    def _evict_locked(self, now: float):
+        if self.max_age_s is not None:
+            cur = self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age_s,))
+            self.expired += cur.rowcount
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # 按最近访问时间从旧到新删除，直到同时满足条数与字节上限
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "bypassed": self.bypassed,
+            "entries": count,
+            "bytes": total,
+        }
+
+
+_default_cache: Optional[SQLiteResponseCache] = None
+_default_lock = threading.Lock()
+
+
+def get_response_cache() -> SQLiteResponseCache:
+    """进程级默认缓存，路径可用环境变量 LLM_CACHE_PATH 覆盖。"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = SQLiteResponseCache(os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH))
+        return _default_cache
+
+
+def with_response_cache(model, cache=True):
+    """
+    给 get_model 返回的 chat model 挂上响应缓存。
+    model_copy 是浅拷贝，底层 HTTP client 与连接池仍然共享 (client_registry 中的实例不受影响)。
+    """
+    if cache is True:
+        cache = get_response_cache()
+    temperature = getattr(model, "temperature", None)
+    if temperature not in (0, 0.0, None):
+        raise ValueError(f"Response cache is only for deterministic (temperature=0) models, got {temperature}")
+    return model.model_copy(update={"cache": cache})
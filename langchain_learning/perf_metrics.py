@@ -0,0 +1,29 @@
+"""
+性能统计的小工具：百分位、延迟汇总。
+各个基准脚本 / 运行时统计 (batch、hedging、telemetry...) 共用，保证口径一致。
+"""
+import math
+from typing import Dict, Iterable, List
+
+
+def percentile(values: Iterable[float], p: float) -> float:
+    """最近秩 (nearest-rank) 百分位，p 取 0~100。空序列返回 0.0。"""
+    data = sorted(values)
+    if not data:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(data)))
+    return data[min(rank, len(data)) - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """常用的延迟汇总：count / mean / p50 / p95 / p99 / max。"""
+    if not values:
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
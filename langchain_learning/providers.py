@@ -0,0 +1,293 @@
+"""
+懒加载的 Provider 注册表。
+
+问题背景:
+    原先 utils.py / model_factory.py 在 import 时就 import langchain_openai、探测 langchain_google_genai，
+    各课程脚本还在模块顶层直接构造 model。worker 冷启动时，这些成本全部压在 import 阶段，
+    哪怕本次根本用不到这个 provider。
+
+设计:
+    - 每个 provider 注册一个 builder 函数，backend 的 import 与 client 构造都写在函数体内，
+      第一次 get_chat_model("xxx") 时才真正发生 (类似 Android 的 by lazy / Dagger 的 Lazy<T>)。
+    - 构造出的实例交给 client_registry 缓存，后续调用直接命中。
+    - LazyModel: 一个 Runnable 代理，允许脚本在模块顶层照常写 `prompt | model | parser`，
+      但直到第一次 invoke/stream 才解析出真实 model。import 阶段零网络、零构造。
+
+新增 provider:
+    @register_chat_provider("my_provider")
+    def _my_chat(temperature):
+        from my_sdk import MyChat          # 在函数内 import
+        return MyChat(temperature=temperature)
+"""
+import os
+from typing import Any, Callable, Dict, Iterator, AsyncIterator, Optional, Tuple
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from client_registry import ClientKey, get_registry
+
+_chat_providers: Dict[str, Callable[[float], Any]] = {}
+_embedding_providers: Dict[str, Callable[[], Any]] = {}
+
+
+def register_chat_provider(name: str):
+    def decorator(fn: Callable[[float], Any]):
+        _chat_providers[name] = fn
+        return fn
+    return decorator
+
+
+def register_embedding_provider(name: str):
+    def decorator(fn: Callable[[], Any]):
+        _embedding_providers[name] = fn
+        return fn
+    return decorator
+
+
+def chat_providers():
+    return list(_chat_providers)
+
+
+def embedding_providers():
+    return list(_embedding_providers)
+
+
+def default_chat_provider() -> str:
+    """调用方没有显式指定 provider 时使用: LLM_PROVIDER 环境变量 > (配置了 DEEPSEEK_API_KEY 时) deepseek > openai。"""
+    return os.getenv("LLM_PROVIDER") or ("deepseek" if os.getenv("DEEPSEEK_API_KEY") else "openai")
+
+
+def default_embeddings_provider() -> str:
+    """调用方没有显式指定 provider 时使用: EMBEDDINGS_PROVIDER > LLM_PROVIDER > openai。"""
+    return os.getenv("EMBEDDINGS_PROVIDER") or os.getenv("LLM_PROVIDER") or "openai"
+
+
+def get_chat_model(provider: str = "openai", temperature: float = 0.7):
+    builder = _chat_providers.get(provider)
+    if builder is None:
+        raise ValueError(f"Unknown provider: {provider}")
+    return builder(temperature)
+
+
+def get_cached_chat_model(provider: str = "openai", temperature: float = 0.0, cache=True):
+    """get_chat_model + 持久化响应缓存 (llm_cache.py)，只在真正使用时才 import。"""
+    from llm_cache import with_response_cache
+    return with_response_cache(get_chat_model(provider, temperature), cache)
+
+
+def get_embeddings(provider: str = "openai"):
+    builder = _embedding_providers.get(provider)
+    if builder is None:
+        raise ValueError(f"Unknown provider: {provider}")
+    return builder()
+
+
+# ==========================================
+# Chat Providers
+# ==========================================
+
+@register_chat_provider("openai")
+def _openai_chat(temperature):
+    def build(pool):
+        from langchain_openai import ChatOpenAI
+        print(f"🔄 正在初始化 OpenAI Model (temp={temperature})...")
+        return ChatOpenAI(
+            model="gpt-3.5-turbo",
+            temperature=temperature,
+            http_client=pool.sync,
+            http_async_client=pool.async_
+        )
+    key = ClientKey("chat", "openai", "gpt-3.5-turbo", temperature, os.getenv("OPENAI_API_BASE"))
+    return get_registry().get_or_create(key, build)
+
+
+@register_chat_provider("deepseek")
+def _deepseek_chat(temperature):
+    def build(pool):
+        from langchain_openai import ChatOpenAI
+        print(f"🔄 正在初始化 DeepSeek Model (via OpenAI Protocol, temp={temperature})...")
+        # DeepSeek 兼容 OpenAI 协议，只需要修改 base_url 和 api_key
+        return ChatOpenAI(
+            model="deepseek-chat",
+            openai_api_key=os.getenv("DEEPSEEK_API_KEY"),
+            openai_api_base=os.getenv("DEEPSEEK_API_BASE"),
+            temperature=temperature,
+            http_client=pool.sync,
+            http_async_client=pool.async_
+        )
+    key = ClientKey("chat", "deepseek", "deepseek-chat", temperature, os.getenv("DEEPSEEK_API_BASE"))
+    return get_registry().get_or_create(key, build)
+
+
+@register_chat_provider("google")
+def _google_chat(temperature):
+    def build(pool):
+        try:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+        except ImportError:
+            raise ImportError("Please install langchain-google-genai to use Google models.")
+        if not os.getenv("GOOGLE_API_KEY"):
+            raise ValueError("请在 .env 中配置 GOOGLE_API_KEY")
+        print(f"🔄 正在初始化 Google Gemini Model (temp={temperature})...")
+        # Gemini SDK 自带 transport，不使用 httpx 连接池，只做实例复用
+        return ChatGoogleGenerativeAI(
+            model="gemini-pro",
+            temperature=temperature
+        )
+    key = ClientKey("chat", "google", "gemini-pro", temperature, None)
+    return get_registry().get_or_create(key, build)
+
+
+@register_chat_provider("stub")
+def _stub_chat(temperature):
+    """离线 OpenAI 协议 stub (见 stub_server.py)，用于 CI 与可复现的性能测量。"""
+    from stub_server import ensure_stub_server
+    base_url = ensure_stub_server()
+
+    def build(pool):
+        from langchain_openai import ChatOpenAI
+        print(f"🧪 正在初始化 Stub Model ({base_url}, temp={temperature})...")
+        return ChatOpenAI(
+            model="stub-chat",
+            openai_api_key="stub",
+            openai_api_base=base_url,
+            temperature=temperature,
+            http_client=pool.sync,
+            http_async_client=pool.async_
+        )
+    key = ClientKey("chat", "stub", "stub-chat", temperature, base_url)
+    return get_registry().get_or_create(key, build)
+
+
+# ==========================================
+# Embedding Providers
+# ==========================================
+
+@register_embedding_provider("openai")
+def _openai_embeddings():
+    def build(pool):
+        from langchain_openai import OpenAIEmbeddings
+        print("🔄 正在初始化 OpenAI Embeddings...")
+        return OpenAIEmbeddings(
+            model="text-embedding-3-small",
+            http_client=pool.sync,
+            http_async_client=pool.async_
+        )
+    key = ClientKey("embeddings", "openai", "text-embedding-3-small", None, os.getenv("OPENAI_API_BASE"))
+    return get_registry().get_or_create(key, build)
+
+
+@register_embedding_provider("deepseek")
+def _deepseek_embeddings():
+    # DeepSeek 暂时没有官方的 Embeddings 接口，回退使用 OpenAI Embeddings
+    print("⚠️ DeepSeek 暂无专用 Embeddings，回退使用 OpenAI Embeddings...")
+    return _openai_embeddings()
+
+
+@register_embedding_provider("google")
+def _google_embeddings():
+    def build(pool):
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        print("🔄 正在初始化 Google Embeddings...")
+        return GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+    key = ClientKey("embeddings", "google", "models/embedding-001", None, None)
+    return get_registry().get_or_create(key, build)
+
+
+@register_embedding_provider("stub")
+def _stub_embeddings():
+    from stub_server import ensure_stub_server
+    base_url = ensure_stub_server()
+
+    def build(pool):
+        from langchain_openai import OpenAIEmbeddings
+        print(f"🧪 正在初始化 Stub Embeddings ({base_url})...")
+        return OpenAIEmbeddings(
+            model="stub-embedding",
+            openai_api_key="stub",
+            openai_api_base=base_url,
+            # 直接发送原文，不做 tiktoken 分词 (离线环境下 tiktoken 也可能无法下载词表)
+            check_embedding_ctx_length=False,
+            http_client=pool.sync,
+            http_async_client=pool.async_
+        )
+    key = ClientKey("embeddings", "stub", "stub-embedding", None, base_url)
+    return get_registry().get_or_create(key, build)
+
+
+@register_embedding_provider("hashing")
+def _hashing_embeddings():
+    """本地 NumPy 特征哈希 embedding (hashing_embeddings.py)：离线、确定性、不需要 API key。"""
+    from hashing_embeddings import DEFAULT_DIM
+
+    def build(pool):
+        from hashing_embeddings import HashingEmbeddings
+        print(f"🧮 正在初始化 Hashing Embeddings (local, dim={DEFAULT_DIM})...")
+        return HashingEmbeddings(dim=DEFAULT_DIM)
+    key = ClientKey("embeddings", "hashing", f"hashing-{DEFAULT_DIM}", None, None)
+    return get_registry().get_or_create(key, build)
+
+
+# ==========================================
+# LazyModel: 延迟到第一次调用才解析的 Model 代理
+# ==========================================
+
+class LazyModel(Runnable):
+    """
+    Model 的懒代理。bind_tools / with_structured_output 等配置会被记录下来，
+    在解析真实 model 之后按顺序回放。解析结果缓存在实例上。
+    """
+
+    def __init__(self, provider: str, temperature: float = 0.7,
+                 resolver: Optional[Callable[[str, float], Any]] = None,
+                 binds: Tuple[Tuple[str, tuple, dict], ...] = ()):
+        self.provider = provider
+        self.temperature = temperature
+        self._resolver = resolver or get_chat_model
+        self._binds = binds
+        self._resolved = None
+
+    def resolve(self):
+        if self._resolved is None:
+            model = self._resolver(self.provider, self.temperature)
+            for method, args, kwargs in self._binds:
+                model = getattr(model, method)(*args, **kwargs)
+            self._resolved = model
+        return self._resolved
+
+    def _with_bind(self, method, args, kwargs):
+        return LazyModel(self.provider, self.temperature, self._resolver,
+                         self._binds + ((method, args, kwargs),))
+
+    def bind_tools(self, *args, **kwargs):
+        return self._with_bind("bind_tools", args, kwargs)
+
+    def with_structured_output(self, *args, **kwargs):
+        return self._with_bind("with_structured_output", args, kwargs)
+
+    def bind(self, **kwargs):
+        return self._with_bind("bind", (), kwargs)
+
+    # --- Runnable 协议：全部委托给真实 model ---
+    def invoke(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        return self.resolve().invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        return await self.resolve().ainvoke(input, config, **kwargs)
+
+    def stream(self, input, config: Optional[RunnableConfig] = None, **kwargs) -> Iterator:
+        yield from self.resolve().stream(input, config, **kwargs)
+
+    async def astream(self, input, config: Optional[RunnableConfig] = None, **kwargs) -> AsyncIterator:
+        async for chunk in self.resolve().astream(input, config, **kwargs):
+            yield chunk
+
+    def batch(self, inputs, config=None, **kwargs):
+        return self.resolve().batch(inputs, config, **kwargs)
+
+    async def abatch(self, inputs, config=None, **kwargs):
+        return await self.resolve().abatch(inputs, config, **kwargs)
+
+    def __repr__(self):
+        state = "resolved" if self._resolved is not None else "pending"
+        return f"LazyModel(provider={self.provider!r}, temperature={self.temperature}, {state})"
@@ -0,0 +1,207 @@
+"""
+近似最近邻 (ANN) 索引：flat / IVF / HNSW / IVF-PQ
+
+问题背景:
+    08_rag_basic 用 FAISS.from_documents 建的是 IndexFlatL2 —— 精确检索，每次查询都要和所有向量算距离，
+    查询耗时随语料线性增长；百万级 chunk 时单次查询就要几十毫秒，内存也是 n * dim * 4 字节。
+
+设计:
+    - AnnSpec 描述索引类型和参数，未指定的参数按语料规模自动取值 (resolve):
+        flat    IndexFlatL2，精确检索，基准的 "标准答案"
+        ivf     IndexIVFFlat，nlist ≈ 4√n 个聚类中心，查询只扫 nprobe 个桶
+        hnsw    IndexHNSWFlat，图索引，M=32 / efConstruction=200 / efSearch=64，不需要训练
+        ivfpq   IndexIVFPQ，在 IVF 的基础上把向量压缩成 m 个 8bit 码 (每个子向量 16 维)，内存约为 flat 的 1/32；
+                代价是 recall 明显下降 (bench_ann 的合成数据上 recall@8 ≈ 0.6~0.75)，适合内存放不下 flat/HNSW 的场景
+      距离统一用 L2，与 FAISS.from_documents 的默认行为一致，score 的含义不变。
+    - IVF / IVF-PQ 需要先训练聚类中心：AnnStoreBuilder 先缓冲前 train_size 个 chunk 的向量作为训练样本，
+      训练完成后把缓冲写入索引，之后的批次直接 add —— 仍然是流式 ingest，缓冲大小有上限。
+    - 语料小于 min_vectors 时 ANN 没有意义 (还可能训练不出足够的聚类中心)，自动退回 flat，
+      resolved 里会记录实际使用的类型。
+    - nprobe / efSearch 保存在索引文件里，load_index 之后不需要重新设置。
+
+Android 类比:
+    从 "遍历整个 List 找最近的点" 换成 "先按网格 / 图跳到附近再精确比较" —— 类似地图 SDK 用空间索引做附近 POI 查询。
+
+用法:
+    spec = AnnSpec.parse("ivf")                       # 或 "hnsw:ef_search=128"、"ivfpq:nprobe=32"
+    vectorstore, report = ingest_directory("rag_data", embeddings, splitter, index_spec=spec)
+    基准: python bench_ann.py --sizes 10000,100000
+"""
+import math
+import time
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+TRAINED_TYPES = ("ivf", "ivfpq")
+
+
+@dataclass
+class AnnSpec:
+    index_type: str = "flat"
+    nlist: Optional[int] = None          # IVF 聚类数，默认 ≈ 4√n
+    nprobe: Optional[int] = None         # 查询时扫描的桶数，默认 nlist / 16 (至少 8)
+    hnsw_m: int = 32
+    ef_construction: int = 200
+    ef_search: int = 64
+    pq_m: Optional[int] = None           # PQ 子向量个数，默认让每个子向量约 16 维
+    pq_nbits: int = 8
+    train_size: int = 20_000             # 训练样本上限 (也是 ingest 时的缓冲上限)
+    min_vectors: int = 2_000             # 少于这个数量直接用 flat
+    expected_chunks: Optional[int] = None  # 预估的总 chunk 数，用来在流式 ingest 时决定 nlist
+
+    def __post_init__(self):
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {self.index_type!r}, expected one of {INDEX_TYPES}")
+
+    @classmethod
+    def parse(cls, text: str) -> "AnnSpec":
+        """"ivf:nlist=1024,nprobe=32" → AnnSpec(index_type="ivf", nlist=1024, nprobe=32)"""
+        index_type, _, options = text.strip().partition(":")
+        kwargs: Dict[str, Any] = {"index_type": index_type.strip().lower() or "flat"}
+        names = {f.name for f in fields(cls)}
+        for option in filter(None, options.split(",")):
+            key, _, value = option.partition("=")
+            key = key.strip()
+            if key not in names:
+                raise ValueError(f"Unknown index option {key!r}")
+            kwargs[key] = int(value)
+        return cls(**kwargs)
+
+    def needs_training(self) -> bool:
+        return self.index_type in TRAINED_TYPES
+
+    def resolve(self, n: int, dim: int) -> Dict[str, Any]:
+        """按语料规模 n 和向量维度 dim 补全参数，返回实际用于建索引的参数。"""
+        n = max(n, self.expected_chunks or 0)
+        index_type = self.index_type if n >= self.min_vectors else "flat"
+        params: Dict[str, Any] = {"index_type": index_type}
+        if index_type in TRAINED_TYPES:
+            # 每个聚类至少 39 个训练样本 (faiss 的建议值)，否则 k-means 会告警且质量下降
+            nlist = self.nlist or int(4 * math.sqrt(n))
+            params["nlist"] = max(1, min(nlist, min(n, self.train_size) // 39))
+            params["nprobe"] = min(self.nprobe or max(8, params["nlist"] // 16), params["nlist"])
+        if index_type == "ivfpq":
+            pq_m = self.pq_m or max(1, dim // 16)
+            while dim % pq_m:          # 子向量个数必须整除维度
+                pq_m -= 1
+            params.update(pq_m=pq_m, pq_nbits=self.pq_nbits)
+        if index_type == "hnsw":
+            params.update(hnsw_m=self.hnsw_m, ef_construction=self.ef_construction, ef_search=self.ef_search)
+        return params
+
+    def to_dict(self) -> Dict[str, Any]:
+        """写进 manifest 的形式 (只保留与默认值不同的字段，便于阅读)。"""
+        default = asdict(AnnSpec())
+        return {k: v for k, v in asdict(self).items() if k == "index_type" or v != default[k]}
+
+
+def make_index(params: Dict[str, Any], dim: int):
+    import faiss
+
+    index_type = params["index_type"]
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dim)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["hnsw_m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+        index.hnsw.efSearch = params["ef_search"]
+        return index
+    quantizer = faiss.IndexFlatL2(dim)
+    if index_type == "ivf":
+        index = faiss.IndexIVFFlat(quantizer, dim, params["nlist"])
+    else:
+        index = faiss.IndexIVFPQ(quantizer, dim, params["nlist"], params["pq_m"], params["pq_nbits"])
+    index.nprobe = params["nprobe"]
+    return index
+
+
+def build_index(vectors: np.ndarray, spec: AnnSpec, train_vectors: Optional[np.ndarray] = None):
+    """一次性构建 (基准脚本使用)：返回 (index, resolved_params, train_s, add_s)。"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    params = spec.resolve(len(vectors), vectors.shape[1])
+    index = make_index(params, vectors.shape[1])
+    train_s = 0.0
+    if params["index_type"] in TRAINED_TYPES:
+        sample = train_vectors if train_vectors is not None else sample_rows(vectors, spec.train_size)
+        start = time.perf_counter()
+        index.train(sample)
+        train_s = time.perf_counter() - start
+    start = time.perf_counter()
+    index.add(vectors)
+    return index, params, train_s, time.perf_counter() - start
+
+
+def sample_rows(vectors: np.ndarray, size: int, seed: int = 0) -> np.ndarray:
+    if len(vectors) <= size:
+        return vectors
+    rows = np.random.default_rng(seed).choice(len(vectors), size=size, replace=False)
+    return vectors[np.sort(rows)]
+
+
+def index_nbytes(index) -> int:
+    """序列化后的大小，近似等于索引常驻内存 (也是 mmap 加载时映射的文件大小)。"""
+    import faiss
+
+    return int(faiss.serialize_index(index).nbytes)
+
+
+# ==========================================
+# 流式 ingest 时构建 ANN 向量库
+# ==========================================
+
+@dataclass
+class AnnStoreBuilder:
+    """
+    ingest_directory 的向量库构建器: add_documents(batch) 若干次，最后 finish() 得到 FAISS 向量库。
+    需要训练的索引先缓冲 train_size 个向量，训练后再写入；不需要训练的也至少缓冲 min_vectors 个，
+    用来判断语料是否小到应该退回 flat。
+    """
+    embeddings: Any
+    spec: AnnSpec
+    resolved: Dict[str, Any] = field(default_factory=dict)
+    train_s: float = 0.0
+    _vectorstore: Any = None
+    _buffer_docs: List[Document] = field(default_factory=list)
+    _buffer_vectors: List[np.ndarray] = field(default_factory=list)
+
+    def _buffer_limit(self) -> int:
+        return max(self.spec.min_vectors, self.spec.train_size if self.spec.needs_training() else 0)
+
+    def add_documents(self, docs: List[Document]):
+        vectors = np.asarray(self.embeddings.embed_documents([d.page_content for d in docs]), dtype=np.float32)
+        if self._vectorstore is not None:
+            self._add(docs, vectors)
+            return
+        self._buffer_docs.extend(docs)
+        self._buffer_vectors.append(vectors)
+        if len(self._buffer_docs) >= self._buffer_limit():
+            self._flush_buffer()
+
+    def _flush_buffer(self):
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        from langchain_community.vectorstores import FAISS
+
+        vectors = np.concatenate(self._buffer_vectors)
+        self.resolved = self.spec.resolve(len(vectors), vectors.shape[1])
+        index = make_index(self.resolved, vectors.shape[1])
+        if self.resolved["index_type"] in TRAINED_TYPES:
+            start = time.perf_counter()
+            index.train(sample_rows(vectors, self.spec.train_size))
+            self.train_s = time.perf_counter() - start
+        self._vectorstore = FAISS(self.embeddings, index, InMemoryDocstore(), {})
+        self._add(self._buffer_docs, vectors)
+        self._buffer_docs, self._buffer_vectors = [], []
+
+    def _add(self, docs: List[Document], vectors: np.ndarray):
+        self._vectorstore.add_embeddings(zip([d.page_content for d in docs], vectors),
+                                         metadatas=[d.metadata for d in docs],
+                                         ids=[d.id for d in docs] if all(d.id for d in docs) else None)
+
+    def finish(self):
+        if self._vectorstore is None and self._buffer_docs:
+            self._flush_buffer()
+        return self._vectorstore
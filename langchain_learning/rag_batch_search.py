@@ -0,0 +1,391 @@
+"""
+批量向量检索：多个问题一次 embedding 请求 + 一次矩阵检索
+
+问题背景:
+    08_rag_basic 对每个问题单独 retriever.invoke(query)：每个问题各发一次 embedding 请求、
+    各做一次索引扫描，还要各付一遍 Runnable / callback 的 Python 开销。
+    LangChain 默认的 retriever.batch() 只是把 invoke 丢进线程池，本质上还是逐条执行。
+
+设计:
+    - BatchSearcher: 所有问题一次 embed_documents (一次请求 / 一次批量向量化)，拼成 (m, dim) 的查询矩阵，
+      一次矩阵乘 + argpartition 得到 (m, k) 的 top-k:
+        FAISS flat 索引直接读向量视图 (rag_index_store.load_index 加载时是映射的文件)，||q||² − 2·Q·Xᵀ + ||x||²，||x||² 只算一次；
+        (单条查询受内存带宽限制，每条都要把全部向量读一遍；批量时每块向量读一次供整块查询使用。
+         5 万 × 384 维上 FAISS IndexFlat.search 批量 ~2.4ms/条，numpy sgemm ~0.5ms/条)
+        rag_quantized.QuantizedVectorStore 用它自己的 search_vectors (分块解码 + 矩阵乘 + 可选重排)；
+        IVF / HNSW 等索引把整个查询矩阵交给 index.search。
+      查询按 MAX_SCORE_BYTES 分块，1024 条查询 × 百万向量也不会一次分配几个 GB 的距离矩阵。
+      rag_incremental.IncrementalFAISS 的墓碑位置在打分矩阵里直接屏蔽 (其他索引多取再过滤)。
+      对称的 embedding 模型 (OpenAI / hashing / stub) 的 embed_documents 与 embed_query 结果相同；
+      rag_embeddings.CachedEmbeddings 走它的 embed_queries (问题按 query 缓存，不混进 chunk 的缓存)。
+    - BatchVectorRetriever: BaseRetriever，invoke 与 as_retriever(k=...) 的结果一致；
+      batch() / abatch() 被覆盖为上面的单次矩阵检索。batch_with_runs 保留 Runnable 的约定:
+      每个输入照常有一个 retriever run (callbacks / tags / metadata 与 invoke 相同，telemetry 能看到)；
+      整批失败且 return_exceptions=True 时退回逐条检索，只有出错的那几条返回异常。
+      prefetching(queries): 先批量检索并暂存结果，with 块里逐条 invoke 同一个问题时直接取暂存结果，
+      离开 with 块时清空没被取用的结果 (例如被语义缓存直接回答的问题) ——
+      链 (create_retrieval_chain) 里仍然是逐条 invoke，callback / telemetry 照常工作，
+      但 embedding 与索引扫描只做了一次。
+
+Android 类比:
+    RecyclerView 的 DiffUtil 把多次 notifyItemChanged 合并成一次批量更新；
+    或 Room 的 `WHERE id IN (...)` 代替循环里逐条查询。
+
+用法:
+    retriever = BatchVectorRetriever(vectorstore=vectorstore, k=8)
+    results = retriever.batch(["question 1", "question 2"])    # List[List[Document]]
+    with retriever.prefetching(questions):
+        answers = chain.batch([{"input": q} for q in questions])
+    基准: python rag_batch_search.py [chunk 数，默认 50000]
+"""
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManager, CallbackManager, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import get_config_list
+from pydantic import PrivateAttr
+
+
+# 单个 (查询块 × 全部向量) 距离矩阵的上限：1M 向量时每块 64 条查询，1024 条查询也不会一次分配 4GB
+MAX_SCORE_BYTES = 256 << 20
+
+
+def _drop_dead(dist: np.ndarray, ids: np.ndarray, dead: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """去掉墓碑位置，每行保留前 k 个存活结果 (顺序不变，不足时补 -1)。"""
+    dead_mask = np.isin(ids, dead) | (ids < 0)
+    order = np.argsort(dead_mask, axis=1, kind="stable")[:, :k]
+    ids = np.where(dead_mask, -1, ids)
+    return np.take_along_axis(dist, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+def _topk(dist: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """每行最小的 k 个 (升序)。argpartition 是 O(n)，只对选出的 k 个排序。"""
+    k = min(k, dist.shape[1])
+    if k == 0:
+        return np.zeros((len(dist), 0), np.float32), np.zeros((len(dist), 0), np.int64)
+    ids = np.argpartition(dist, k - 1, axis=1)[:, :k]
+    part = np.take_along_axis(dist, ids, axis=1)
+    order = np.argsort(part, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+class BatchSearcher:
+    """
+    对一个向量库做 (m, dim) 查询矩阵的 top-k 检索:
+        FAISS flat 索引  → 零拷贝读向量，||q||² − 2·Q·Xᵀ + ||x||² 一次矩阵乘 (||x||² 只算一次并缓存)
+        QuantizedVectorStore → 它自己的 search_vectors (分块解码 + 矩阵乘，可选 float32 重排)
+        其他 FAISS 索引 (IVF / HNSW) → index.search 整个矩阵，由 FAISS 内部批量处理
+    查询较多时按 MAX_SCORE_BYTES 分块，内存与查询条数无关。
+    """
+
+    def __init__(self, vectorstore):
+        self.vectorstore = vectorstore
+        self._quantized = hasattr(vectorstore, "search_vectors")
+        self._index = None
+        self._view: Optional[np.ndarray] = None
+        self._norms: Optional[np.ndarray] = None
+        self._inner_product = False
+        if not self._quantized:
+            self._refresh_view()
+
+    def __len__(self):
+        return len(self.vectorstore.documents) if self._quantized else self.vectorstore.index.ntotal
+
+    def _refresh_view(self) -> None:
+        """
+        视图是索引缓冲区的裸指针，必须跟着索引走:
+        IncrementalFAISS.compact() 会换一个新索引 (ntotal 可能与旧的相同)，add_documents 会改变 ntotal
+        (FAISS 扩容时底层缓冲区也会搬家)。两种情况都重新取视图和范数；持有 _index 保证旧视图指向的内存不被释放。
+        """
+        from rag_quantized import faiss_flat_view
+
+        index = self.vectorstore.index
+        if index is self._index and (self._view is None or len(self._view) == index.ntotal):
+            return
+        self._index, self._view, self._norms = index, faiss_flat_view(index), None
+        self._inner_product = self._view is not None and index.metric_type == 0   # faiss.METRIC_INNER_PRODUCT
+
+    def _flat_view(self) -> np.ndarray:
+        if self._norms is None and not self._inner_product:
+            self._norms = np.einsum("ij,ij->i", self._view, self._view)
+        return self._view
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(distances, ids)，形状 (m, k)，按距离升序 (内积索引按分数降序)；不足 k 条时 id 为 -1。"""
+        queries = np.ascontiguousarray(np.atleast_2d(queries), dtype=np.float32)
+        if getattr(self.vectorstore, "_normalize_L2", False):
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        n = len(self)
+        if n == 0:
+            return np.zeros((len(queries), 0), np.float32), np.zeros((len(queries), 0), np.int64)
+        if not self._quantized:
+            self._refresh_view()
+        dead = self._dead()
+        if self._view is None and not self._quantized:
+            if not len(dead):
+                return self.vectorstore.index.search(queries, k)
+            dist, ids = self.vectorstore.index.search(queries, k + len(dead))
+            return _drop_dead(dist, ids, dead, k)
+        step = max(1, MAX_SCORE_BYTES // (4 * n))
+        parts = [self._search_block(queries[lo:lo + step], k) for lo in range(0, len(queries), step)]
+        return np.concatenate([d for d, _ in parts]), np.concatenate([i for _, i in parts])
+
+    def _dead(self) -> np.ndarray:
+        """rag_incremental.IncrementalFAISS 的墓碑位置 (其他向量库没有墓碑)。"""
+        dead_positions = getattr(self.vectorstore, "dead_positions", None)
+        return dead_positions() if dead_positions is not None else np.zeros(0, dtype=np.int64)
+
+    def _search_block(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self._quantized:
+            return self.vectorstore.search_vectors(queries, k)
+        view = self._flat_view()
+        scores = queries @ view.T                                  # (m, n)，一次 sgemm
+        if self._inner_product:
+            np.negative(scores, out=scores)
+        else:
+            scores *= -2
+            scores += self._norms[None, :]
+            scores += np.einsum("ij,ij->i", queries, queries)[:, None]
+        dead = self._dead()
+        if len(dead):
+            scores[:, dead] = np.inf
+        dist, ids = _topk(scores, min(k, len(view) - len(dead)))
+        return (-dist if self._inner_product else dist), ids
+
+    def documents(self, ids: np.ndarray) -> List[List[Document]]:
+        if self._quantized:
+            return [[self.vectorstore.documents[int(i)] for i in row if i >= 0] for row in ids]
+        id_map, docstore = self.vectorstore.index_to_docstore_id, self.vectorstore.docstore
+        return [[docstore.search(id_map[int(i)]) for i in row if i >= 0] for row in ids]
+
+    def search_by_vector(self, vectors, k: int = 4) -> List[List[Document]]:
+        _, ids = self.search(np.asarray(vectors, dtype=np.float32), k)
+        return self.documents(ids)
+
+    def similarity_search(self, queries: Sequence[str], k: int = 4) -> List[List[Document]]:
+        """每个问题的 top-k 文档列表 (与输入顺序一致)；所有问题只发一次 embedding 请求。"""
+        if not queries:
+            return []
+        embeddings = self.vectorstore.embeddings
+        embed = getattr(embeddings, "embed_queries", embeddings.embed_documents)
+        return self.search_by_vector(embed(list(queries)), k)
+
+    async def asimilarity_search(self, queries: Sequence[str], k: int = 4) -> List[List[Document]]:
+        if not queries:
+            return []
+        embeddings = self.vectorstore.embeddings
+        embed = getattr(embeddings, "aembed_queries", embeddings.aembed_documents)
+        return self.search_by_vector(await embed(list(queries)), k)
+
+
+# ==========================================
+# 保留 callback / return_exceptions 的批量 retriever 调用
+# ==========================================
+
+def _callback_manager(retriever: BaseRetriever, config: dict, manager_cls):
+    """与 BaseRetriever.invoke 相同的 callback 配置 (callbacks / tags / metadata 都继承自 config)。"""
+    return manager_cls.configure(
+        config.get("callbacks"), None,
+        inheritable_tags=config.get("tags"), local_tags=retriever.tags,
+        inheritable_metadata={**(config.get("metadata") or {}), **retriever._get_ls_params()},
+        local_metadata=retriever.metadata)
+
+
+def batch_with_runs(retriever: BaseRetriever, inputs: Sequence[str], config, search: Callable,
+                    return_exceptions: bool = False) -> List[Union[List[Document], Exception]]:
+    """
+    用一次批量检索实现 retriever.batch，同时遵守 Runnable 的约定:
+      - 每个输入一个 retriever run (on_retriever_start / end / error)，search(inputs, runs) 可以用
+        run.get_child() 把子调用挂到对应的 run 下面；
+      - search 整体失败时: return_exceptions=False 直接抛出；
+        否则逐条调用 retriever._get_relevant_documents，出错的输入位置上返回异常对象。
+    """
+    inputs = list(inputs)
+    if not inputs:
+        return []
+    runs = []
+    for query, cfg in zip(inputs, get_config_list(config, len(inputs))):
+        manager = _callback_manager(retriever, cfg, CallbackManager)
+        runs.append(manager.on_retriever_start(None, query, name=cfg.get("run_name") or retriever.get_name(),
+                                               run_id=cfg.pop("run_id", None)))
+    try:
+        results = search(inputs, runs)
+    except Exception as e:
+        if not return_exceptions:
+            for run in runs:
+                run.on_retriever_error(e)
+            raise
+        results = []
+        for query, run in zip(inputs, runs):
+            try:
+                results.append(retriever._get_relevant_documents(query, run_manager=run))
+            except Exception as item_error:
+                results.append(item_error)
+    for run, result in zip(runs, results):
+        if isinstance(result, Exception):
+            run.on_retriever_error(result)
+        else:
+            run.on_retriever_end(result)
+    return results
+
+
+async def abatch_with_runs(retriever: BaseRetriever, inputs: Sequence[str], config, search: Callable,
+                           return_exceptions: bool = False) -> List[Union[List[Document], Exception]]:
+    """batch_with_runs 的异步版本 (search 是 async 函数，回调走 AsyncCallbackManager)。"""
+    inputs = list(inputs)
+    if not inputs:
+        return []
+    runs = []
+    for query, cfg in zip(inputs, get_config_list(config, len(inputs))):
+        manager = _callback_manager(retriever, cfg, AsyncCallbackManager)
+        runs.append(await manager.on_retriever_start(None, query, name=cfg.get("run_name") or retriever.get_name(),
+                                                     run_id=cfg.pop("run_id", None)))
+    try:
+        results = await search(inputs, runs)
+    except Exception as e:
+        if not return_exceptions:
+            for run in runs:
+                await run.on_retriever_error(e)
+            raise
+        results = []
+        for query, run in zip(inputs, runs):
+            try:
+                results.append(await retriever._aget_relevant_documents(query, run_manager=run))
+            except Exception as item_error:
+                results.append(item_error)
+    for run, result in zip(runs, results):
+        if isinstance(result, Exception):
+            await run.on_retriever_error(result)
+        else:
+            await run.on_retriever_end(result)
+    return results
+
+
+class BatchVectorRetriever(BaseRetriever):
+    """稠密相似度检索；batch() 与 prefetch() 对多个问题只做一次 embedding + 一次矩阵检索。"""
+
+    vectorstore: Any
+    k: int = 4
+
+    _searcher: Any = PrivateAttr(default=None)
+    _prefetched: Dict[str, List[Document]] = PrivateAttr(default_factory=dict)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def searcher(self) -> BatchSearcher:
+        if self._searcher is None:
+            self._searcher = BatchSearcher(self.vectorstore)
+        return self._searcher
+
+    def prefetch(self, queries: Sequence[str]) -> int:
+        """
+        批量检索并暂存 (替换之前的暂存)；每条暂存结果被 invoke 取用一次后丢弃。返回暂存的问题数。
+        不会被取用的结果要用 clear_prefetched() 释放，优先用 prefetching() 上下文管理器。
+        """
+        unique = list(dict.fromkeys(queries))
+        results = self.searcher.similarity_search(unique, self.k)
+        with self._lock:
+            self._prefetched = dict(zip(unique, results))
+        return len(unique)
+
+    def clear_prefetched(self) -> int:
+        """丢弃没被取用的暂存结果，返回丢弃的条数。"""
+        with self._lock:
+            dropped, self._prefetched = len(self._prefetched), {}
+        return dropped
+
+    @contextmanager
+    def prefetching(self, queries: Sequence[str]) -> Iterator[int]:
+        """with 块内逐条 invoke 这些问题时使用批量检索的结果；离开时清空剩余的暂存。"""
+        try:
+            yield self.prefetch(queries)
+        finally:
+            self.clear_prefetched()
+
+    def _take_prefetched(self, query: str) -> Optional[List[Document]]:
+        with self._lock:
+            return self._prefetched.pop(query, None)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        docs = self._take_prefetched(query)
+        if docs is not None:
+            return docs
+        vector = self.vectorstore.embeddings.embed_query(query)
+        return self.searcher.search_by_vector([vector], self.k)[0]
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        docs = self._take_prefetched(query)
+        if docs is not None:
+            return docs
+        vector = await self.vectorstore.embeddings.aembed_query(query)
+        return self.searcher.search_by_vector([vector], self.k)[0]
+
+    def batch(self, inputs: List[str], config=None, *, return_exceptions: bool = False, **kwargs) -> List[List[Document]]:
+        return batch_with_runs(self, inputs, config, lambda queries, _: self.searcher.similarity_search(queries, self.k),
+                               return_exceptions)
+
+    async def abatch(self, inputs: List[str], config=None, *, return_exceptions: bool = False,
+                     **kwargs) -> List[List[Document]]:
+        async def search(queries, _):
+            return await self.searcher.asimilarity_search(queries, self.k)
+
+        return await abatch_with_runs(self, inputs, config, search, return_exceptions)
+
+
+if __name__ == "__main__":
+    # 吞吐基准：python rag_batch_search.py [chunk 数，默认 50000] [维度，默认 384]
+    import random
+    import sys
+    import time
+
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    from hashing_embeddings import HashingEmbeddings
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 384
+    k = 8
+    rng = random.Random(0)
+    words = ("policy employee budget remote office travel flight class manager approval security laptop "
+             "password leave vacation expense receipt hotel meal review deploy incident oncall benefit").split()
+
+    def sentence(lo: int, hi: int) -> str:
+        return " ".join(rng.choice(words) for _ in range(rng.randint(lo, hi)))
+
+    embeddings = HashingEmbeddings(dim=dim)
+    texts = [sentence(40, 80) for _ in range(n)]
+    index = faiss.IndexFlatL2(dim)
+    for lo in range(0, n, 4096):
+        index.add(embeddings.embed_batch(texts[lo:lo + 4096]))
+    ids = [str(i) for i in range(n)]
+    vectorstore = FAISS(embeddings, index, InMemoryDocstore({i: Document(page_content=t) for i, t in zip(ids, texts)}),
+                        dict(enumerate(ids)))
+    loop_retriever = vectorstore.as_retriever(search_kwargs={"k": k})
+    batch_retriever = BatchVectorRetriever(vectorstore=vectorstore, k=k)
+    all_queries = [sentence(4, 10) for _ in range(1024)]
+
+    print(f"FAISS flat, {n:,} chunks × {dim} dims, k={k}, HashingEmbeddings (local)")
+    print(f"{'batch':>6}{'loop q/s':>11}{'lc batch q/s':>14}{'batched q/s':>13}{'speedup':>9}{'same':>6}")
+    for size in (1, 4, 16, 64, 256, 1024):
+        queries = all_queries[:size]
+        timings = {}
+        for name, run in (("loop", lambda: [loop_retriever.invoke(q) for q in queries]),
+                          ("lc_batch", lambda: loop_retriever.batch(queries)),   # 线程池里逐条 invoke
+                          ("batched", lambda: batch_retriever.batch(queries))):
+            best = float("inf")
+            for _ in range(3 if size <= 64 else 1):
+                start = time.perf_counter()
+                results = run()
+                best = min(best, time.perf_counter() - start)
+            timings[name] = (best, results)
+        same = all([d.page_content for d in a] == [d.page_content for d in b]
+                   for a, b in zip(timings["loop"][1], timings["batched"][1]))
+        qps = {name: size / t for name, (t, _) in timings.items()}
+        print(f"{size:>6}{qps['loop']:>11,.0f}{qps['lc_batch']:>14,.0f}{qps['batched']:>13,.0f}"
+              f"{qps['batched'] / qps['loop']:>8.1f}x{str(same):>6}")
@@ -0,0 +1,169 @@
+"""
+RAG 语义答案缓存 (Semantic Answer Cache)
+
+问题背景:
+    08_rag_basic 的用户经常问几乎相同的问题 ("home office budget?" / "how much is the home office budget")。
+    llm_cache.py 只能命中 "完全相同" 的 Prompt，而措辞稍有不同就要重新走一遍 检索 + 生成。
+
+设计:
+    - 包装 rag_chain 的 Runnable：先用 get_embeddings_model 对问题做 embedding，
+      在一个小型内存向量索引 (归一化向量矩阵，点积 = 余弦相似度) 里找最相近的历史问题。
+    - 相似度 >= threshold 时直接返回历史答案，否则调用 rag_chain 并把结果写回缓存。
+    - 每条缓存记录都带上 index_version (语料 + embedding 模型的指纹)。
+      底层向量库变了 (set_index_version 传入新版本) 时，旧版本的答案全部失效。
+    - 容量上限 max_entries，超出后淘汰最久未命中的记录。
+    - 指标: hits / misses / hit_rate / invalidations / evictions
+
+Android 类比:
+    类似搜索框的 "联想缓存"：不要求 key 完全一致，只要足够相近就复用上一次的结果；
+    数据源刷新 (版本号变化) 时整体清空。
+
+用法:
+    cached_chain = SemanticAnswerCache(rag_chain, embeddings, index_version=corpus_fingerprint(splits, embeddings))
+    cached_chain.invoke({"input": "how much is the home office budget?"})
+    cached_chain.stats()
+"""
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.runnables import Runnable, RunnableConfig
+
+# 余弦相似度阈值。真实 embedding 模型上，同义改写通常在 0.9 以上；可用环境变量 RAG_CACHE_THRESHOLD 调整
+DEFAULT_THRESHOLD = float(os.getenv("RAG_CACHE_THRESHOLD", "0.9"))
+
+
+def corpus_fingerprint(docs, embeddings=None) -> str:
+    """语料指纹：chunk 内容 + embedding 模型。任何一项变化，版本号都会变化。"""
+    digest = hashlib.sha256()
+    model = getattr(embeddings, "model", None) or type(embeddings).__name__
+    digest.update(str(model).encode("utf-8"))
+    for doc in docs:
+        digest.update(b"\x00")
+        digest.update(doc.page_content.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class SemanticAnswerCache(Runnable):
+    """
+    - runnable:      被缓存的链 (输入为 {"input": 问题} 的 dict，例如 create_retrieval_chain 的结果)
+    - embeddings:    用于问题向量化的 Embeddings (建议与向量库使用同一个)
+    - threshold:     余弦相似度阈值
+    - index_version: 当前向量库版本；只有版本一致的记录才会被命中
+    """
+
+    def __init__(self, runnable, embeddings, threshold: float = DEFAULT_THRESHOLD,
+                 index_version: Optional[str] = None, max_entries: int = 1000, input_key: str = "input"):
+        self.runnable = runnable
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.index_version = index_version
+        self.max_entries = max_entries
+        self.input_key = input_key
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None   # (n, dim)，已 L2 归一化
+        self._entries: List[Dict[str, Any]] = []     # 与 _vectors 的行一一对应
+        self.hits = self.misses = self.invalidations = self.evictions = 0
+
+    # ------------------------------------------
+    # 版本管理
+    # ------------------------------------------
+    def set_index_version(self, version: Optional[str]) -> bool:
+        """底层索引变化时调用。版本不同则清空全部缓存，返回是否发生了失效。"""
+        with self._lock:
+            if version == self.index_version:
+                return False
+            self.index_version = version
+            self.invalidations += len(self._entries)
+            self._vectors, self._entries = None, []
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._vectors, self._entries = None, []
+
+    # ------------------------------------------
+    # 查找 / 写入
+    # ------------------------------------------
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _lookup(self, vec: np.ndarray):
+        with self._lock:
+            if self._vectors is None:
+                self.misses += 1
+                return None
+            scores = self._vectors @ vec
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            entry = self._entries[best]
+            entry["last_hit"] = time.monotonic()
+            self.hits += 1
+            return entry, float(scores[best])
+
+    def _store(self, vec: np.ndarray, question: str, output: Any):
+        with self._lock:
+            if self._entries and len(self._entries) >= self.max_entries:
+                victim = min(range(len(self._entries)), key=lambda i: self._entries[i]["last_hit"])
+                self._vectors = np.delete(self._vectors, victim, axis=0)
+                del self._entries[victim]
+                self.evictions += 1
+            self._entries.append({"question": question, "output": output, "last_hit": time.monotonic()})
+            row = vec[None, :]
+            self._vectors = row if self._vectors is None else np.vstack([self._vectors, row])
+
+    def _hit_output(self, input, entry, score):
+        output = entry["output"]
+        if isinstance(output, dict):
+            # 保留原有字段 (answer / context)，但 input 换成本次的问题，并标注命中来源
+            output = {**output, self.input_key: input[self.input_key],
+                      "cache_hit": {"question": entry["question"], "similarity": round(score, 4)}}
+        return output
+
+    # ------------------------------------------
+    # Runnable 接口
+    # ------------------------------------------
+    def invoke(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        question = input[self.input_key]
+        version = self.index_version
+        vec = self._normalize(self.embeddings.embed_query(question))
+        found = self._lookup(vec)
+        if found:
+            return self._hit_output(input, *found)
+        output = self.runnable.invoke(input, config, **kwargs)
+        if version == self.index_version:  # 执行期间索引被替换，则结果不再写入
+            self._store(vec, question, output)
+        return output
+
+    async def ainvoke(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        question = input[self.input_key]
+        version = self.index_version
+        vec = self._normalize(await self.embeddings.aembed_query(question))
+        found = self._lookup(vec)
+        if found:
+            return self._hit_output(input, *found)
+        output = await self.runnable.ainvoke(input, config, **kwargs)
+        if version == self.index_version:
+            self._store(vec, question, output)
+        return output
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+                "index_version": self.index_version,
+            }
@@ -0,0 +1,187 @@
+"""
+上下文压缩：检索结果只保留与问题相关的句子，并对 {context} 施加硬性 token 预算
+
+问题背景:
+    08_rag_basic 的 create_stuff_documents_chain 把检索到的 chunk 整段贴进 system prompt，
+    哪怕一个 chunk 里只有一句话和问题有关。Prompt token 直接决定费用和首 token 延迟。
+
+设计:
+    - SentenceCompressor 实现 LangChain 的 BaseDocumentCompressor，用 ContextualCompressionRetriever
+      夹在 retriever 和 stuff chain 之间，两边的代码都不用改 (可插拔：不需要时直接去掉这一层)。
+    - 打分完全在本地，不调用 LLM:
+        1. 把检索结果切成句子 (英文 . ! ? 后接空白、中文 。！？、换行)；
+           "1.1 Home Office Budget" 这类很短的标题行并入下一句，不会脱离正文单独入选；
+           chunk overlap 造成的重复句子只保留第一次出现
+        2. 以这些句子为 "语料" 建一个临时的 BM25Index (rag_retrievers)，用问题去打分
+           —— idf 只在本次检索结果内统计，"policy" 这种每句都有的词自然权重很低
+    - 按分数从高到低贪心装入，直到 token_budget 用完；预算还有剩余时，再补入已选句子的下一句
+      (答案常常在命中关键词那句的后面)。装入的句子按原文顺序拼回各自的 chunk，
+      chunk 的先后顺序不变 (检索器的排序仍然有意义)。
+      预算是硬上限: 包括 chunk 之间的分隔符；最相关的句子本身超出预算时按 token 截断。
+    - 每次压缩记录 CompressionReport (压缩前后 token 数)，last_report / totals 与 CachedEmbeddings 的用法一致。
+
+Android 类比:
+    列表页只下发卡片需要的字段 (BFF 裁剪)，而不是把完整的详情 JSON 都塞给客户端。
+
+用法:
+    compressor = SentenceCompressor(token_budget=160)
+    retriever = ContextualCompressionRetriever(base_compressor=compressor, base_retriever=retriever)
+    print(compressor.last_report.summary_line())   # 2 chunks: 245 → 98 tokens (-60%)
+"""
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence
+
+from langchain_core.documents import BaseDocumentCompressor, Document
+from pydantic import PrivateAttr
+
+from rag_retrievers import BM25Index
+from tokens import count_tokens
+
+# stuff chain 默认用 "\n\n" 连接各个文档
+DOCUMENT_SEPARATOR = "\n\n"
+# "3. Engineering Standards" 这种编号后的句点不算句末
+_SENTENCE_SPLIT_RE = re.compile(r"(?<!\b\d\.)(?<!\b\d\d\.)(?<=[.!?])\s+|(?<=[。！？])|\n+")
+HEADING_MAX_TOKENS = 12
+
+
+def split_sentences(text: str) -> List[str]:
+    """切句；不以句末标点结尾的短行 (标题) 与下一句合并，chunk 末尾孤立的标题丢弃。"""
+    sentences: List[str] = []
+    pending = ""
+    for part in _SENTENCE_SPLIT_RE.split(text):
+        part = part.strip() if part else ""
+        if not part:
+            continue
+        if pending:
+            part = f"{pending} {part}"
+            pending = ""
+        if part[-1] not in ".!?。！？:：" and count_tokens(part) <= HEADING_MAX_TOKENS:
+            pending = part
+        else:
+            sentences.append(part)
+    if pending and not sentences:   # chunk 末尾被切断的标题没有正文，单独保留没有意义
+        sentences.append(pending)
+    return sentences
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """按 token 截断 (二分查找字符位置，兼容 tiktoken 和启发式计数)。"""
+    if count_tokens(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo].rstrip()
+
+
+@dataclass
+class CompressionReport:
+    queries: int = 0
+    documents: int = 0
+    sentences_total: int = 0
+    sentences_kept: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def summary_line(self) -> str:
+        ratio = self.tokens_saved / self.tokens_before if self.tokens_before else 0.0
+        return (f"{self.documents} chunks, {self.sentences_kept}/{self.sentences_total} sentences: "
+                f"{self.tokens_before} → {self.tokens_after} context tokens (saved {self.tokens_saved}, -{ratio:.0%})")
+
+
+class SentenceCompressor(BaseDocumentCompressor):
+    token_budget: int = 160          # {context} 的硬上限 (token)
+    min_score: float = 0.0           # 低于这个 BM25 分数的句子不保留 (0 = 只要有命中词)
+    fill_neighbors: bool = True      # 预算有剩余时补入已选句子的下一句
+
+    last_report: Optional[Any] = None
+    totals: Any = None
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, __context: Any) -> None:
+        self.totals = CompressionReport()
+
+    def compress_documents(self, documents: Sequence[Document], query: str, callbacks=None) -> List[Document]:
+        documents = list(documents)
+        report = CompressionReport(queries=1, documents=len(documents))
+        report.tokens_before = self._context_tokens([d.page_content for d in documents])
+
+        # (文档序号, 句子序号, 文本)，跨 chunk 重复的句子 (overlap) 只保留第一次出现
+        sentences, seen = [], set()
+        for di, doc in enumerate(documents):
+            for si, text in enumerate(split_sentences(doc.page_content)):
+                if text not in seen:
+                    seen.add(text)
+                    sentences.append((di, si, text))
+        report.sentences_total = len(sentences)
+        ranked = self._rank(sentences, query)
+
+        kept = set()
+        used = 0
+
+        def try_add(idx: int) -> bool:
+            nonlocal used
+            di, _, text = sentences[idx]
+            cost = count_tokens(text) + 1                       # +1: 句子之间的空格
+            if kept and not any(k[0] == di for k in kept):
+                cost += count_tokens(DOCUMENT_SEPARATOR)
+            if (di, idx) in kept or used + cost > self.token_budget:
+                return False
+            kept.add((di, idx))
+            used += cost
+            return True
+
+        for idx in ranked:
+            try_add(idx)
+        if self.fill_neighbors:
+            frontier = [idx for idx in ranked if (sentences[idx][0], idx) in kept]
+            while frontier:
+                frontier = [idx + 1 for idx in frontier
+                            if idx + 1 < len(sentences) and sentences[idx + 1][0] == sentences[idx][0]
+                            and try_add(idx + 1)]
+
+        compressed = []
+        for di, doc in enumerate(documents):
+            parts = [sentences[idx][2] for d, idx in sorted(kept) if d == di]
+            if parts:
+                metadata = dict(doc.metadata, compressed=True)
+                compressed.append(Document(page_content=" ".join(parts), metadata=metadata))
+        if not compressed and ranked:
+            # 最相关的句子本身就超出预算：截断它，保证 {context} 不为空且不超限
+            di, _, text = sentences[ranked[0]]
+            compressed.append(Document(page_content=truncate_to_tokens(text, self.token_budget),
+                                       metadata=dict(documents[di].metadata, compressed=True)))
+
+        report.sentences_kept = len(kept) or len(compressed)
+        report.tokens_after = self._context_tokens([d.page_content for d in compressed])
+        self._record(report)
+        return compressed
+
+    def _rank(self, sentences, query: str) -> List[int]:
+        """BM25 分数降序的句子下标；没有任何命中时退回原顺序 (检索器认为最相关的 chunk 的开头)。"""
+        if not sentences:
+            return []
+        index = BM25Index(max_df_ratio=1.0)
+        index.add_documents(Document(page_content=text) for _, _, text in sentences)
+        hits = [i for i, score in index.search_ids(query, len(sentences)) if score > self.min_score]
+        return hits or list(range(len(sentences)))
+
+    @staticmethod
+    def _context_tokens(texts: List[str]) -> int:
+        return count_tokens(DOCUMENT_SEPARATOR.join(texts)) if texts else 0
+
+    def _record(self, report: CompressionReport):
+        with self._lock:
+            self.last_report = report
+            for name in ("queries", "documents", "sentences_total", "sentences_kept", "tokens_before", "tokens_after"):
+                setattr(self.totals, name, getattr(self.totals, name) + getattr(report, name))
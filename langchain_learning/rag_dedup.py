@@ -0,0 +1,266 @@
+"""
+ingest 阶段的近重复 chunk 去重：MinHash 签名 + LSH 分桶
+
+问题背景:
+    制度类语料里到处是重复的模板段落 (免责声明、"如有疑问请联系 HR"、每章相同的页眉)，
+    切分后变成大量几乎一样的 chunk。每一个都要付一次 embedding 费用、占一份索引内存，
+    检索时还会挤占 top-k 的名额 —— k=2 里两条内容相同，等于只检索到一条。
+
+设计:
+    - 相似度 = 字符 5-gram shingle 集合的 Jaccard 相似度 (先转小写、合并空白)。
+      字符 shingle 对中英文都适用；shingle 哈希复用 hashing_embeddings.ngram_hashes (向量化，无逐字符循环)。
+    - MinHash: num_perm 个 multiply-add-shift 哈希 h_i(x) = (a_i·x + b_i mod 2^64) >> 32 (对 32 位 x 是 2-universal，
+      不需要取模，比 "mod 素数" 的写法快约 35%)，签名是每个函数在 shingle 集合上的最小值；
+      两个签名逐位相等的比例是 Jaccard 的无偏估计。整批 chunk 的 (num_perm × shingle) 矩阵一次算完，
+      np.minimum.reduceat 按 chunk 取最小值。
+    - LSH: 签名切成 bands 段、每段 rows 个值，任一段完全相同就成为候选 (只需查 bands 次哈希表，
+      不用和所有已有 chunk 两两比较)。(bands, rows) 按阈值自动选择，
+      使 "候选概率 = 0.5" 的相似度略低于阈值 —— 宁可多出候选，再用签名估计的 Jaccard 精确过滤。
+    - NearDuplicateFilter 是流式的一环: 夹在 iter_chunks 和 embedding 之间，
+      第一次出现的 chunk 作为 canonical 保留，之后的近重复不再 embedding；
+      它们的 (id, source, start_index) 记在 canonical 的 metadata["duplicates"] 里 (apply_to_docstore /
+      apply_to_documents 在 ingest 结束后写回，因为向量库保存的是 metadata 的副本)。
+      内存里只保留签名 (num_perm × 4 字节/chunk) 和 LSH 表，不保留 chunk 文本。
+    - DedupReport: 去掉了多少 chunk、省下多少 embedding token、多少字节的向量索引。
+    - 增量更新: 去重状态 (签名、LSH 表) 不随索引持久化，rag_incremental 的增量更新不做去重。
+      危险的情况是 canonical 所在的文件被修改或删除: 它的重复项在别的 (未变化的) 文件里，从没进过索引，
+      增量更新之后这段内容就从索引里消失了。dependent_duplicates() 找出这种 canonical，
+      08 遇到时改走全量重建 (load_or_build_index 的 update_fn 返回 None)；
+      其余情况下增量更新只是把改动文件里的重复 chunk 再收进索引 (多占空间，不丢内容)，下次全量重建时再去掉。
+
+Android 类比:
+    图片库的感知哈希 (pHash) 去重：不逐像素比较，只比较短签名；相似的图只存一份，其余记为引用。
+
+用法:
+    dedup = NearDuplicateFilter(threshold=0.85)
+    vectorstore, report = ingest_directory("rag_data", embeddings, splitter, dedup=dedup)
+    print(dedup.report.summary_line(dim=1536))
+    基准: python rag_dedup.py
+"""
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from hashing_embeddings import ngram_hashes
+from tokens import count_tokens
+
+DEFAULT_THRESHOLD = 0.85
+DEFAULT_NUM_PERM = 128
+DEFAULT_SHINGLE_SIZE = 5
+_MASK32 = np.uint64(0xFFFFFFFF)
+_BLOCK_SHINGLES = 16384             # 一次计算的 (num_perm × shingle) 矩阵的列数上限
+_SPACE_RE = re.compile(r"\s+")
+
+
+def shingle_hashes(text: str, size: int = DEFAULT_SHINGLE_SIZE) -> np.ndarray:
+    """字符 shingle 的 32 位哈希 (去重后)。比 size 短的文本整体作为一个 shingle。"""
+    normalized = _SPACE_RE.sub(" ", text.lower()).strip()
+    if not normalized:
+        return np.zeros(0, dtype=np.uint64)
+    codes = np.frombuffer(normalized.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    return np.unique(ngram_hashes(codes, min(size, len(codes))) & _MASK32)
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """(bands, rows)：在 bands × rows = num_perm 的组合里，取 S 曲线拐点 (1/b)^(1/r) 不超过阈值的最大者。"""
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    below = [(b, r) for b, r in options if (1 / b) ** (1 / r) <= threshold]
+    return max(below, key=lambda br: (1 / br[0]) ** (1 / br[1])) if below else (num_perm, 1)
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, shingle_size: int = DEFAULT_SHINGLE_SIZE, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.integers(0, 2 ** 64, num_perm, dtype=np.uint64, endpoint=False) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 64, num_perm, dtype=np.uint64, endpoint=False)
+
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), num_perm) 的 uint32 签名。没有 shingle 的空文本签名全为最大值。"""
+        out = np.full((len(texts), self.num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+        shingles = [shingle_hashes(t, self.shingle_size) for t in texts]
+        start = 0
+        while start < len(texts):
+            # 攒一块 shingle 总数不超过 _BLOCK_SHINGLES 的文本，一次矩阵运算
+            end, total = start, 0
+            while end < len(texts) and (end == start or total + len(shingles[end]) <= _BLOCK_SHINGLES):
+                total += len(shingles[end])
+                end += 1
+            rows = [i for i in range(start, end) if len(shingles[i])]
+            if rows:
+                x = np.concatenate([shingles[i] for i in rows])
+                # (num_perm, shingle) 布局：reduceat 沿连续的最后一维做，比按行 reduceat 快一个数量级
+                values = self.a[:, None] * x[None, :]           # uint64 乘加自然按 2^64 回绕
+                values += self.b[:, None]
+                values >>= np.uint64(32)
+                offsets = np.cumsum([0] + [len(shingles[i]) for i in rows[:-1]])
+                out[rows] = np.minimum.reduceat(values.astype(np.uint32), offsets, axis=1).T
+            start = end
+        return out
+
+
+@dataclass
+class DedupReport:
+    chunks: int = 0                 # 进入去重阶段的 chunk 数
+    duplicates: int = 0             # 被判为近重复、没有进入索引的 chunk 数
+    tokens_skipped: int = 0         # 省下的 embedding token
+    chars_skipped: int = 0
+
+    def summary_line(self, dim: Optional[int] = None) -> str:
+        ratio = self.duplicates / self.chunks if self.chunks else 0.0
+        line = (f"{self.duplicates}/{self.chunks} chunks were near-duplicates ({ratio:.1%}): "
+                f"skipped {self.tokens_skipped:,} embedding tokens, {self.chars_skipped:,} chars of docstore text")
+        if dim:
+            line += f", {self.duplicates * dim * 4 / 1024:,.1f}KB of float32 vectors"
+        return line
+
+
+class NearDuplicateFilter:
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, num_perm: int = DEFAULT_NUM_PERM,
+                 shingle_size: int = DEFAULT_SHINGLE_SIZE):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self._tables: List[Dict[bytes, List[int]]] = [defaultdict(list) for _ in range(self.bands)]
+        self._signatures: List[np.ndarray] = []
+        self._ids: List[Optional[str]] = []                 # canonical chunk 的 doc.id
+        self.merged: Dict[str, List[dict]] = defaultdict(list)   # canonical id → 被合并的重复项
+        self.report = DedupReport()
+
+    def _find(self, signature: np.ndarray, band_keys: List[bytes]) -> Optional[int]:
+        candidates = set()
+        for table, key in zip(self._tables, band_keys):
+            candidates.update(table.get(key, ()))
+        if not candidates:
+            return None
+        # 候选一次性向量化校验：常见模板的桶里可能有几十个候选，逐个 np.mean 的调用开销会压过计算本身
+        candidates = sorted(candidates)
+        scores = (np.stack([self._signatures[c] for c in candidates]) == signature).mean(axis=1)
+        best = int(np.argmax(scores))
+        return candidates[best] if scores[best] >= self.threshold else None
+
+    def filter(self, docs: List[Document]) -> List[Document]:
+        """返回需要保留的 chunk (保持顺序)。同一批内部的重复也会被去掉。"""
+        signatures = self.hasher.signatures([d.page_content for d in docs])
+        kept = []
+        for doc, signature in zip(docs, signatures):
+            self.report.chunks += 1
+            band_keys = [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+            canonical = self._find(signature, band_keys)
+            if canonical is not None:
+                self.report.duplicates += 1
+                self.report.tokens_skipped += count_tokens(doc.page_content)
+                self.report.chars_skipped += len(doc.page_content)
+                if self._ids[canonical] is not None:
+                    self.merged[self._ids[canonical]].append(
+                        {"id": doc.id, "source": doc.metadata.get("source"),
+                         "start_index": doc.metadata.get("start_index")})
+                continue
+            ref = len(self._signatures)
+            self._signatures.append(signature)
+            self._ids.append(doc.id)
+            for table, key in zip(self._tables, band_keys):
+                table[key].append(ref)
+            kept.append(doc)
+        return kept
+
+    def filter_stream(self, docs: Iterable[Document], batch_size: int = 64) -> Iterator[Document]:
+        batch = []
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                yield from self.filter(batch)
+                batch = []
+        if batch:
+            yield from self.filter(batch)
+
+    # ---------- 把合并的来源写回 canonical ----------
+    def apply_to_documents(self, documents: Iterable[Document]) -> int:
+        """给 id 命中的 Document 写入 metadata["duplicates"] (例如 BM25Index.documents)。返回更新数。"""
+        updated = 0
+        for doc in documents:
+            if doc.id in self.merged:
+                doc.metadata["duplicates"] = list(self.merged[doc.id])
+                updated += 1
+        return updated
+
+    def apply_to_docstore(self, vectorstore) -> int:
+        """LangChain FAISS: 按 canonical id 更新 docstore 里的 Document。"""
+        updated = 0
+        for doc_id, duplicates in self.merged.items():
+            doc = vectorstore.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                doc.metadata["duplicates"] = list(duplicates)
+                updated += 1
+        return updated
+
+
+def dependent_duplicates(documents: Iterable[Document], sources: Iterable[str]) -> Dict[str, List[dict]]:
+    """
+    sources (source key，即 chunk ID 的 "<source>:" 前缀) 里的 canonical chunk → 来自其他文件的重复项。
+    这些重复项只靠 canonical 留在索引里：canonical 所在的文件改动或删除后不能增量更新，要全量重建。
+    没有记录 id 的旧条目无法判断来自哪个文件，按 "来自其他文件" 处理。
+    """
+    sources = set(sources)
+    dependents = {}
+    for doc in documents:
+        if not doc.id or doc.id.rpartition(":")[0] not in sources:
+            continue
+        outside = [d for d in doc.metadata.get("duplicates", ())
+                   if not d.get("id") or d["id"].rpartition(":")[0] not in sources]
+        if outside:
+            dependents[doc.id] = outside
+    return dependents
+
+
+if __name__ == "__main__":
+    # 吞吐 / 准确率基准：python rag_dedup.py [chunk 数，默认 20000]
+    import random
+    import sys
+    import time
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    rng = random.Random(0)
+    words = ("policy employee budget remote office travel flight class manager approval security laptop "
+             "password leave vacation expense receipt hotel meal review deploy incident oncall benefit "
+             "salary bonus training audit vendor contract insurance").split()
+
+    def sentence() -> str:
+        return " ".join(rng.choice(words) for _ in range(rng.randint(60, 90)))
+
+    def perturb(text: str, edits: int) -> str:
+        tokens = text.split()
+        for _ in range(edits):
+            tokens[rng.randrange(len(tokens))] = rng.choice(words)
+        return " ".join(tokens)
+
+    # 30% 的 chunk 是 50 段模板的轻微改写 (改 0~2 个词)，其余是独立文本
+    boilerplate = [sentence() for _ in range(50)]
+    texts, truth = [], []
+    for _ in range(n):
+        if rng.random() < 0.3:
+            texts.append(perturb(rng.choice(boilerplate), rng.randint(0, 2)))
+            truth.append(True)
+        else:
+            texts.append(sentence())
+            truth.append(False)
+    docs = [Document(page_content=t, id=str(i)) for i, t in enumerate(texts)]
+
+    dedup = NearDuplicateFilter()
+    start = time.perf_counter()
+    kept_ids = {d.id for d in dedup.filter_stream(docs, batch_size=256)}
+    elapsed = time.perf_counter() - start
+    dropped = [d.id not in kept_ids for d in docs]
+    # 每段模板第一次出现时会作为 canonical 保留，所以 "应删除" = 模板改写里除第一次以外的
+    false_drops = sum(1 for d, t in zip(dropped, truth) if d and not t)
+    missed = sum(truth) - sum(1 for d, t in zip(dropped, truth) if d and t)
+    print(f"NearDuplicateFilter(threshold={dedup.threshold}, num_perm={dedup.hasher.num_perm}, "
+          f"bands={dedup.bands}×rows={dedup.rows}): {n:,} chunks in {elapsed:.2f}s → {n / elapsed:,.0f} chunks/s")
+    print(f"  dropped {sum(dropped):,} | boilerplate rewrites kept (canonical or missed): {missed:,} "
+          f"| unique chunks wrongly dropped: {false_drops}")
+    print(f"  {dedup.report.summary_line(dim=1536)}")
@@ -0,0 +1,328 @@
+"""
+内容寻址的 Embedding 缓存 (SQLite)
+
+问题背景:
+    08_rag_basic 每次启动都 FAISS.from_documents(splits, embeddings)，
+    哪怕语料一个字都没改，也要把全部 chunk 重新 embedding 一遍 —— 既花钱又拖慢启动。
+
+设计:
+    - CachedEmbeddings 包装任意 Embeddings，key = (embedding 模型标识, sha256(chunk 文本))
+      内容相同就命中，与文件名、chunk 顺序无关 (content-addressed)。
+    - embed_documents: 先批量查缓存，只把 "新的 / 改过的" chunk 交给底层模型，结果写回。
+    - 向量以 float32 BLOB 存储；读出时维度不一致 (换了模型配置) 视为未命中。
+    - 每次调用生成 EmbeddingReport: reused / computed / 耗时，便于观察增量重建的效果。
+    - 问题 (embed_query / embed_queries) 默认不缓存：问题几乎不重复，写进持久化的缓存文件只会无限增长。
+      cache_queries=True 时用 "query:" 前缀的键单独存放，不计入 stats() 的 entries。
+
+BatchedEmbeddings (见文件后半部分) 负责把真正需要计算的 chunk 分批、并发地发出去，二者可以叠加:
+    CachedEmbeddings(BatchedEmbeddings(get_embeddings_model()))
+
+Android 类比:
+    Gradle 的 build cache：输入内容的 hash 没变，就直接复用上一次的产物，不重新编译。
+
+用法:
+    embeddings = CachedEmbeddings(get_embeddings_model())
+    FAISS.from_documents(splits, embeddings)
+    print(embeddings.last_report.summary_line())   # reused=12 computed=1 ...
+"""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from tokens import count_tokens_batch
+
+DEFAULT_EMBEDDING_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "embeddings.sqlite")
+
+
+def embedding_model_id(embeddings) -> str:
+    """模型标识：实现类 + 模型名 (+ dimensions)。同一标识下的向量才可以互相复用。"""
+    # 穿透 CachedEmbeddings / BatchedEmbeddings 等包装层，标识只取决于真正的模型
+    while isinstance(getattr(embeddings, "embeddings", None), Embeddings):
+        embeddings = embeddings.embeddings
+    model = getattr(embeddings, "model", None) or getattr(embeddings, "model_name", None) or "default"
+    dims = getattr(embeddings, "dimensions", None)
+    return f"{type(embeddings).__name__}:{model}" + (f":{dims}" if dims else "")
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class EmbeddingReport:
+    total: int = 0
+    reused: int = 0
+    computed: int = 0
+    elapsed_s: float = 0.0
+
+    def summary_line(self) -> str:
+        return (f"{self.total} chunks | reused={self.reused} computed={self.computed} "
+                f"| {self.elapsed_s * 1000:.0f}ms")
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    - embeddings:  底层 Embeddings (OpenAIEmbeddings / stub ...)
+    - path:        SQLite 文件，":memory:" 表示只在本进程内缓存
+    - cache_queries: 问题是否也走缓存 (同一批问题反复检索时才受益；默认关闭，避免缓存文件无限增长)
+    """
+
+    def __init__(self, embeddings, path: str = DEFAULT_EMBEDDING_CACHE_PATH, cache_queries: bool = False):
+        self.embeddings = embeddings
+        self.model_id = embedding_model_id(embeddings)
+        self.path = path
+        self.cache_queries = cache_queries
+        self.last_report = EmbeddingReport()
+        self.totals = EmbeddingReport()
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, hash TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, hash))"
+        )
+        self._conn.commit()
+
+    # 让 corpus_fingerprint / embedding_model_id 等通过 .model 看到底层模型
+    @property
+    def model(self):
+        return getattr(self.embeddings, "model", None)
+
+    # ------------------------------------------
+    # 存取
+    # ------------------------------------------
+    def _load(self, hashes: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # SQLite 单条语句的变量数有上限，分批查询
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT hash, dim, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(part))})",
+                    [self.model_id, *part],
+                ).fetchall()
+                for h, dim, blob in rows:
+                    vec = np.frombuffer(blob, dtype=np.float32)
+                    if len(vec) == dim:
+                        found[h] = vec.tolist()
+        return found
+
+    def _save(self, items: Dict[str, List[float]]):
+        rows = [(self.model_id, h, len(v), np.asarray(v, dtype=np.float32).tobytes()) for h, v in items.items()]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, dim, vector) VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def _record(self, report: EmbeddingReport):
+        self.last_report = report
+        self.totals.total += report.total
+        self.totals.reused += report.reused
+        self.totals.computed += report.computed
+        self.totals.elapsed_s += report.elapsed_s
+
+    # ------------------------------------------
+    # Embeddings 接口
+    # ------------------------------------------
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        hashes = [text_hash(t) for t in texts]
+        vectors = self._load(hashes)
+        # 同一批里重复的文本只算一次
+        missing = {h: t for h, t in zip(hashes, texts) if h not in vectors}
+        if missing:
+            computed = self._compute(list(missing.values()))
+            fresh = dict(zip(missing.keys(), computed))
+            self._save(fresh)
+            vectors.update(fresh)
+        self._record(EmbeddingReport(total=len(texts), reused=len(texts) - sum(h in missing for h in hashes),
+                                     computed=len(missing), elapsed_s=time.perf_counter() - start))
+        return [vectors[h] for h in hashes]
+
+    def _compute(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def _compute_queries(self, texts: List[str]) -> List[List[float]]:
+        # embed_query 和 embed_queries 都走这里，同一个问题不会因为调用路径不同得到 (或缓存) 不同的向量。
+        # 与 rag_batch_search 一样一次 embed_documents 算完 (对称模型的结果与 embed_query 相同)
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        批量版 embed_query (rag_batch_search 用)：cache_queries=True 时按 "query:" 键缓存，
+        不会把问题写成 document 条目，也不计入 reused / computed 统计。
+        """
+        if not self.cache_queries:
+            return self._compute_queries(texts)
+        keys = ["query:" + text_hash(t) for t in texts]
+        vectors = self._load(keys)
+        missing = {k: t for k, t in zip(keys, texts) if k not in vectors}
+        if missing:
+            fresh = dict(zip(missing, self._compute_queries(list(missing.values()))))
+            self._save(fresh)
+            vectors.update(fresh)
+        return [vectors[k] for k in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        # SQLite 读写很快，放线程里跑即可；真正耗时的网络请求在 _compute 里
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.to_thread(self.embed_query, text)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_queries, texts)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = ? AND hash NOT LIKE 'query:%'",
+                                         (self.model_id,)).fetchone()[0]
+        return {"entries": entries, "reused": self.totals.reused, "computed": self.totals.computed}
+
+
+# ==========================================
+# 分批 + 并发的 embedding 请求
+# ==========================================
+# 问题背景:
+#     embedding 走的是一次 embed_documents 调用，无法控制批大小和并发，大语料的 ingest 相当于一次只发一个请求。
+# 设计:
+#     - 按 token 数把 chunk 装箱成批 (max_batch_tokens / max_batch_size 两个上限)
+#     - 多个批次并发发送 (max_concurrency)，结果按原顺序拼回
+#     - 遇到 payload 过大的错误 (413 / "max ... tokens per request") 时把该批一分为二重试，
+#       并把后续批次的 token 上限也调低 (自适应)，不用每个批次都撞一次墙
+#     - 报告 chunks/sec、批次数、重试批次数与总耗时
+
+PAYLOAD_ERROR_HINTS = ("tokens per request", "too large", "too many tokens", "maximum context length",
+                       "too many inputs", "payload")
+
+
+def is_payload_error(error: BaseException) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status == 413:
+        return True
+    message = str(error).lower()
+    return status in (400, None) and any(hint in message for hint in PAYLOAD_ERROR_HINTS)
+
+
+@dataclass
+class BatchEmbeddingReport:
+    chunks: int = 0
+    batches: int = 0
+    retried_batches: int = 0
+    elapsed_s: float = 0.0
+    batch_token_limit: int = 0
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.elapsed_s if self.elapsed_s else 0.0
+
+    def summary_line(self) -> str:
+        return (f"{self.chunks} chunks in {self.batches} batches | {self.chunks_per_sec:.1f} chunks/s "
+                f"| retried={self.retried_batches} | {self.elapsed_s * 1000:.0f}ms "
+                f"| batch_token_limit={self.batch_token_limit}")
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    - embeddings:       底层 Embeddings
+    - max_batch_tokens: 单个请求的 token 上限 (OpenAI 为 300k，这里默认保守一些)
+    - max_batch_size:   单个请求的条数上限
+    - max_concurrency:  同时在途的请求数
+    """
+
+    def __init__(self, embeddings, max_batch_tokens: int = 8000, max_batch_size: int = 256,
+                 max_concurrency: int = 4):
+        self.embeddings = embeddings
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.last_report = BatchEmbeddingReport()
+        self._limit_lock = threading.Lock()
+        self._token_limit = max_batch_tokens
+
+    @property
+    def model(self):
+        return getattr(self.embeddings, "model", None)
+
+    def _plan(self, token_counts: List[int]) -> List[List[int]]:
+        """按顺序装箱，返回每批的下标列表。单条超过上限的 chunk 独占一批 (交给服务端判定)。"""
+        batches, current, current_tokens = [], [], 0
+        for i, n in enumerate(token_counts):
+            if current and (current_tokens + n > self._token_limit or len(current) >= self.max_batch_size):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += n
+        if current:
+            batches.append(current)
+        return batches
+
+    def _shrink(self, failed_tokens: int):
+        with self._limit_lock:
+            self._token_limit = max(1, min(self._token_limit, failed_tokens // 2))
+
+    def _embed_batch(self, texts, token_counts, indices, report) -> Dict[int, List[float]]:
+        batch_tokens = sum(token_counts[i] for i in indices)
+        if len(indices) > 1 and batch_tokens > self._token_limit:
+            # 其他批次刚刚调低了上限：先拆再发
+            mid = len(indices) // 2
+            return {**self._embed_batch(texts, token_counts, indices[:mid], report),
+                    **self._embed_batch(texts, token_counts, indices[mid:], report)}
+        try:
+            vectors = self.embeddings.embed_documents([texts[i] for i in indices])
+            with self._limit_lock:
+                report.batches += 1
+            return dict(zip(indices, vectors))
+        except Exception as e:
+            if not is_payload_error(e) or len(indices) == 1:
+                raise
+            with self._limit_lock:
+                report.retried_batches += 1
+            self._shrink(batch_tokens)
+            mid = len(indices) // 2
+            return {**self._embed_batch(texts, token_counts, indices[:mid], report),
+                    **self._embed_batch(texts, token_counts, indices[mid:], report)}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        report = BatchEmbeddingReport(chunks=len(texts))
+        token_counts = count_tokens_batch(texts)
+        batches = self._plan(token_counts)
+        results: Dict[int, List[float]] = {}
+        if len(batches) <= 1 or self.max_concurrency <= 1:
+            for indices in batches:
+                results.update(self._embed_batch(texts, token_counts, indices, report))
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="embed") as pool:
+                futures = [pool.submit(self._embed_batch, texts, token_counts, indices, report) for indices in batches]
+                for future in futures:
+                    results.update(future.result())
+        report.elapsed_s = time.perf_counter() - start
+        report.batch_token_limit = self._token_limit
+        self.last_report = report
+        return [results[i] for i in range(len(texts))]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.embeddings.aembed_query(text)
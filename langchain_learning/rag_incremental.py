@@ -0,0 +1,363 @@
+"""
+向量库的增量更新：按源文件 diff，只 upsert 变化的 chunk，删除用墓碑标记，定期压缩
+
+问题背景:
+    08_rag_basic 的索引 manifest 里记录了每个源文件的 sha256，任何一个文件改了一个字，
+    整个 FAISS 库都要重新 加载 → 切分 → embedding → 建索引，代价与语料总量成正比。
+
+设计:
+    - 稳定的 chunk ID: rag_ingest.chunk_id = "<source>:<start_index>" (切分器的 add_start_index=True)，
+      同一文件同一偏移的 chunk 每次 ingest 得到同一个 ID，直接作为 FAISS docstore 的 key。
+    - sync_files(changed, removed, splitter): 只重新切分 sha256 变化的文件，与该文件的旧 chunk 逐个比对:
+        ID 和正文都相同      → 不动
+        正文相同、偏移变了    → 只改 docstore 的 key 和元数据 (文件前面插入/删除了内容)，不重新 embedding
+        新出现的正文          → embedding 后追加到索引末尾 (CachedEmbeddings 还能复用以前算过的向量)
+        不再出现的旧 chunk    → 墓碑：index_to_docstore_id 指向占位文档，向量留在原位
+      未变化的文件完全不碰；embedding 次数和索引的改动量只与改动的 chunk 数成正比
+      (保存时 save_index 仍然整体写出索引文件，那是一次顺序写，不涉及切分和 embedding)。
+    - 墓碑而不是 index.remove_ids: IndexFlat 的 remove_ids 要搬移后面所有向量 (O(n))，
+      HNSW 根本不支持删除。检索时多取 len(tombstones) 条再过滤 (similarity_search、
+      rag_batch_search、rag_mmr 都认 tombstones)。
+    - compact(): 墓碑超过 compact_ratio (默认 20%) 时，取出存活向量 (flat 索引零拷贝视图，其他索引 reconstruct)，
+      新建一个同类型、保留训练结果的空索引 (empty_like) 重新 add，位置连续重排 —— 这一步是 O(n)，但被摊到多次更新上。
+      mmap 加载的索引是只读的：sync_files 需要 load_index(mmap=False)，compact 不受影响 (写入的是新索引)。
+    - 墓碑状态完全由 docstore 推导 (占位文档的 key)，save_local / load_local 不需要额外文件；
+      rag_index_store.load_or_build_index(update_fn=...) 在只有源文件变化时走增量路径。
+    - open_corpus_index(): 08_rag_basic 用的一站式入口，把 manifest、流式全量构建 (BM25 + 去重)、
+      增量更新 (BM25 sidecar 同步；会丢掉被去重内容时改走全量重建) 和加载接到一起。
+
+Android 类比:
+    Room / SQLite 的 DELETE 只把页标成空闲，VACUUM 时才真正整理文件；
+    RecyclerView 的 DiffUtil 只对变化的 item 发 notifyItemChanged / Moved / Removed。
+
+用法:
+    store = IncrementalFAISS.from_faiss(load_index(index_dir, embeddings, mmap=False))
+    changed, removed = diff_sources(old_manifest.sources, new_manifest.sources)
+    report = store.sync_files([os.path.join(data_dir, p) for p in changed],
+                              [os.path.join(data_dir, p) for p in removed], splitter, base_dir=data_dir)
+    apply_to_bm25(bm25, report)
+    print(report.summary_line())   # 1 files changed: 3 added, 20 moved, 1 removed, 97 unchanged | 2 tombstones
+
+    corpus = open_corpus_index("rag_data", index_dir, embeddings, make_splitter, splitter_params)
+    corpus.vectorstore, corpus.bm25   # IncrementalFAISS (过滤墓碑) + 同步好的 BM25Index
+"""
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from rag_dedup import NearDuplicateFilter, dependent_duplicates
+from rag_index_store import IndexManifest, build_manifest, load_or_build_index, load_sidecar
+from rag_ingest import ingest_directory, iter_chunks, iter_files, source_key
+from rag_retrievers import BM25Index
+
+TOMBSTONE_ID = "__tombstone__"
+DEFAULT_COMPACT_RATIO = 0.2
+
+
+def diff_sources(previous: Dict[str, str], current: Dict[str, str]) -> Tuple[List[str], List[str]]:
+    """manifest.sources (相对路径 → sha256) 的差异: (新增或内容变化的文件, 已删除的文件)。"""
+    changed = sorted(path for path, digest in current.items() if previous.get(path) != digest)
+    removed = sorted(path for path in previous if path not in current)
+    return changed, removed
+
+
+@dataclass
+class SyncReport:
+    files_changed: int = 0
+    files_removed: int = 0
+    unchanged: int = 0
+    added: List[Document] = field(default_factory=list)
+    moved: List[Tuple[str, Document]] = field(default_factory=list)     # (旧 key, 新 Document)
+    removed: List[str] = field(default_factory=list)                    # 被墓碑标记的旧 key
+    tombstones: int = 0
+    compacted: int = 0              # 本次压缩物理删除的向量数 (0 = 没有触发压缩)
+    elapsed_s: float = 0.0
+
+    def summary_line(self) -> str:
+        return (f"{self.files_changed} files changed, {self.files_removed} removed: "
+                f"{len(self.added)} added, {len(self.moved)} moved, {len(self.removed)} removed, "
+                f"{self.unchanged} unchanged | {self.tombstones} tombstones"
+                + (f" | compacted {self.compacted}" if self.compacted else "") + f" | {self.elapsed_s:.2f}s")
+
+
+def empty_like(index):
+    """
+    同类型、保留训练结果 (IVF 质心 / PQ 码本) 的空索引，数据由它自己持有。
+    不用 faiss.clone_index：mmap 加载 (IO_FLAG_MMAP_IFC) 的索引克隆出来仍是只读视图，reset / add 会直接 abort 进程。
+    """
+    import faiss
+
+    if isinstance(index, faiss.IndexFlat):
+        return faiss.IndexFlat(index.d, index.metric_type)
+    index = faiss.deserialize_index(faiss.serialize_index(index))
+    index.reset()
+    return index
+
+
+class IncrementalFAISS(FAISS):
+    """带墓碑的 LangChain FAISS：支持按文件 upsert / 删除 chunk 和压缩。"""
+
+    def __init__(self, *args, compact_ratio: float = DEFAULT_COMPACT_RATIO, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.compact_ratio = compact_ratio
+        self.tombstones: Set[int] = {pos for pos, key in self.index_to_docstore_id.items() if key == TOMBSTONE_ID}
+        self._dead: Optional[np.ndarray] = None
+        self._by_source: Optional[Dict[str, Dict[str, int]]] = None
+
+    @classmethod
+    def from_faiss(cls, store: FAISS, **kwargs) -> "IncrementalFAISS":
+        """包装已有的 FAISS 库 (共享 index / docstore，不复制数据)。"""
+        return cls(store.embedding_function, store.index, store.docstore, store.index_to_docstore_id,
+                   relevance_score_fn=store.override_relevance_score_fn, normalize_L2=store._normalize_L2,
+                   distance_strategy=store.distance_strategy, **kwargs)
+
+    # ---------- 检索：过滤墓碑 ----------
+    def dead_positions(self) -> np.ndarray:
+        """墓碑位置的有序数组 (rag_batch_search / rag_mmr 用来过滤)。"""
+        if self._dead is None:
+            self._dead = np.fromiter(sorted(self.tombstones), dtype=np.int64, count=len(self.tombstones))
+        return self._dead
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4, filter=None, fetch_k: int = 20,
+                                               **kwargs) -> List[Tuple[Document, float]]:
+        if not self.tombstones:
+            return super().similarity_search_with_score_by_vector(embedding, k, filter=filter, fetch_k=fetch_k,
+                                                                  **kwargs)
+        user_filter = self._create_filter_func(filter) if filter is not None else None
+
+        def live(metadata: dict) -> bool:
+            return not metadata.get("tombstone") and (user_filter is None or user_filter(metadata))
+
+        # 最多有 len(tombstones) 个结果是墓碑，多取这么多条
+        return super().similarity_search_with_score_by_vector(
+            embedding, k, filter=live, fetch_k=max(fetch_k, k) + len(self.tombstones), **kwargs)
+
+    def live_documents(self) -> Iterable[Document]:
+        for key in self.index_to_docstore_id.values():
+            if key != TOMBSTONE_ID:
+                yield self.docstore.search(key)
+
+    # ---------- 增量更新 ----------
+    def _chunks_by_source(self) -> Dict[str, Dict[str, int]]:
+        """
+        source key → {docstore key: 索引位置}。source key 取自 chunk ID 的 "<source>:" 前缀，
+        与构建时的工作目录无关。第一次使用时扫描一遍 docstore，之后随更新维护。
+        """
+        if self._by_source is None:
+            by_source: Dict[str, Dict[str, int]] = defaultdict(dict)
+            for pos, key in self.index_to_docstore_id.items():
+                if key != TOMBSTONE_ID:
+                    by_source[key.rpartition(":")[0]][key] = pos
+            self._by_source = dict(by_source)
+        return self._by_source
+
+    def _tombstone(self, positions: Iterable[int]):
+        if not isinstance(self.docstore.search(TOMBSTONE_ID), Document):   # 找不到时返回的是提示字符串
+            self.docstore.add({TOMBSTONE_ID: Document(page_content="", metadata={"tombstone": True})})
+        for pos in positions:
+            self.index_to_docstore_id[pos] = TOMBSTONE_ID
+            self.tombstones.add(pos)
+        self._dead = None
+
+    def _sync_file(self, path: str, splitter, report: SyncReport, base_dir: Optional[str]):
+        source = source_key(path, base_dir)
+        old = self._chunks_by_source().pop(source, {})
+        # 旧 chunk 按正文分组，等待与新切分结果配对
+        free: Dict[str, List[Tuple[str, int]]] = defaultdict(list)
+        for key, pos in old.items():
+            free[self.docstore.search(key).page_content].append((key, pos))
+        new_docs = list(iter_chunks(path, splitter, base_dir=base_dir))
+        current: Dict[str, int] = {}
+
+        pending = []
+        for doc in new_docs:
+            same = next((c for c in free.get(doc.page_content, ()) if c[0] == doc.id), None)
+            if same is not None:
+                free[doc.page_content].remove(same)
+                current[doc.id] = same[1]
+                report.unchanged += 1
+            else:
+                pending.append(doc)
+        added, moved = [], []
+        for doc in pending:
+            candidates = free.get(doc.page_content)
+            if candidates:
+                old_key, pos = candidates.pop(0)
+                moved.append((old_key, doc, pos))
+            else:
+                added.append(doc)
+        removed = [c for candidates in free.values() for c in candidates]
+
+        # 先把要改名 / 删除的旧 key 移出 docstore，新 chunk 可能复用其中的 ID (同一偏移、正文变了)
+        stale = [key for key, _, _ in moved] + [key for key, _ in removed]
+        if stale:
+            self.docstore.delete(stale)
+        for old_key, doc, pos in moved:
+            self.docstore.add({doc.id: doc})
+            self.index_to_docstore_id[pos] = doc.id
+            current[doc.id] = pos
+            report.moved.append((old_key, doc))
+        self._tombstone(pos for _, pos in removed)
+        report.removed.extend(key for key, _ in removed)
+        if added:
+            start = self.index.ntotal
+            ids = self.add_documents(added, ids=[d.id for d in added] if all(d.id for d in added) else None)
+            current.update((key, start + i) for i, key in enumerate(ids))
+            report.added.extend(added)
+        if current:
+            self._by_source[source] = current
+
+    def sync_files(self, changed: Iterable[str], removed: Iterable[str] = (), splitter=None,
+                   compact: bool = True, base_dir: Optional[str] = None) -> SyncReport:
+        """
+        changed: 新增或内容变化的文件 (需要 splitter)；removed: 已删除的文件。
+        base_dir: 构建索引时的数据目录 (chunk ID 相对它)，默认每个文件所在的目录。
+        """
+        start = time.perf_counter()
+        report = SyncReport()
+        for path in changed:
+            self._sync_file(path, splitter, report, base_dir)
+            report.files_changed += 1
+        for path in removed:
+            old = self._chunks_by_source().pop(source_key(path, base_dir), {})
+            for key in old:
+                self.docstore.delete([key])
+            self._tombstone(old.values())
+            report.removed.extend(old)
+            report.files_removed += 1
+        if compact:
+            report.compacted = self.maybe_compact()
+        report.tombstones = len(self.tombstones)
+        report.elapsed_s = time.perf_counter() - start
+        return report
+
+    # ---------- 压缩 ----------
+    def maybe_compact(self) -> int:
+        if self.tombstones and len(self.tombstones) > self.compact_ratio * self.index.ntotal:
+            return self.compact()
+        return 0
+
+    def compact(self) -> int:
+        """去掉墓碑向量，位置重新连续编号。返回物理删除的向量数。"""
+        if not self.tombstones:
+            return 0
+        from rag_quantized import reconstruct_vectors
+
+        live = np.ones(self.index.ntotal, dtype=bool)
+        live[self.dead_positions()] = False
+        live = np.flatnonzero(live)
+        vectors = reconstruct_vectors(self.index, live)
+        index = empty_like(self.index)
+        if len(vectors):
+            index.add(vectors)
+        id_map = self.index_to_docstore_id
+        self.index = index
+        self.index_to_docstore_id = {new: id_map[int(old)] for new, old in enumerate(live)}
+        self.docstore.delete([TOMBSTONE_ID])
+        removed = len(self.tombstones)
+        self.tombstones, self._dead, self._by_source = set(), None, None
+        return removed
+
+
+def apply_to_bm25(bm25, report: SyncReport, compact_ratio: float = DEFAULT_COMPACT_RATIO) -> bool:
+    """
+    把 sync_files 的变化同步到 rag_retrievers.BM25Index (只对新增的 chunk 分词)。
+    BM25 里的文档没有 chunk ID (旧版本构建的 sidecar) 时返回 False，调用方应从 live_documents 重建。
+    """
+    positions = {doc.id: i for i, doc in enumerate(bm25.documents) if doc.id and i not in bm25.deleted}
+    stale = report.removed + [old_key for old_key, _ in report.moved]
+    if any(key not in positions for key in stale):
+        return False
+    bm25.delete_documents(positions[key] for key in report.removed)
+    for old_key, doc in report.moved:
+        bm25.replace_document(positions[old_key], doc)
+    bm25.add_documents(report.added)
+    if len(bm25.deleted) > compact_ratio * max(len(bm25), 1):
+        bm25.compact()
+    bm25.finalize()
+    return True
+
+
+# ==========================================
+# 持久化索引的一站式入口 (08_rag_basic 用)
+# ==========================================
+
+@dataclass
+class CorpusIndex:
+    vectorstore: IncrementalFAISS
+    bm25: BM25Index
+    manifest: IndexManifest
+    loaded: bool                    # True = manifest 匹配，直接加载了持久化的索引
+
+    @property
+    def live_chunks(self) -> int:
+        return self.vectorstore.index.ntotal - len(self.vectorstore.tombstones)
+
+
+def open_corpus_index(data_dir: str, index_dir: str, embeddings, make_splitter: Callable[[], Any],
+                      splitter_params: Dict[str, Any], index_spec=None, dedup_threshold: float = 0.0,
+                      batch_size: int = 64) -> CorpusIndex:
+    """
+    data_dir 的向量索引 + BM25 索引，持久化在 index_dir:
+        manifest 匹配        → mmap 加载
+        只有源文件变化        → sync_files 增量更新，BM25 sidecar 用 apply_to_bm25 同步
+                               (改动的文件里有其他文件重复内容的 canonical chunk 时，增量会丢内容，改走全量重建)
+        其他 (首次 / 换了模型、切分参数、索引类型) → 流式全量构建，同一遍里建 BM25、去重
+    dedup_threshold > 0 时近重复的 chunk 不入库 (rag_dedup)，阈值也写进 manifest。
+    """
+    build_params = ({**splitter_params, "dedup_threshold": dedup_threshold} if dedup_threshold
+                    else dict(splitter_params))
+    manifest = build_manifest(list(iter_files(data_dir)), embeddings, build_params,
+                              base_dir=data_dir, index_spec=index_spec)
+
+    def build_index():
+        print(f"--- 1-3. Loading, Splitting & Indexing {data_dir}/ (streaming, batch={batch_size}) ---")
+        bm25 = BM25Index()
+        dedup = NearDuplicateFilter(threshold=dedup_threshold) if dedup_threshold else None
+        vectorstore, report = ingest_directory(data_dir, embeddings, make_splitter(), batch_size=batch_size,
+                                               on_batch=bm25.add_documents, index_spec=index_spec, dedup=dedup)
+        print(f"VectorStore created successfully. {report.summary_line()}")
+        if dedup is not None:
+            dedup.apply_to_documents(bm25.documents)
+            print(f"Dedup: {dedup.report.summary_line(dim=vectorstore.index.d)}")
+        totals = getattr(embeddings, "totals", None)      # rag_embeddings.CachedEmbeddings
+        if totals is not None:
+            print(f"Embeddings: reused={totals.reused} computed={totals.computed}")
+        return vectorstore, {"bm25": bm25.finalize()}
+
+    def update_index(vectorstore, previous: IndexManifest):
+        store = IncrementalFAISS.from_faiss(vectorstore)
+        changed, removed = diff_sources(previous.sources, manifest.sources)
+        if dedup_threshold:
+            # 增量更新不去重：改动的文件里的 canonical chunk 一旦被删，它代表的重复内容从未入库，会丢失
+            dependents = dependent_duplicates(store.live_documents(), changed + removed)
+            if dependents:
+                print(f"--- 1-3. {len(dependents)} changed chunks are canonical for duplicates in other files, "
+                      f"rebuilding the index ---")
+                return None
+        report = store.sync_files([os.path.join(data_dir, p) for p in changed],
+                                  [os.path.join(data_dir, p) for p in removed], make_splitter(), base_dir=data_dir)
+        print(f"--- 1-3. Incremental index update: {report.summary_line()} ---")
+        bm25 = load_sidecar(index_dir, "bm25")
+        if bm25 is None or not apply_to_bm25(bm25, report):
+            bm25 = _bm25_from(store)
+        return store, {"bm25": bm25}
+
+    vectorstore, loaded = load_or_build_index(index_dir, manifest, embeddings, build_index, update_fn=update_index)
+    vectorstore = IncrementalFAISS.from_faiss(vectorstore)
+    bm25 = load_sidecar(index_dir, "bm25")
+    if bm25 is None:  # 在有 BM25 之前持久化的索引：从 docstore 重建
+        bm25 = _bm25_from(vectorstore)
+    return CorpusIndex(vectorstore=vectorstore, bm25=bm25, manifest=manifest, loaded=loaded)
+
+
+def _bm25_from(store: IncrementalFAISS) -> BM25Index:
+    bm25 = BM25Index()
+    bm25.add_documents(store.live_documents())
+    return bm25.finalize()
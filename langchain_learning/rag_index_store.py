@@ -0,0 +1,194 @@
+"""
+持久化的 FAISS 索引 + 版本清单 (manifest)，支持 mmap 热启动
+
+问题背景:
+    08_rag_basic 的 FAISS 只存在内存里，每个进程启动都要从 rag_data/ 重新 加载 → 切分 → embedding → 建索引；
+    多个 worker 进程还各自持有一份完全相同的索引。
+
+设计:
+    - 索引目录结构:
+        index.faiss      FAISS 索引本体
+        index.pkl        docstore + index_to_docstore_id (FAISS.save_local 的格式)
+        manifest.json    构建输入的指纹: embedding 模型、splitter 参数、ANN 索引参数、每个源文件的 sha256
+        <name>.sidecar.pkl  可选的附属索引 (例如 BM25 倒排索引)，与向量索引同一批次原子替换
+    - 启动时先算 "期望的 manifest" (只需要 hash 源文件，不需要切分和 embedding)，
+      与磁盘上的 manifest 一致就直接加载；只有源文件不同 (embedding 模型 / splitter / 索引参数都没变) 且
+      提供了 update_fn 时增量更新 (rag_incremental)；否则重建并覆盖。
+    - 源文件按相对数据目录的路径记录，从哪个工作目录运行都得到同一个 manifest。
+    - 加载时使用 faiss 的 IO_FLAG_MMAP_IFC：索引数据 (包括 IndexFlat / HNSW 的原始向量) 直接 mmap 映射文件，
+      多个进程打开同一个文件时共享操作系统的 page cache，而不是每个进程一份私有拷贝。
+      (IO_FLAG_MMAP | IO_FLAG_READ_ONLY 只对 IVF 的倒排表生效，IndexFlat 仍会被完整读进私有内存。)
+    - 保存时先写临时目录再 rename，避免其他进程读到写了一半的索引。
+
+Android 类比:
+    类似 ART 的 .oat / .vdex：按 APK 的 checksum 判断是否需要重新 dex2oat，
+    编译产物通过 mmap 加载，多个进程共享同一份物理内存。
+
+用法:
+    manifest = build_manifest(["rag_data/company_policy.txt"], embeddings, {"chunk_size": 500, ...}, base_dir="rag_data")
+    vectorstore, loaded = load_or_build_index(INDEX_DIR, manifest, embeddings, build_fn)
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from rag_embeddings import embedding_model_id
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "rag_index")
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """按块读取计算 hash，大文件也不会整体读进内存。"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass
+class IndexManifest:
+    embedding_model: str
+    splitter: Dict[str, Any]
+    sources: Dict[str, str]                     # 相对路径 → sha256
+    version: int = MANIFEST_VERSION
+    index: Dict[str, Any] = field(default_factory=dict)   # rag_ann.AnnSpec.to_dict()，flat 时为空
+    # 以下字段是构建结果，不参与 "是否匹配" 的判断
+    num_chunks: int = 0
+    dim: int = 0
+    created_at: float = field(default=0.0)
+
+    def key(self) -> Dict[str, Any]:
+        key = {"version": self.version, "embedding_model": self.embedding_model,
+               "splitter": self.splitter, "sources": self.sources}
+        if self.index:  # 为空时不参与，flat 索引的旧 manifest 仍然匹配
+            key["index"] = self.index
+        return key
+
+    def fingerprint(self) -> str:
+        """构建输入的指纹，可直接作为 SemanticAnswerCache 的 index_version。"""
+        raw = json.dumps(self.key(), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+    def matches(self, other: Optional["IndexManifest"]) -> bool:
+        return other is not None and self.key() == other.key()
+
+    def same_build_params(self, other: Optional["IndexManifest"]) -> bool:
+        """除源文件之外的构建输入都相同：已有的向量仍然可用，可以只处理变化的文件。"""
+        if other is None:
+            return False
+        key, other_key = self.key(), other.key()
+        key.pop("sources"), other_key.pop("sources")
+        return key == other_key
+
+
+def build_manifest(paths: Iterable[str], embeddings, splitter_params: Dict[str, Any],
+                   base_dir: Optional[str] = None, index_spec=None) -> IndexManifest:
+    """base_dir: 数据目录，sources 的键相对它；默认取所有源文件的公共目录。"""
+    paths = sorted(paths)
+    if base_dir is None and paths:
+        base_dir = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths])
+    sources = {os.path.relpath(os.path.abspath(p), os.path.abspath(base_dir)): file_sha256(p) for p in paths}
+    return IndexManifest(embedding_model=embedding_model_id(getattr(embeddings, "embeddings", embeddings)),
+                         splitter=dict(splitter_params), sources=sources,
+                         index=index_spec.to_dict() if index_spec and index_spec.index_type != "flat" else {})
+
+
+def read_manifest(index_dir: str) -> Optional[IndexManifest]:
+    path = os.path.join(index_dir, MANIFEST_NAME)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return IndexManifest(**json.load(f))
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def save_index(vectorstore, index_dir: str, manifest: IndexManifest, sidecars: Optional[Dict[str, Any]] = None):
+    """写入临时目录后整体替换，读者要么看到旧索引，要么看到完整的新索引。sidecars 会一并 pickle 保存。"""
+    manifest.num_chunks = vectorstore.index.ntotal
+    manifest.dim = vectorstore.index.d
+    manifest.created_at = time.time()
+    parent = os.path.dirname(os.path.abspath(index_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".rag_index-", dir=parent)
+    try:
+        vectorstore.save_local(tmp_dir)
+        for name, obj in (sidecars or {}).items():
+            with open(os.path.join(tmp_dir, f"{name}.sidecar.pkl"), "wb") as f:
+                pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(asdict(manifest), f, ensure_ascii=False, indent=2)
+        old_dir = None
+        if os.path.exists(index_dir):
+            old_dir = tmp_dir + ".old"
+            os.rename(index_dir, old_dir)
+        os.rename(tmp_dir, index_dir)
+        if old_dir:
+            # 已经 mmap 了旧文件的进程不受影响 (文件被 unlink 后映射仍然有效)
+            shutil.rmtree(old_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def load_index(index_dir: str, embeddings, mmap: bool = True):
+    """
+    加载索引。mmap=True 时向量数据只读映射 (不能再 add)；需要增量写入时传 mmap=False。
+    index.pkl 是我们自己写出的文件，所以这里显式允许反序列化。
+    """
+    import faiss
+    from langchain_community.vectorstores import FAISS
+
+    # IO_FLAG_MMAP_IFC 把索引数据原样映射 (flat / HNSW 也生效)；老版本 faiss 没有它时退回 IO_FLAG_MMAP
+    mmap_flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    io_flags = mmap_flags if mmap else 0
+    return FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True, io_flags=io_flags)
+
+
+def load_sidecar(index_dir: str, name: str):
+    """读取 save_index 写入的附属索引；不存在时返回 None。"""
+    path = os.path.join(index_dir, f"{name}.sidecar.pkl")
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def load_or_build_index(index_dir: str, manifest: IndexManifest, embeddings,
+                        build_fn: Callable[[], Any], mmap: bool = True,
+                        update_fn: Optional[Callable[[Any, IndexManifest], Any]] = None) -> Tuple[Any, bool]:
+    """
+    manifest 匹配 → 直接加载 (返回 (vectorstore, True))
+    只有源文件变化且提供了 update_fn → 可写方式加载旧索引，update_fn(vectorstore, 旧 manifest) 增量更新后保存
+    否则调用 build_fn() 构建、保存，再按同样的方式加载 (后两种都返回 (vectorstore, False))
+    build_fn / update_fn 也可以返回 (vectorstore, {"name": sidecar})，附属索引之后用 load_sidecar 读取；
+    update_fn 返回 None 表示这次变化不能增量处理 (例如会丢掉被去重的内容)，改走全量重建。
+    """
+    previous = read_manifest(index_dir)
+    if manifest.matches(previous):
+        try:
+            return load_index(index_dir, embeddings, mmap=mmap), True
+        except Exception as e:  # 文件损坏等情况：退回重建
+            print(f"⚠️ Failed to load persisted index ({e!r}), rebuilding...")
+    elif update_fn is not None and manifest.same_build_params(previous):
+        try:
+            built = update_fn(load_index(index_dir, embeddings, mmap=False), previous)
+            if built is not None:
+                vectorstore, sidecars = built if isinstance(built, tuple) else (built, None)
+                save_index(vectorstore, index_dir, manifest, sidecars)
+                return (load_index(index_dir, embeddings, mmap=mmap) if mmap else vectorstore), False
+        except Exception as e:  # 增量更新失败不影响正确性：退回全量重建
+            print(f"⚠️ Incremental index update failed ({e!r}), rebuilding...")
+    built = build_fn()
+    vectorstore, sidecars = built if isinstance(built, tuple) else (built, None)
+    save_index(vectorstore, index_dir, manifest, sidecars)
+    # 重新从磁盘加载，保证冷启动和热启动走的是同一条 (mmap) 路径
+    return (load_index(index_dir, embeddings, mmap=mmap) if mmap else vectorstore), False
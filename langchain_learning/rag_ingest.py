@@ -0,0 +1,203 @@
+"""
+流式目录加载 + 切分 (内存占用有上限)
+
+问题背景:
+    08_rag_basic 里 TextLoader(file_path).load() 把整个文件读进内存，
+    split_documents 再把所有 chunk 物化成一个 list，最后才开始建索引。
+    语料是几个 GB 的文档导出时，这条路走不通。
+
+设计 (全部是 generator，一环接一环):
+    iter_files      遍历目录 (按路径排序，结果可复现)
+    iter_segments   按块增量读取文件，在段落边界 ("\\n\\n") 处切出 segment，
+                    单个 segment 不超过 segment_chars (找不到段落边界时退到换行/空格)
+    iter_chunks     对每个 segment 调 splitter，start_index 换算成文件内的全局偏移，
+                    并给每个 chunk 一个稳定 ID: "<source>:<start_index>" (rag_incremental 按它做增量更新)，
+                    source 是相对数据目录的路径，与从哪个工作目录运行无关
+    batched         把 chunk 按固定大小分组
+    ingest_directory 每一组直接 embedding 并写入向量库，然后丢弃
+                    (传入 rag_dedup.NearDuplicateFilter 时，近重复 chunk 在 embedding 之前被过滤掉)
+
+    峰值内存 ≈ segment_chars + batch_size 个 chunk 的文本和向量，与语料总大小无关
+    (向量库本身持有的索引数据除外，那是 "结果" 而不是 ingest 的中间态)。
+
+    注意: segment 边界处不会产生跨边界的 overlap。边界总是选在段落分隔处，
+    而 RecursiveCharacterTextSplitter 的第一级分隔符本来就是 "\\n\\n"，所以对切分结果的影响很小。
+
+Android 类比:
+    用 BufferedReader 一行行读 + RecyclerView 分页加载，而不是 File.readText() 之后一次性塞进 List。
+
+用法:
+    vectorstore, report = ingest_directory("rag_data", embeddings, splitter, batch_size=64)
+    print(report.summary_line())
+"""
+import fnmatch
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+DEFAULT_PATTERNS = ("*.txt", "*.md")
+DEFAULT_SEGMENT_CHARS = 256 * 1024
+READ_BLOCK_CHARS = 64 * 1024
+
+
+def iter_files(root: str, patterns: Sequence[str] = DEFAULT_PATTERNS) -> Iterator[str]:
+    """递归遍历目录，返回匹配的文件路径 (root 也可以直接是一个文件)。"""
+    if os.path.isfile(root):
+        yield root
+        return
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in sorted(filenames):
+            if any(fnmatch.fnmatch(name, p) for p in patterns):
+                yield os.path.join(dirpath, name)
+
+
+def data_root(root: str) -> str:
+    """ingest 的数据目录：root 本身，root 是单个文件时取它所在的目录。"""
+    return root if os.path.isdir(root) else os.path.dirname(os.path.abspath(root))
+
+
+def source_key(path: str, base_dir: Optional[str] = None) -> str:
+    """
+    源文件相对数据目录 base_dir 的规范化路径 (与 rag_index_store.build_manifest 的 sources 键一致)。
+    不依赖当前工作目录；base_dir 默认是文件所在的目录。
+    """
+    return os.path.relpath(os.path.abspath(path), os.path.abspath(base_dir or data_root(path)))
+
+
+def chunk_id(source: str, start_index: int, base_dir: Optional[str] = None) -> str:
+    """同一文件、同一偏移的 chunk 在每次 ingest 里都得到同一个 ID。"""
+    return f"{source_key(source, base_dir)}:{start_index}"
+
+
+def _cut_point(buffer: str, limit: int) -> int:
+    """在 buffer[:limit] 里找最靠后的自然边界；都找不到就硬切。"""
+    for sep in ("\n\n", "\n", " "):
+        pos = buffer.rfind(sep, 0, limit)
+        if pos > 0:
+            return pos + len(sep)
+    return limit
+
+
+def iter_segments(path: str, segment_chars: int = DEFAULT_SEGMENT_CHARS,
+                  encoding: str = "utf-8") -> Iterator[Tuple[int, str]]:
+    """增量读取文件，产出 (segment 在文件中的字符偏移, segment 文本)。"""
+    offset = 0
+    buffer = ""
+    with open(path, encoding=encoding, errors="replace") as f:
+        while True:
+            block = f.read(READ_BLOCK_CHARS)
+            if block:
+                buffer += block
+            while len(buffer) > segment_chars or (not block and buffer):
+                cut = _cut_point(buffer, segment_chars) if len(buffer) > segment_chars else len(buffer)
+                yield offset, buffer[:cut]
+                offset += cut
+                buffer = buffer[cut:]
+            if not block:
+                return
+
+
+def iter_chunks(root: str, splitter, patterns: Sequence[str] = DEFAULT_PATTERNS,
+                segment_chars: int = DEFAULT_SEGMENT_CHARS, stats: Optional["IngestReport"] = None,
+                base_dir: Optional[str] = None) -> Iterator[Document]:
+    """
+    边读边切，产出带 source / start_index 元数据的 Document (有 start_index 时 doc.id 为 chunk_id)。
+    base_dir: chunk ID 里的路径相对的数据目录，默认 data_root(root)。
+    """
+    add_start_index = getattr(splitter, "_add_start_index", False)
+    base_dir = base_dir or data_root(root)
+    for path in iter_files(root, patterns):
+        if stats is not None:
+            stats.files += 1
+        for seg_offset, segment in iter_segments(path, segment_chars):
+            if stats is not None:
+                stats.chars += len(segment)
+            for doc in splitter.create_documents([segment], metadatas=[{"source": path}]):
+                if add_start_index and "start_index" in doc.metadata:
+                    doc.metadata["start_index"] += seg_offset
+                    doc.id = chunk_id(path, doc.metadata["start_index"], base_dir)
+                yield doc
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@dataclass
+class IngestReport:
+    files: int = 0
+    chars: int = 0
+    chunks: int = 0
+    batches: int = 0
+    elapsed_s: float = 0.0
+    duplicates: int = 0              # 被 dedup 过滤掉、没有 embedding 的近重复 chunk
+    index: Optional[dict] = None     # ANN 索引实际使用的参数 (rag_ann.AnnSpec.resolve 的结果)
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.elapsed_s if self.elapsed_s else 0.0
+
+    def summary_line(self) -> str:
+        return (f"{self.files} files, {self.chars:,} chars → {self.chunks} chunks "
+                f"in {self.batches} batches | {self.chunks_per_sec:.0f} chunks/s | {self.elapsed_s:.2f}s"
+                + (f" | {self.duplicates} near-duplicates skipped" if self.duplicates else "")
+                + (f" | index={self.index['index_type']}" if self.index else ""))
+
+
+def ingest_directory(root: str, embeddings, splitter, batch_size: int = 64,
+                     patterns: Sequence[str] = DEFAULT_PATTERNS, segment_chars: int = DEFAULT_SEGMENT_CHARS,
+                     vectorstore=None, on_batch: Optional[Callable[[List[Document]], Any]] = None,
+                     index_spec=None, dedup=None):
+    """
+    流式 ingest：每 batch_size 个 chunk 做一次 embedding 并写入 FAISS。
+    传入 vectorstore 时追加到已有的库，否则用第一批创建。返回 (vectorstore, IngestReport)。
+    on_batch: 每批写入后的回调，用来在同一次遍历里构建其他索引 (例如 BM25Index.add_documents)。
+    index_spec: rag_ann.AnnSpec，新建向量库时使用 IVF / HNSW / IVF-PQ 等 ANN 索引 (默认 flat 精确检索)。
+    dedup: rag_dedup.NearDuplicateFilter，近重复 chunk 不 embedding、不入库 (on_batch 也看不到它们)，
+           其来源在结束时写进 canonical chunk 的 metadata["duplicates"]。
+    """
+    from langchain_community.vectorstores import FAISS
+
+    builder = None
+    if vectorstore is None and index_spec is not None and index_spec.index_type != "flat":
+        from rag_ann import AnnStoreBuilder
+        builder = AnnStoreBuilder(embeddings, index_spec)
+
+    report = IngestReport()
+    start = time.perf_counter()
+    chunks = iter_chunks(root, splitter, patterns, segment_chars, report)
+    if dedup is not None:
+        chunks = dedup.filter_stream(chunks, batch_size)
+    for batch in batched(chunks, batch_size):
+        if builder is not None:
+            builder.add_documents(batch)
+        elif vectorstore is None:
+            vectorstore = FAISS.from_documents(batch, embeddings)
+        else:
+            vectorstore.add_documents(batch)
+        if on_batch is not None:
+            on_batch(batch)
+        report.chunks += len(batch)
+        report.batches += 1
+    if builder is not None:
+        vectorstore = builder.finish()
+        report.index = builder.resolved
+    if dedup is not None:
+        report.duplicates = dedup.report.duplicates
+        if vectorstore is not None:
+            dedup.apply_to_docstore(vectorstore)
+    report.elapsed_s = time.perf_counter() - start
+    if vectorstore is None:
+        raise ValueError(f"No documents matching {list(patterns)} under {root}")
+    return vectorstore, report
@@ -0,0 +1,133 @@
+"""
+向量化的 MMR (Maximal Marginal Relevance) 多样性检索
+
+问题背景:
+    08_rag_basic 的 k=2 相似度检索经常取回两个相邻的 chunk —— 切分时有 overlap，相邻 chunk 几乎重复，
+    白白占掉一半的上下文预算。MMR 在 "与问题相关" 和 "与已选结果不重复" 之间折中:
+        score(d) = λ · sim(q, d) − (1 − λ) · max_{s ∈ 已选} sim(d, s)
+
+设计:
+    - mmr_select: 候选向量先归一化，sim(q, ·) 一次 matvec 算完；每选中一个结果，
+      只需要再算一行 sim(候选, 新选中的) 并用 np.maximum 更新 "与已选集合的最大相似度"。
+      总代价 O(k · fetch_k · dim)，全部是 NumPy 向量操作，没有 Python 层的候选循环。
+      (langchain_community 的 maximal_marginal_relevance 每一轮都重算与全部已选结果的相似度，
+       并在 Python 里逐个候选取 max，fetch_k 上百时明显变慢 —— 见 __main__ 的基准)
+    - fetch_candidates: 从向量库取 fetch_k 个候选 "连同向量"，不重新 embedding:
+        FAISS flat 索引直接读向量视图 (rag_index_store.load_index 加载时是映射的文件)，其他 FAISS 索引用 reconstruct (IVF 先建 direct map)；
+        rag_quantized.QuantizedVectorStore 读 float32 原向量或解码后的低精度向量。
+    - MMRRetriever: LangChain BaseRetriever，k / fetch_k / lambda_mult 可配置。
+
+Android 类比:
+    信息流的 "打散" 策略：同一作者 / 同一话题的内容不连续出现，而不是纯按点击率排序。
+
+用法:
+    retriever = MMRRetriever(vectorstore=vectorstore, k=2, fetch_k=20, lambda_mult=0.5)
+    基准: python rag_mmr.py
+"""
+from typing import Any, List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def mmr_select(query: np.ndarray, candidates: np.ndarray, k: int = 4, lambda_mult: float = 0.5) -> List[int]:
+    """返回被选中的候选下标 (按选中顺序)。相似度为余弦相似度，与 LangChain 的实现一致。"""
+    n = len(candidates)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    cand = _normalize(np.asarray(candidates, dtype=np.float32))
+    relevance = cand @ _normalize(np.asarray(query, dtype=np.float32).ravel())
+    selected = [int(np.argmax(relevance))]
+    max_sim = cand @ cand[selected[0]]          # 每个候选与已选集合的最大相似度
+    taken = np.zeros(n, dtype=bool)
+    taken[selected[0]] = True
+    base = lambda_mult * relevance
+    for _ in range(k - 1):
+        score = base - (1 - lambda_mult) * max_sim
+        score[taken] = -np.inf
+        best = int(np.argmax(score))
+        selected.append(best)
+        taken[best] = True
+        np.maximum(max_sim, cand @ cand[best], out=max_sim)
+    return selected
+
+
+def fetch_candidates(vectorstore, query_vector: Sequence[float], fetch_k: int) -> Tuple[List[Document], np.ndarray]:
+    """按相似度取 fetch_k 个候选文档及其向量 (FAISS 或 QuantizedVectorStore)。"""
+    query = np.asarray(query_vector, dtype=np.float32)[None, :]
+    if hasattr(vectorstore, "search_vectors"):          # rag_quantized.QuantizedVectorStore
+        _, ids = vectorstore.search_vectors(query, fetch_k)
+        ids = ids[0]
+        if vectorstore.full_vectors is not None:
+            vectors = np.asarray(vectorstore.full_vectors[np.sort(ids)], dtype=np.float32)
+            ids = np.sort(ids)
+        else:
+            vectors = vectorstore.vectors.decode(vectorstore.vectors.codes[ids])
+        return [vectorstore.documents[int(i)] for i in ids], vectors
+
+    from rag_quantized import reconstruct_vectors
+
+    index = vectorstore.index
+    # rag_incremental.IncrementalFAISS: 多取墓碑数量的候选，再去掉墓碑
+    dead = vectorstore.dead_positions() if hasattr(vectorstore, "dead_positions") else np.zeros(0, np.int64)
+    _, ids = index.search(query, fetch_k + len(dead))
+    ids = ids[0][(ids[0] >= 0) & ~np.isin(ids[0], dead)][:fetch_k]
+    docs = [vectorstore.docstore.search(vectorstore.index_to_docstore_id[int(i)]) for i in ids]
+    return docs, reconstruct_vectors(index, ids)
+
+
+class MMRRetriever(BaseRetriever):
+    """先取 fetch_k 个最相似的候选，再用 MMR 选出 k 个互不重复的结果。"""
+
+    vectorstore: Any
+    k: int = 4
+    fetch_k: int = 20
+    lambda_mult: float = 0.5     # 1.0 = 纯相关性，0.0 = 纯多样性
+
+    def _select(self, query_vector) -> List[Document]:
+        docs, vectors = fetch_candidates(self.vectorstore, query_vector, self.fetch_k)
+        return [docs[i] for i in mmr_select(np.asarray(query_vector), vectors, self.k, self.lambda_mult)]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self._select(self.vectorstore.embeddings.embed_query(query))
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        return self._select(await self.vectorstore.embeddings.aembed_query(query))
+
+
+if __name__ == "__main__":
+    # 与 langchain_community 的实现对比：python rag_mmr.py
+    import time
+
+    from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+    from perf_metrics import summarize
+
+    rng = np.random.default_rng(0)
+    dim, k = 1536, 8
+    print(f"MMR select k={k}, dim={dim}")
+    print(f"{'fetch_k':>8}{'numpy p50 ms':>14}{'langchain p50 ms':>18}{'speedup':>9}{'same':>6}")
+    for fetch_k in (20, 100, 300, 1000):
+        timings = {"numpy": [], "langchain": []}
+        same = True
+        for _ in range(20):
+            query = rng.standard_normal(dim).astype(np.float32)
+            cands = (query + rng.standard_normal((fetch_k, dim)) * 2).astype(np.float32)
+            t = time.perf_counter()
+            ours = mmr_select(query, cands, k, 0.5)
+            timings["numpy"].append(time.perf_counter() - t)
+            t = time.perf_counter()
+            theirs = maximal_marginal_relevance(query, list(cands), 0.5, k)
+            timings["langchain"].append(time.perf_counter() - t)
+            same &= ours == theirs
+        ours_p50 = summarize(timings["numpy"])["p50"]
+        theirs_p50 = summarize(timings["langchain"])["p50"]
+        print(f"{fetch_k:>8}{ours_p50 * 1000:>14.3f}{theirs_p50 * 1000:>18.3f}{theirs_p50 / ours_p50:>8.1f}x{str(same):>6}")
@@ -0,0 +1,402 @@
+"""
+低精度向量存储 (float16 / int8)，NumPy 向量化打分 + 可选的全精度重排
+
+问题背景:
+    text-embedding-3-small 每个 chunk 是 1536 个 float32 ≈ 6KB，08_rag_basic 的内存 FAISS 库
+    在 worker 进程里的常驻内存几乎全是这些向量。
+
+设计:
+    - QuantizedVectors: 只在内存里保留低精度编码
+        float16  每维 2 字节 (省 50%)，精度损失很小
+        int8     按维度做标量量化 (scalar quantization): code = round((x - lo) / scale)，每维 1 字节 (省 75%)
+                 lo / scale 从数据里按维度统计 (min/max)，比全局统一的量化区间误差小得多
+    - 打分: 平方 L2 距离 ||q - x̂||² = ||q||² - 2·q·x̂ + ||x̂||²
+        ||x̂||² 在编码时预先算好；q·x̂ = q·lo + (q·scale)·code，只需要一次 "编码矩阵 × 向量"。
+        按 4096 行分块把编码转成 float32 做 matmul，临时内存有上限，也能吃到 BLAS 的向量化。
+        注意 NumPy 的 float16 → float32 转换没有硬件加速，float16 打分反而比 int8 慢 (见 __main__ 的基准)。
+    - 全精度重排 (rescore): 先用低精度分数取 k * rescore_factor 个候选，再用 float32 原向量精确排序。
+      原向量不常驻内存：来自 mmap 的 .npy 文件，或 rag_index_store.load_index (IO_FLAG_MMAP_IFC) 映射的
+      FAISS flat 索引 (零拷贝视图)，只有被选中的候选行会被读入 (page cache 在进程间共享，不计入每个 worker 的私有内存)。
+      在内存里构建、没有经过 load_index 的 FAISS 索引则是一份完整的私有 float32 拷贝：from_faiss 默认
+      只在索引确实是映射的文件时才用它重排，否则只保留低精度编码 (rescore=True 可强制保留，内存报告会计入)。
+    - QuantizedVectorStore 实现 LangChain VectorStore 接口，as_retriever() / HybridRetriever 可以直接使用；
+      from_faiss() 把已有的 FAISS 库转成低精度存储。
+    - memory_report() 报告实际常驻的内存 (编码 + 私有的 float32 重排副本，映射的文件不计入)；
+      python rag_quantized.py 报告各模式的内存、recall 损失和打分延迟。
+    - 代价: 这里用 NumPy 分块解码打分，单条查询比 FAISS IndexFlat 慢 (20k × 1536 维: int8 ~30ms，
+      IndexFlat ~13ms，faiss.IndexScalarQuantizer(QT_8bit) ~4ms)，float16 更慢。换来的只是内存，不是速度。
+
+Android 类比:
+    Bitmap 从 ARGB_8888 换成 RGB_565：每像素少一半内存，肉眼几乎看不出差别；需要原图时再从磁盘解码。
+
+用法:
+    store = QuantizedVectorStore.from_faiss(faiss_store, dtype="int8")   # 映射加载的 flat 索引自动用于重排
+    docs = store.similarity_search("home office budget", k=2)
+    print(store.memory_report().summary_line())
+"""
+import os
+import pickle
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+DTYPES = ("float16", "int8")
+BLOCK_ROWS = 4096
+DEFAULT_RESCORE_FACTOR = 4
+
+
+# ==========================================
+# 低精度编码 + 向量化打分
+# ==========================================
+
+class QuantizedVectors:
+    def __init__(self, dtype: str = "int8"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown dtype {dtype!r}, expected one of {DTYPES}")
+        self.dtype = dtype
+        self.dim = 0
+        self.codes = np.zeros((0, 0), dtype=np.float16 if dtype == "float16" else np.uint8)
+        self.norms = np.zeros(0, dtype=np.float32)      # ||x̂||²，按解码后的值计算，保证距离自洽
+        self.lo: Optional[np.ndarray] = None            # int8: 每维的下界
+        self.scale: Optional[np.ndarray] = None         # int8: 每维的步长
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        extra = 0 if self.lo is None else self.lo.nbytes + self.scale.nbytes
+        return self.codes.nbytes + self.norms.nbytes + extra
+
+    def fit(self, vectors: np.ndarray) -> "QuantizedVectors":
+        """int8 需要先统计每维的取值范围；之后 add 的向量超出范围时会被截断。"""
+        self.dim = vectors.shape[1]
+        if self.dtype == "int8":
+            lo, hi = vectors.min(axis=0), vectors.max(axis=0)
+            self.lo = lo.astype(np.float32)
+            self.scale = np.maximum((hi - lo) / 255.0, 1e-12).astype(np.float32)
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        if self.dtype == "float16":
+            return vectors.astype(np.float16)
+        codes = np.rint((vectors - self.lo) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        if self.dtype == "float16":
+            return codes.astype(np.float32)
+        return self.lo + codes.astype(np.float32) * self.scale
+
+    def add(self, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not self.dim:
+            self.fit(vectors)
+        codes = self.encode(vectors)
+        decoded = self.decode(codes)
+        self.codes = np.concatenate([self.codes.reshape(-1, self.dim), codes]) if len(self.codes) else codes
+        self.norms = np.concatenate([self.norms, np.einsum("ij,ij->i", decoded, decoded)])
+
+    def distances(self, queries: np.ndarray) -> np.ndarray:
+        """queries (m, d) → 平方 L2 距离 (m, n)，按块计算。"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self.dtype == "float16":
+            weights, bias = queries.T, 0.0
+        else:
+            weights = (queries * self.scale).T                  # (d, m)
+            bias = queries @ self.lo                            # (m,)
+        out = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        for lo in range(0, len(self.codes), BLOCK_ROWS):
+            block = self.codes[lo:lo + BLOCK_ROWS].astype(np.float32)
+            out[:, lo:lo + BLOCK_ROWS] = (block @ weights).T
+        out += bias if np.isscalar(bias) else bias[:, None]
+        q_norms = np.einsum("ij,ij->i", queries, queries)
+        return q_norms[:, None] - 2 * out + self.norms[None, :]
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """返回 (distances, ids)，形状都是 (m, k)，按距离升序。"""
+        dist = self.distances(queries)
+        k = min(k, dist.shape[1])
+        if k == 0:
+            return np.zeros((len(dist), 0), np.float32), np.zeros((len(dist), 0), np.int64)
+        ids = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        part = np.take_along_axis(dist, ids, axis=1)
+        order = np.argsort(part, axis=1, kind="stable")
+        return np.take_along_axis(part, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+def rescore(queries: np.ndarray, candidate_ids: np.ndarray, full_vectors, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """用 float32 原向量对候选精确重排。full_vectors 只需支持 full_vectors[ids] (np.memmap / ndarray)。"""
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    out_d = np.empty((len(queries), min(k, candidate_ids.shape[1])), dtype=np.float32)
+    out_i = np.empty_like(out_d, dtype=np.int64)
+    for row, (q, ids) in enumerate(zip(queries, candidate_ids)):
+        rows = np.sort(ids)                                   # 顺序读 mmap 页
+        diff = np.asarray(full_vectors[rows], dtype=np.float32) - q
+        dist = np.einsum("ij,ij->i", diff, diff)
+        top = np.argsort(dist, kind="stable")[:out_d.shape[1]]
+        out_d[row], out_i[row] = dist[top], rows[top]
+    return out_d, out_i
+
+
+def faiss_flat_view(index) -> Optional[np.ndarray]:
+    """IndexFlat 的向量数据的零拷贝 numpy 视图 (IO_FLAG_MMAP_IFC 加载时指向映射的文件)；其他索引类型返回 None。"""
+    import faiss
+
+    if not isinstance(index, faiss.IndexFlat):
+        return None
+    n, d = index.ntotal, index.d
+    return faiss.rev_swig_ptr(index.get_xb(), n * d).reshape(n, d)
+
+
+def is_mapped_index(index) -> bool:
+    """索引数据是否是映射的文件 (IO_FLAG_MMAP_IFC 加载)，而不是进程私有的内存。"""
+    # 新版 faiss 的 codes 是 MaybeOwnedVector，映射时 is_owned=False；老版本是 std::vector，总是私有
+    return not getattr(getattr(index, "codes", None), "is_owned", True)
+
+
+def reconstruct_vectors(index, ids) -> np.ndarray:
+    """按位置取回 float32 向量：flat 索引读视图，IVF 系列先建 direct map，其他索引 reconstruct_batch。"""
+    import faiss
+
+    ids = np.asarray(ids, dtype=np.int64)
+    view = faiss_flat_view(index)
+    if view is not None:
+        return np.asarray(view[ids], dtype=np.float32)
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:     # 不是 IVF 索引
+        ivf = None
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+    return index.reconstruct_batch(ids)
+
+
+class SelectedRows:
+    """
+    base 的部分行 (按 rows 重新编号) 的惰性视图，满足 rescore 对 full_vectors 的要求:
+    只在 [ids] 时读取选中的行，不复制整份数据。
+    """
+
+    def __init__(self, base, rows: np.ndarray):
+        self.base = base
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, ids):
+        return self.base[self.rows[ids]]
+
+    @property
+    def nbytes(self) -> int:
+        return self.base.nbytes          # 常驻的是整份 base (含跳过的行)
+
+
+# ==========================================
+# LangChain VectorStore
+# ==========================================
+
+@dataclass
+class MemoryReport:
+    num_vectors: int
+    dim: int
+    dtype: str
+    float32_bytes: int
+    stored_bytes: int               # 低精度编码
+    rescore: bool
+    rescore_bytes: int = 0          # 重排用的 float32 原向量里进程私有的部分 (映射的文件为 0)
+
+    @property
+    def resident_bytes(self) -> int:
+        return self.stored_bytes + self.rescore_bytes
+
+    @property
+    def saved_ratio(self) -> float:
+        return 1 - self.resident_bytes / self.float32_bytes if self.float32_bytes else 0.0
+
+    def summary_line(self) -> str:
+        if not self.rescore:
+            source = " | no float32 rescore"
+        elif self.rescore_bytes:
+            source = f" | float32 rescore from a private copy ({self.rescore_bytes / 1024:.1f}KB)"
+        else:
+            source = " | float32 rescore from mmap"
+        return (f"{self.num_vectors} vectors x {self.dim}d as {self.dtype}: "
+                f"{self.resident_bytes / 1024:.1f}KB resident vs {self.float32_bytes / 1024:.1f}KB float32 "
+                f"({self.saved_ratio:.0%} saved){source}")
+
+
+class QuantizedVectorStore(VectorStore):
+    def __init__(self, embedding, dtype: str = "int8", full_vectors=None,
+                 rescore_factor: int = DEFAULT_RESCORE_FACTOR, _keepalive: Any = None):
+        self.embedding = embedding
+        self.vectors = QuantizedVectors(dtype)
+        self.documents: List[Document] = []
+        self.full_vectors = full_vectors          # 可选：float32 原向量 (mmap)，用于重排
+        self.rescore_factor = rescore_factor
+        self._keepalive = _keepalive              # full_vectors 是 FAISS 索引的视图时，持有索引本身
+        # full_vectors 是否是映射的文件 (np.load(mmap_mode="r") / 映射加载的 FAISS 索引)，决定它算不算常驻内存
+        self.full_vectors_mapped = isinstance(full_vectors, np.memmap)
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return self._euclidean_relevance_score_fn
+
+    # ---------- 写入 ----------
+    def add_vectors(self, vectors: np.ndarray, documents: Sequence[Document]) -> List[str]:
+        start = len(self.documents)
+        self.vectors.add(vectors)
+        self.documents.extend(documents)
+        if self.full_vectors is not None and len(self.full_vectors) < len(self.documents):
+            self.full_vectors = None   # 新增的向量没有全精度副本，重排不再可用
+        return [str(i) for i in range(start, len(self.documents))]
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.asarray(self.embedding.embed_documents(texts), dtype=np.float32)
+        return self.add_vectors(vectors, [Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)])
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding, metadatas: Optional[List[dict]] = None,
+                   dtype: str = "int8", **kwargs) -> "QuantizedVectorStore":
+        store = cls(embedding, dtype=dtype, **kwargs)
+        store.add_texts(texts, metadatas)
+        return store
+
+    @classmethod
+    def from_faiss(cls, faiss_store, dtype: str = "int8", rescore: Optional[bool] = None,
+                   rescore_factor: int = DEFAULT_RESCORE_FACTOR) -> "QuantizedVectorStore":
+        """
+        从 LangChain FAISS 库转换。flat 索引的重排直接读索引自身的向量 (零拷贝视图):
+          rescore=None (默认)  只有索引是映射的文件 (load_index 加载) 时才重排；
+                               内存里的索引不保留，否则整份 float32 仍然常驻，低精度存储反而更占内存
+          rescore=True         总是重排 (私有的 float32 副本会计入 memory_report)
+          rescore=False        只保留低精度编码
+        其他索引类型只保留低精度编码。
+        rag_incremental.IncrementalFAISS 的墓碑位置直接跳过 (不修改传入的库，也不压缩它)：
+        转换后的位置里没有已删除的 chunk，重排时经 SelectedRows 映射回索引里的原位置。
+        """
+        index = faiss_store.index
+        dead_positions = getattr(faiss_store, "dead_positions", None)
+        live = np.ones(index.ntotal, dtype=bool)
+        if dead_positions is not None:
+            live[dead_positions()] = False
+        mapped = is_mapped_index(index)
+        view = faiss_flat_view(index) if rescore or (rescore is None and mapped) else None
+        full_vectors = view if view is None or live.all() else SelectedRows(view, np.flatnonzero(live))
+        store = cls(faiss_store.embedding_function, dtype=dtype, full_vectors=full_vectors,
+                    rescore_factor=rescore_factor, _keepalive=index if view is not None else None)
+        store.full_vectors_mapped = mapped
+        docstore, id_map = faiss_store.docstore, faiss_store.index_to_docstore_id
+        documents = [docstore.search(id_map[int(i)]) for i in np.flatnonzero(live)]
+        for lo in range(0, index.ntotal, 65536):   # 分块转换，避免一次性物化全部 float32
+            hi = min(index.ntotal, lo + 65536)
+            block = view[lo:hi] if view is not None else index.reconstruct_n(lo, hi - lo)
+            keep = live[lo:hi]
+            store.vectors.add(block if keep.all() else block[keep])
+        store.documents = documents
+        return store
+
+    # ---------- 检索 ----------
+    def search_vectors(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self.full_vectors is None or self.rescore_factor <= 1:
+            return self.vectors.search(queries, k)
+        _, candidates = self.vectors.search(queries, k * self.rescore_factor)
+        return rescore(queries, candidates, self.full_vectors, k)
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               **kwargs) -> List[Tuple[Document, float]]:
+        if not self.documents:
+            return []
+        dist, ids = self.search_vectors(np.asarray(embedding, dtype=np.float32)[None, :], k)
+        return [(self.documents[int(i)], float(d)) for d, i in zip(dist[0], ids[0])]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _similarity_search_with_relevance_scores(self, query: str, k: int = 4, **kwargs):
+        fn = self._select_relevance_score_fn()
+        return [(doc, fn(score)) for doc, score in self.similarity_search_with_score(query, k)]
+
+    # ---------- 统计 / 持久化 ----------
+    def memory_report(self) -> MemoryReport:
+        n, d = len(self.vectors), self.vectors.dim
+        rescore = self.full_vectors is not None
+        private = self.full_vectors.nbytes if rescore and not self.full_vectors_mapped else 0
+        return MemoryReport(num_vectors=n, dim=d, dtype=self.vectors.dtype, float32_bytes=n * d * 4,
+                            stored_bytes=self.vectors.nbytes, rescore=rescore, rescore_bytes=private)
+
+    def save(self, path: str, full_vectors: Optional[np.ndarray] = None):
+        """codes + documents 写入 store.pkl；传入 full_vectors 时另存 full.npy，load 时 mmap 打开用于重排。"""
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "store.pkl"), "wb") as f:
+            pickle.dump({"vectors": self.vectors, "documents": self.documents,
+                         "rescore_factor": self.rescore_factor}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        if full_vectors is not None:
+            np.save(os.path.join(path, "full.npy"), np.asarray(full_vectors, dtype=np.float32))
+
+    @classmethod
+    def load(cls, path: str, embedding) -> "QuantizedVectorStore":
+        with open(os.path.join(path, "store.pkl"), "rb") as f:
+            state = pickle.load(f)
+        full_path = os.path.join(path, "full.npy")
+        full = np.load(full_path, mmap_mode="r") if os.path.exists(full_path) else None
+        store = cls(embedding, dtype=state["vectors"].dtype, full_vectors=full,
+                    rescore_factor=state["rescore_factor"])
+        store.vectors, store.documents = state["vectors"], state["documents"]
+        return store
+
+
+if __name__ == "__main__":
+    # 内存 / recall 基准：python rag_quantized.py [向量数，默认 100000] [维度，默认 1536]
+    import sys
+
+    from bench_ann import make_vectors, recall_at_k
+    from perf_metrics import summarize
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 1536
+    k, n_queries = 8, 100
+    data = make_vectors(n + n_queries, dim)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)        # OpenAI 的 embedding 是单位长度
+    base, queries = data[:n], data[n:]
+
+    # 以 float32 精确结果为准 (排序只需要 ||x||² - 2·q·x)
+    exact = np.einsum("ij,ij->i", base, base)[None, :] - 2 * queries @ base.T
+    truth = np.argsort(exact, axis=1)[:, :k]
+
+    print(f"{n:,} vectors x {dim}d, {n_queries} queries, recall@{k} vs float32")
+    print(f"{'mode':<16}{'memory MB':>11}{'saved':>8}{'recall':>9}{'p50 ms':>9}{'p95 ms':>9}")
+    for dtype, use_rescore in (("float16", False), ("int8", False), ("int8", True)):
+        qv = QuantizedVectors(dtype)
+        qv.add(base)
+        found, latencies = [], []
+        for q in queries:
+            t = time.perf_counter()
+            if use_rescore:
+                _, cand = qv.search(q, k * DEFAULT_RESCORE_FACTOR)
+                _, ids = rescore(q, cand, base, k)
+            else:
+                _, ids = qv.search(q, k)
+            latencies.append(time.perf_counter() - t)
+            found.append(ids[0])
+        stats = summarize(latencies)
+        name = dtype + (" + rescore" if use_rescore else "")
+        print(f"{name:<16}{qv.nbytes / (1 << 20):>11.1f}{1 - qv.nbytes / base.nbytes:>8.0%}"
+              f"{recall_at_k(np.array(found), truth):>9.3f}{stats['p50'] * 1000:>9.2f}{stats['p95'] * 1000:>9.2f}")
+    print(f"{'float32':<16}{base.nbytes / (1 << 20):>11.1f}{'0%':>8}{1.0:>9.3f}")
@@ -0,0 +1,290 @@
+"""
+混合检索：BM25 倒排索引 + 向量检索，Reciprocal Rank Fusion 融合
+
+问题背景:
+    08_rag_basic 的 as_retriever(search_type="similarity", k=2) 是纯稠密检索。
+    "business class"、"4.1.2" 这类精确词/编号的查询经常被漏掉，只好把 k 调大，Prompt 随之变长、变贵。
+
+设计:
+    - BM25Index: 进程内倒排索引，ingest 时按批 add_documents，finalize() 后转成 CSR 结构:
+        terms → [offsets]，postings 为 (doc_id: int32, impact: float32)
+      impact 在 finalize 时就按 BM25 公式算好 (idf * tf 归一化)，查询只剩 "取 postings + 累加 + top-k"，
+      用 numpy 向量化完成；df 超过 max_df_ratio 的词 (类似停用词) 查询时跳过。
+      增量更新 (rag_incremental): delete_documents 只做标记，下次 finalize 时丢弃它们的 postings；
+      replace_document 原地替换内容不变的 chunk (元数据变化)；compact() 按标记物理删除并重新编号。
+      百万 chunk 的合成语料上，三词查询 p50 ≈ 0.4ms、p95 ≈ 1.2ms (见 __main__ 的基准)。
+    - 分词: 英文/数字按词 (保留 "4.1.2"、"gpt-4" 这种带点/连字符的编号)，中日韩文字按单字 + 相邻二元组。
+    - HybridRetriever: 稠密与 BM25 各取 fetch_k 条，按 RRF 融合:
+        score(d) = Σ weight_i / (rrf_k + rank_i(d))
+      RRF 只看名次不看分数，两种检索的分数量纲不同也无所谓。
+
+Android 类比:
+    本地搜索同时查 Room 的 FTS 全文索引和语义向量，再把两路结果按名次合并 —— 类似 Feed 流的多路召回 + 融合排序。
+
+用法:
+    bm25 = BM25Index(); bm25.add_documents(chunks); bm25.finalize()
+    retriever = HybridRetriever(vector_retriever=vectorstore.as_retriever(search_kwargs={"k": 8}), bm25=bm25, k=2)
+"""
+import re
+import time
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*|[一-鿿぀-ヿ가-힯]+")
+_CJK_RE = re.compile(r"[一-鿿぀-ヿ가-힯]")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i if in is it its may of on or our "
+    "so that the their this to was we what when which who will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in _WORD_RE.findall(text.lower()):
+        if _CJK_RE.match(match):
+            # 中文没有空格，用单字 + 二元组兼顾召回和精度
+            tokens.extend(match)
+            tokens.extend(match[i:i + 2] for i in range(len(match) - 1))
+        elif match not in STOPWORDS:
+            tokens.append(match)
+    return tokens
+
+
+def doc_key(doc: Document) -> Tuple:
+    """跨检索器识别同一个 chunk: (来源, 起始偏移, 内容)。"""
+    return doc.metadata.get("source"), doc.metadata.get("start_index"), doc.page_content
+
+
+# ==========================================
+# BM25 倒排索引
+# ==========================================
+
+class BM25Index:
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_df_ratio: float = 0.5):
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self.documents: List[Document] = []
+        self.vocab: Dict[str, int] = {}
+        # 构建阶段：扁平的 (term_id, doc_id, tf) 三元组，array 比 list of tuple 省一个数量级的内存
+        self._term_ids = array("i")
+        self._doc_ids = array("i")
+        self._tfs = array("H")
+        self._doc_lens = array("i")
+        # finalize 之后的 CSR 结构
+        self.offsets: Optional[np.ndarray] = None
+        self.postings_doc: Optional[np.ndarray] = None
+        self.postings_impact: Optional[np.ndarray] = None
+        self.df: Optional[np.ndarray] = None
+        self.deleted: Set[int] = set()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault("deleted", set())   # 旧版本 pickle 的 sidecar 没有这个字段
+
+    def __len__(self):
+        return len(self.documents)
+
+    @property
+    def num_live(self) -> int:
+        return len(self.documents) - len(self.deleted)
+
+    def add_documents(self, docs: Iterable[Document]):
+        for doc in docs:
+            doc_id = len(self.documents)
+            self.documents.append(doc)
+            counts = Counter(tokenize(doc.page_content))
+            self._doc_lens.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_id = self.vocab.setdefault(term, len(self.vocab))
+                self._term_ids.append(term_id)
+                self._doc_ids.append(doc_id)
+                self._tfs.append(min(tf, 65535))
+        self.offsets = None  # 有新文档，需要重新 finalize
+
+    def delete_documents(self, doc_ids: Iterable[int]):
+        self.deleted.update(doc_ids)
+        self.offsets = None
+
+    def replace_document(self, doc_id: int, doc: Document):
+        """只用于正文不变、元数据 (例如 start_index) 变化的 chunk，postings 不需要重算。"""
+        self.documents[doc_id] = doc
+
+    def compact(self) -> int:
+        """物理删除被标记的文档，doc_id 重新连续编号。返回删除的文档数。"""
+        if not self.deleted:
+            return 0
+        keep = np.ones(len(self.documents), dtype=bool)
+        keep[list(self.deleted)] = False
+        new_ids = (np.cumsum(keep) - 1).astype(np.int32)
+        doc_ids = np.frombuffer(self._doc_ids, dtype=np.int32)
+        mask = keep[doc_ids]
+        self._term_ids = array("i", np.frombuffer(self._term_ids, dtype=np.int32)[mask].tobytes())
+        self._tfs = array("H", np.frombuffer(self._tfs, dtype=np.uint16)[mask].tobytes())
+        self._doc_ids = array("i", new_ids[doc_ids[mask]].tobytes())
+        self._doc_lens = array("i", np.frombuffer(self._doc_lens, dtype=np.int32)[keep].tobytes())
+        self.documents = [doc for doc, k in zip(self.documents, keep) if k]
+        removed = len(self.deleted)
+        self.deleted = set()
+        self.offsets = None
+        return removed
+
+    def finalize(self) -> "BM25Index":
+        term_ids = np.frombuffer(self._term_ids, dtype=np.int32) if len(self._term_ids) else np.zeros(0, np.int32)
+        doc_ids = np.frombuffer(self._doc_ids, dtype=np.int32) if len(self._doc_ids) else np.zeros(0, np.int32)
+        tfs = np.frombuffer(self._tfs, dtype=np.uint16).astype(np.float32) if len(self._tfs) else np.zeros(0, np.float32)
+        doc_lens = np.frombuffer(self._doc_lens, dtype=np.int32).astype(np.float32) if len(self._doc_lens) else np.zeros(0, np.float32)
+        if self.deleted:  # 被删除的文档不产生 postings，也不计入 idf / 平均长度
+            live = np.ones(len(doc_lens), dtype=bool)
+            live[list(self.deleted)] = False
+            mask = live[doc_ids]
+            term_ids, doc_ids, tfs = term_ids[mask], doc_ids[mask], tfs[mask]
+            avgdl = float(doc_lens[live].mean()) if live.any() else 1.0
+        else:
+            avgdl = float(doc_lens.mean()) if len(doc_lens) else 1.0
+
+        order = np.argsort(term_ids, kind="stable")
+        term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+        n_terms = len(self.vocab)
+        self.df = np.bincount(term_ids, minlength=n_terms).astype(np.int32)
+        self.offsets = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(self.df, out=self.offsets[1:])
+
+        n_docs = max(self.num_live, 1)
+        idf = np.log1p((n_docs - self.df + 0.5) / (self.df + 0.5)).astype(np.float32)
+        norm = self.k1 * (1 - self.b + self.b * doc_lens[doc_ids] / max(avgdl, 1e-9))
+        self.postings_impact = (idf[term_ids] * tfs * (self.k1 + 1) / (tfs + norm)).astype(np.float32)
+        self.postings_doc = doc_ids.astype(np.int32)
+        return self
+
+    def search_ids(self, query: str, k: int = 4) -> List[Tuple[int, float]]:
+        if self.offsets is None:
+            self.finalize()
+        n_docs = len(self.documents)
+        if not self.num_live:
+            return []
+        max_df = max(1, int(self.max_df_ratio * self.num_live))
+        ids_parts, weight_parts = [], []
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None or self.df[term_id] > max_df:
+                continue
+            lo, hi = self.offsets[term_id], self.offsets[term_id + 1]
+            ids_parts.append(self.postings_doc[lo:hi])
+            weight_parts.append(self.postings_impact[lo:hi])
+        if not ids_parts:
+            return []
+        if len(ids_parts) == 1:
+            candidates, scores = ids_parts[0], weight_parts[0]
+        else:
+            # 每个词的 postings 内部 doc_id 不重复，逐词 scatter-add 到稠密数组 (np.zeros 由 calloc 惰性清零)
+            dense = np.zeros(n_docs, dtype=np.float32)
+            for ids, weights in zip(ids_parts, weight_parts):
+                dense[ids] += weights
+            # 候选里同一个 doc 最多出现 "命中词数" 次且分数相同，多取 k * 词数 条再去重即可，不必 unique 整个数组
+            candidates = np.concatenate(ids_parts)
+            scores = dense[candidates]
+        fetch = min(k * len(ids_parts), len(candidates))
+        top = np.argpartition(-scores, fetch - 1)[:fetch]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        results, seen = [], set()
+        for i in top:
+            doc_id = int(candidates[i])
+            if doc_id not in seen:
+                seen.add(doc_id)
+                results.append((doc_id, float(scores[i])))
+                if len(results) == k:
+                    break
+        return results
+
+    def search(self, query: str, k: int = 4) -> List[Document]:
+        return [self.documents[i] for i, _ in self.search_ids(query, k)]
+
+
+# ==========================================
+# RRF 融合
+# ==========================================
+
+def reciprocal_rank_fusion(result_lists: Sequence[List[Document]], k: int = 4, rrf_k: int = 60,
+                           weights: Optional[Sequence[float]] = None) -> List[Document]:
+    weights = weights or [1.0] * len(result_lists)
+    scores: Dict[Tuple, float] = {}
+    docs: Dict[Tuple, Document] = {}
+    for results, weight in zip(result_lists, weights):
+        for rank, doc in enumerate(results, start=1):
+            key = doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    ranked = sorted(scores, key=lambda key: -scores[key])[:k]
+    return [docs[key] for key in ranked]
+
+
+class HybridRetriever(BaseRetriever):
+    """稠密检索 + BM25，各取 fetch_k 条，RRF 融合后返回 k 条。"""
+
+    vector_retriever: Any
+    bm25: Any
+    k: int = 4
+    fetch_k: int = 8
+    rrf_k: int = 60
+    weights: Tuple[float, float] = (1.0, 1.0)   # (dense, bm25)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        dense = self.vector_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        sparse = self.bm25.search(query, self.fetch_k)
+        return reciprocal_rank_fusion([dense[:self.fetch_k], sparse], self.k, self.rrf_k, self.weights)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        dense = await self.vector_retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        sparse = self.bm25.search(query, self.fetch_k)  # 亚毫秒级，不值得切线程
+        return reciprocal_rank_fusion([dense[:self.fetch_k], sparse], self.k, self.rrf_k, self.weights)
+
+    def batch(self, inputs: List[str], config=None, *, return_exceptions: bool = False, **kwargs) -> List[List[Document]]:
+        from rag_batch_search import batch_with_runs
+
+        def search(queries, runs):
+            # vector_retriever 是 rag_batch_search.BatchVectorRetriever 时，整批问题的稠密检索是一次矩阵运算；
+            # 每个问题的稠密检索 run 挂在对应的 hybrid run 下面
+            dense = self.vector_retriever.batch(queries, [{"callbacks": run.get_child()} for run in runs])
+            return [reciprocal_rank_fusion([d[:self.fetch_k], self.bm25.search(q, self.fetch_k)], self.k,
+                                           self.rrf_k, self.weights) for q, d in zip(queries, dense)]
+
+        return batch_with_runs(self, inputs, config, search, return_exceptions)
+
+
+if __name__ == "__main__":
+    # 词法检索基准：python rag_retrievers.py [chunk 数，默认 1,000,000]
+    import random
+    import sys
+
+    from perf_metrics import summarize
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = np.random.default_rng(0)
+    vocab = np.array([f"w{i}" for i in range(50_000)])
+    probs = 1 / np.arange(1, len(vocab) + 1)   # Zipf 分布，接近真实语料
+    probs /= probs.sum()
+    print(f"Building BM25 over {n:,} synthetic chunks...")
+    start = time.perf_counter()
+    index = BM25Index()
+    for base in range(0, n, 100_000):
+        words = vocab[rng.choice(len(vocab), size=(min(100_000, n - base), 40), p=probs)]
+        index.add_documents(Document(page_content=" ".join(row)) for row in words)
+    index.finalize()
+    print(f"built in {time.perf_counter() - start:.1f}s, {len(index.vocab):,} terms, "
+          f"{len(index.postings_doc):,} postings")
+    picker = random.Random(0)
+    queries = [" ".join(picker.sample(list(vocab[20:5000]), 3)) for _ in range(500)]
+    latencies = []
+    for q in queries:
+        t = time.perf_counter()
+        index.search_ids(q, 8)
+        latencies.append(time.perf_counter() - t)
+    stats = summarize(latencies)
+    print(f"search: p50={stats['p50'] * 1000:.3f}ms p95={stats['p95'] * 1000:.3f}ms p99={stats['p99'] * 1000:.3f}ms")
@@ -0,0 +1,157 @@
+"""
+按 token 计长的高速递归切分器
+
+问题背景:
+    08_rag_basic 的 ingest CPU 时间主要花在 RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50) 上，
+    而且它按 "字符数" 计长，chunk 大小和模型的 token 上限对不齐 (中文 500 字 ≈ 500 token，英文 500 字 ≈ 125 token)。
+
+设计:
+    - 与 RecursiveCharacterTextSplitter 相同的分隔符层级 ["\\n\\n", "\\n", " ", ""]、
+      相同的合并/overlap 规则 (分隔符保留在下一段开头)，只是长度函数换成 token 数 (tokens.py)。
+    - 更快的原因:
+        1. 全程只操作 (start, end) 下标，不做 regex split，也不反复拼接字符串
+        2. 每个片段的 token 数只算一次并缓存 (原实现在判定和合并阶段会对同一片段重复计长)
+        3. start_index 直接来自下标，不需要 text.find() 回查
+           (原实现用 chunk_overlap 推算查找起点，按 token 计长时单位对不上，重复文本会定位到错误的位置)
+    - 对外接口与 LangChain 的 TextSplitter 一致: split_text / create_documents / split_documents，
+      可以直接替换进 rag_ingest.ingest_directory。
+
+Android 类比:
+    同样的布局规则，从 "按 px" 改成 "按 dp" 计量；实现上从反复 measure 改成缓存 measure 结果。
+
+用法:
+    splitter = FastRecursiveSplitter(chunk_size=128, chunk_overlap=12, add_start_index=True)
+    docs = splitter.split_documents(docs)
+"""
+import copy
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from tokens import count_tokens
+
+DEFAULT_SEPARATORS = ("\n\n", "\n", " ", "")
+
+
+class FastRecursiveSplitter:
+    """
+    - chunk_size / chunk_overlap: 以 length_function 为单位 (默认 token 数)
+    - separators:  从粗到细的分隔符层级
+    - add_start_index: 在 metadata 中记录 chunk 在原文中的字符偏移
+    """
+
+    def __init__(self, chunk_size: int = 128, chunk_overlap: int = 12,
+                 separators: Sequence[str] = DEFAULT_SEPARATORS,
+                 length_function: Callable[[str], int] = count_tokens,
+                 add_start_index: bool = False, strip_whitespace: bool = True):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must not exceed chunk_size ({chunk_size})")
+        # 属性名与 langchain TextSplitter 保持一致，rag_ingest 等代码可以无差别读取
+        self._chunk_size = chunk_size
+        self._chunk_overlap = chunk_overlap
+        self._separators = list(separators)
+        self._length_function = length_function
+        self._add_start_index = add_start_index
+        self._strip_whitespace = strip_whitespace
+
+    # ------------------------------------------
+    # 核心：基于下标的递归切分
+    # ------------------------------------------
+    def _pieces(self, text: str, start: int, end: int, separator: str) -> List[Tuple[int, int]]:
+        """把 text[start:end] 按 separator 切成连续的片段，分隔符留在后一段开头 (keep_separator="start")。"""
+        if not separator:
+            return [(i, i + 1) for i in range(start, end)]
+        # str.split 在 C 里完成扫描，这里只需要把各段长度累加回下标
+        parts = text[start:end].split(separator)
+        spans = []
+        cursor = start + len(parts[0])
+        if parts[0]:
+            spans.append((start, cursor))
+        sep_len = len(separator)
+        for part in parts[1:]:
+            nxt = cursor + sep_len + len(part)
+            spans.append((cursor, nxt))
+            cursor = nxt
+        return spans
+
+    def _split(self, text: str, start: int, end: int, level: int, out: List[Tuple[int, int]]):
+        # 选择本段文本里出现的第一个分隔符
+        separators = self._separators
+        separator, next_level = separators[-1], len(separators)
+        for i in range(level, len(separators)):
+            sep = separators[i]
+            if not sep:
+                separator, next_level = sep, len(separators)
+                break
+            if text.find(sep, start, end) != -1:
+                separator, next_level = sep, i + 1
+                break
+
+        good: List[Tuple[int, int, int]] = []   # (start, end, length)
+        for s, e in self._pieces(text, start, end, separator):
+            length = self._length_function(text[s:e])
+            if length < self._chunk_size:
+                good.append((s, e, length))
+                continue
+            if good:
+                self._merge(good, out)
+                good = []
+            if next_level >= len(separators):
+                out.append((s, e))
+            else:
+                self._split(text, s, e, next_level, out)
+        if good:
+            self._merge(good, out)
+
+    def _merge(self, pieces: List[Tuple[int, int, int]], out: List[Tuple[int, int]]):
+        """与 TextSplitter._merge_splits 相同的贪心合并 + overlap 规则 (分隔符长度为 0)。"""
+        size, overlap = self._chunk_size, self._chunk_overlap
+        window: List[Tuple[int, int, int]] = []
+        head = 0          # window[head:] 是当前 chunk
+        total = 0
+        for piece in pieces:
+            length = piece[2]
+            if total + length > size and head < len(window):
+                out.append((window[head][0], window[-1][1]))
+                while total > overlap or (total + length > size and total > 0):
+                    total -= window[head][2]
+                    head += 1
+            window.append(piece)
+            total += length
+        if head < len(window):
+            out.append((window[head][0], window[-1][1]))
+
+    # ------------------------------------------
+    # TextSplitter 兼容接口
+    # ------------------------------------------
+    def split_text_with_offsets(self, text: str) -> List[Tuple[int, str]]:
+        spans: List[Tuple[int, int]] = []
+        self._split(text, 0, len(text), 0, spans)
+        chunks = []
+        for s, e in spans:
+            chunk = text[s:e]
+            if self._strip_whitespace:
+                stripped = chunk.lstrip()
+                s += len(chunk) - len(stripped)
+                chunk = stripped.rstrip()
+            if chunk:
+                chunks.append((s, chunk))
+        return chunks
+
+    def split_text(self, text: str) -> List[str]:
+        return [chunk for _, chunk in self.split_text_with_offsets(text)]
+
+    def create_documents(self, texts: List[str], metadatas: Optional[List[Dict[str, Any]]] = None) -> List[Document]:
+        metadatas = metadatas or [{}] * len(texts)
+        documents = []
+        for text, metadata in zip(texts, metadatas):
+            for start, chunk in self.split_text_with_offsets(text):
+                meta = copy.deepcopy(metadata)
+                if self._add_start_index:
+                    meta["start_index"] = start
+                documents.append(Document(page_content=chunk, metadata=meta))
+        return documents
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        documents = list(documents)
+        return self.create_documents([d.page_content for d in documents], [d.metadata for d in documents])
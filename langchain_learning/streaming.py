@@ -0,0 +1,195 @@
+"""
+LCEL Chain 的流式输出 + 首 Token 延迟 (TTFT) 指标
+
+问题背景:
+    01 的 `prompt | model | parser` 和 02 的 full_chain 只用 invoke，
+    用户要等整段回答生成完才能看到第一个字。
+
+设计:
+    - stream_chain / astream_chain: 用 chain.stream() 驱动整条链，
+      最后一个阶段一产出 chunk 就推给调用方提供的 sink。
+      (RunnableSequence 的前置 assign 步骤会先跑完，只有最终阶段是逐 token 输出的)
+    - sink 就是一个 `callable(str)`：stdout_sink / QueueSink / SSESink，或者任意自定义函数
+    - 每次运行记录 StreamMetrics: ttft (首 token 延迟)、总耗时、chunk 数、tokens/sec
+      token 数按 chunk 近似 (OpenAI 兼容接口基本是一个 chunk 一个 token)
+    - StreamRecorder 汇总多次运行的 TTFT / tokens/sec 分位数
+
+Android 类比:
+    Flow<String>.collect { textView.append(it) }，而不是 suspend fun 一次性返回。
+    TTFT 就是 "首帧时间"，tokens/sec 相当于 "帧率"。
+
+用法:
+    result = stream_chain(chain, {"topic": "LiveData"}, sink=stdout_sink)
+    print(result.metrics.summary_line())
+"""
+import asyncio
+import queue
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from perf_metrics import summarize
+
+Sink = Callable[[str], Any]
+
+
+# ==========================================
+# Sinks
+# ==========================================
+
+def stdout_sink(chunk: str):
+    sys.stdout.write(chunk)
+    sys.stdout.flush()
+
+
+class QueueSink:
+    """把 chunk 放进队列 (queue.Queue 或 asyncio.Queue)，流结束时放入 sentinel (默认 None)。"""
+
+    def __init__(self, q=None, sentinel: Any = None):
+        self.queue = q if q is not None else queue.Queue()
+        self.sentinel = sentinel
+
+    def __call__(self, chunk: str):
+        self.queue.put_nowait(chunk)
+
+    def close(self):
+        self.queue.put_nowait(self.sentinel)
+
+
+class SSESink:
+    """按 Server-Sent Events 格式写出 (write 通常是 HTTP 响应的 write 方法)。"""
+
+    def __init__(self, write: Callable[[str], Any], event: Optional[str] = None):
+        self.write = write
+        self.event = event
+
+    def __call__(self, chunk: str):
+        lines = "".join(f"data: {line}\n" for line in chunk.split("\n"))
+        self.write((f"event: {self.event}\n" if self.event else "") + lines + "\n")
+
+    def close(self):
+        self.write("data: [DONE]\n\n")
+
+
+# ==========================================
+# 指标
+# ==========================================
+
+@dataclass
+class StreamMetrics:
+    start: float = 0.0
+    first_token_at: Optional[float] = None
+    end: float = 0.0
+    chunks: int = 0
+    chars: int = 0
+
+    @property
+    def ttft_s(self) -> Optional[float]:
+        return None if self.first_token_at is None else self.first_token_at - self.start
+
+    @property
+    def total_s(self) -> float:
+        return self.end - self.start
+
+    @property
+    def tokens_per_sec(self) -> float:
+        """生成阶段的速率：首 token 之后的 chunk 数 / 首 token 之后的耗时。"""
+        if self.first_token_at is None or self.chunks < 2:
+            return 0.0
+        elapsed = self.end - self.first_token_at
+        return (self.chunks - 1) / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"ttft_s": self.ttft_s, "total_s": self.total_s, "chunks": self.chunks,
+                "chars": self.chars, "tokens_per_sec": self.tokens_per_sec}
+
+    def summary_line(self) -> str:
+        ttft = f"{self.ttft_s * 1000:.0f}ms" if self.ttft_s is not None else "n/a"
+        return (f"TTFT={ttft} | total={self.total_s * 1000:.0f}ms | "
+                f"{self.chunks} chunks | {self.tokens_per_sec:.1f} tokens/s")
+
+
+@dataclass
+class StreamResult:
+    text: str
+    metrics: StreamMetrics
+
+
+class StreamRecorder:
+    """线程安全地收集多次流式运行的指标，汇总 TTFT / tokens/sec 的分位数。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs: List[StreamMetrics] = []
+
+    def record(self, metrics: StreamMetrics):
+        with self._lock:
+            self.runs.append(metrics)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            runs = list(self.runs)
+        return {
+            "runs": len(runs),
+            "ttft_s": summarize([m.ttft_s for m in runs if m.ttft_s is not None]),
+            "tokens_per_sec": summarize([m.tokens_per_sec for m in runs if m.tokens_per_sec]),
+        }
+
+
+# ==========================================
+# 入口
+# ==========================================
+
+def _to_text(chunk: Any) -> str:
+    # StrOutputParser 结尾的链产出 str；直接 stream model 时产出 AIMessageChunk
+    if isinstance(chunk, str):
+        return chunk
+    content = getattr(chunk, "content", chunk)
+    return content if isinstance(content, str) else str(content)
+
+
+def stream_chain(chain, input: Any, sink: Optional[Sink] = stdout_sink, config=None,
+                 recorder: Optional[StreamRecorder] = None) -> StreamResult:
+    metrics = StreamMetrics(start=time.perf_counter())
+    parts: List[str] = []
+    for chunk in chain.stream(input, config):
+        text = _to_text(chunk)
+        if not text:
+            continue
+        if metrics.first_token_at is None:
+            metrics.first_token_at = time.perf_counter()
+        metrics.chunks += 1
+        metrics.chars += len(text)
+        parts.append(text)
+        if sink is not None:
+            sink(text)
+    metrics.end = time.perf_counter()
+    if recorder is not None:
+        recorder.record(metrics)
+    return StreamResult("".join(parts), metrics)
+
+
+async def astream_chain(chain, input: Any, sink: Optional[Sink] = None, config=None,
+                        recorder: Optional[StreamRecorder] = None) -> StreamResult:
+    """异步版本；sink 可以是普通函数，也可以是 async 函数 (例如 websocket.send)。"""
+    metrics = StreamMetrics(start=time.perf_counter())
+    parts: List[str] = []
+    async for chunk in chain.astream(input, config):
+        text = _to_text(chunk)
+        if not text:
+            continue
+        if metrics.first_token_at is None:
+            metrics.first_token_at = time.perf_counter()
+        metrics.chunks += 1
+        metrics.chars += len(text)
+        parts.append(text)
+        if sink is not None:
+            ret = sink(text)
+            if asyncio.iscoroutine(ret):
+                await ret
+    metrics.end = time.perf_counter()
+    if recorder is not None:
+        recorder.record(metrics)
+    return StreamResult("".join(parts), metrics)
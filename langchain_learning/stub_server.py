@@ -0,0 +1,476 @@
+"""
+离线 OpenAI 协议 Stub Server
+
+问题背景:
+    所有课程脚本都依赖真实的 DeepSeek/OpenAI Key，CI 里既跑不了，也无法测量 "管线本身" 的开销
+    (Prompt 渲染、Parser、Runnable 调度...)，因为网络与模型延迟的抖动把这些全淹没了。
+
+Android 类比:
+    这就是 OkHttp 的 MockWebServer：在本地起一个真实的 HTTP Server，
+    上层代码 (ChatOpenAI / OpenAIEmbeddings) 完全不用改，只换 base_url。
+
+支持的协议:
+    POST /v1/chat/completions   普通回复 / tool_calls / stream (SSE)
+    POST /v1/embeddings         确定性的 hash 向量
+    GET  /v1/models
+    POST /stub/config           运行时修改配置 (供基准脚本在子进程外部调参)
+
+可脚本化的行为 (StubConfig，可来自 JSON 文件 STUB_CONFIG 或环境变量):
+    latency_ms / jitter_ms      首字节延迟
+    tokens_per_sec              生成速率 (stream 逐 token 输出；非 stream 按总 token 数等待)
+    error_rate / error_status   随机注入错误 (默认 500)
+    embedding_max_batch_tokens  单个 embeddings 请求的 token 上限，超过返回 400 (模拟 payload 过大)；0 表示不限
+    rules                       [{"match": 正则, "last_user": 正则, "response": 模板}]，按顺序匹配；
+                                match 针对整段对话文本，last_user 只针对最后一条用户消息，两者都可选
+    default_response            兜底模板，可用变量: {last_user} {model} {n_messages}
+
+回复策略 (优先级从高到低):
+    1. rules 命中 → 渲染模板
+    2. 请求带 tools 且上一条不是 tool 结果 → 根据问题挑选工具并合成参数，返回 tool_calls
+    3. Prompt 中包含 JSON Schema (PydanticOutputParser 的 format_instructions) → 合成一个符合 schema 的 JSON
+    4. default_response
+
+用法:
+    get_model("stub")                              # 进程内自动起 server
+    python stub_server.py --port 8765 --config stub_responses.json
+    STUB_API_BASE=http://127.0.0.1:8765/v1 python 02_lcel_chain.py  # 复用外部 server
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import asdict, dataclass, field, fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+_TOKEN_RE = re.compile(r"[一-鿿]|\w+|\s+|[^\w\s]")
+_SCHEMA_BLOCK_RE = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.S)
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    tokens_per_sec: float = 0.0          # 0 表示不限速
+    error_rate: float = 0.0
+    error_status: int = 500
+    embedding_dim: int = 256
+    embedding_max_batch_tokens: int = 0
+    seed: int = 42
+    default_response: str = "[stub] 已收到: {last_user}"
+    rules: List[Dict[str, str]] = field(default_factory=list)
+
+    @classmethod
+    def from_env(cls, path: Optional[str] = None) -> "StubConfig":
+        """先读 JSON 文件 (path 或 STUB_CONFIG)，再用 STUB_* 环境变量覆盖单个字段。"""
+        data: Dict[str, Any] = {}
+        path = path or os.getenv("STUB_CONFIG")
+        if path:
+            with open(path, encoding="utf-8") as f:
+                data.update(json.load(f))
+        for f_ in fields(cls):
+            env_value = os.getenv(f"STUB_{f_.name.upper()}")
+            if env_value is not None and f_.name != "rules":
+                data[f_.name] = type(getattr(cls(), f_.name))(env_value)
+        return cls(**data)
+
+    def update(self, **kwargs):
+        for key, value in kwargs.items():
+            if not hasattr(self, key):
+                raise ValueError(f"Unknown stub config field: {key}")
+            setattr(self, key, value)
+
+
+# ==========================================
+# 回复合成
+# ==========================================
+
+def tokenize(text: str) -> List[str]:
+    """粗粒度 "token"：中文单字 / 英文单词 / 空白 / 标点。仅用于限速与 usage 统计。"""
+    return _TOKEN_RE.findall(text or "")
+
+
+def _content_text(content) -> str:
+    if isinstance(content, list):  # 多模态 content parts
+        return "".join(p.get("text", "") for p in content if isinstance(p, dict))
+    return content or ""
+
+
+def _bigrams(text: str):
+    text = re.sub(r"\s+", "", text.lower())
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _example_from_schema(schema: Dict[str, Any], defs: Dict[str, Any], name: str = "value", numbers=None):
+    """按 JSON Schema 合成一个最小的合法实例。"""
+    if "$ref" in schema:
+        schema = defs.get(schema["$ref"].split("/")[-1], {})
+    for combinator in ("anyOf", "oneOf", "allOf"):
+        if combinator in schema:
+            options = [s for s in schema[combinator] if s.get("type") != "null"] or schema[combinator]
+            return _example_from_schema(options[0], defs, name, numbers)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "default" in schema and schema["default"] is not None:
+        return schema["default"]
+    kind = schema.get("type", "object" if "properties" in schema else "string")
+    if kind == "object":
+        return {key: _example_from_schema(sub, defs, key, numbers)
+                for key, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [_example_from_schema(schema.get("items", {}), defs, name, numbers)]
+    if kind in ("integer", "number"):
+        if numbers:
+            value = numbers.pop(0)
+            return int(value) if kind == "integer" else value
+        return 1 if kind == "integer" else 1.0
+    if kind == "boolean":
+        return True
+    return f"stub-{name}"
+
+
+def _find_schema(text: str) -> Optional[Dict[str, Any]]:
+    for block in reversed(_SCHEMA_BLOCK_RE.findall(text)):
+        try:
+            schema = json.loads(block)
+        except ValueError:
+            continue
+        if isinstance(schema, dict) and "properties" in schema:
+            return schema
+    return None
+
+
+def _select_tools(tools: List[Dict[str, Any]], question: str) -> List[Dict[str, Any]]:
+    """按问题与工具描述的字符 bigram 重合度挑工具；都不重合时退化为第一个工具。"""
+    q = _bigrams(question)
+    selected = []
+    for t in tools:
+        fn = t.get("function", {})
+        overlap = len(q & _bigrams(fn.get("name", "") + fn.get("description", "")))
+        if overlap:
+            selected.append(t)
+    return selected or tools[:1]
+
+
+class ResponseSynthesizer:
+    def __init__(self, config: StubConfig):
+        self.config = config
+
+    def render(self, template: str, messages: List[Dict[str, Any]], model: str) -> str:
+        last_user = next((_content_text(m.get("content")) for m in reversed(messages)
+                          if m.get("role") == "user"), "")
+        values = {"last_user": last_user, "model": model, "n_messages": len(messages)}
+        return template.format_map(_SafeDict(values))
+
+    def chat(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """返回 {"content": str} 或 {"tool_calls": [...]}。"""
+        messages = body.get("messages", [])
+        model = body.get("model", "stub-chat")
+        transcript = "\n".join(_content_text(m.get("content")) for m in messages)
+
+        last_user = next((_content_text(m.get("content")) for m in reversed(messages)
+                          if m.get("role") == "user"), "")
+        for rule in self.config.rules:
+            if "match" in rule and not re.search(rule["match"], transcript, re.S):
+                continue
+            if "last_user" in rule and not re.search(rule["last_user"], last_user, re.S):
+                continue
+            return {"content": self.render(rule["response"], messages, model)}
+
+        tools = body.get("tools") or []
+        if tools and body.get("tool_choice") != "none" and messages and messages[-1].get("role") != "tool":
+            question = last_user
+            numbers = [float(n) for n in _NUMBER_RE.findall(question)]
+            calls = []
+            for t in _select_tools(tools, question):
+                fn = t.get("function", {})
+                params = fn.get("parameters") or {}
+                args = _example_from_schema(params, params.get("$defs", {}), numbers=numbers)
+                calls.append({
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "type": "function",
+                    "function": {"name": fn.get("name"), "arguments": json.dumps(args, ensure_ascii=False)},
+                })
+            return {"tool_calls": calls}
+
+        schema = _find_schema(transcript)
+        if schema is not None:
+            instance = _example_from_schema(schema, schema.get("$defs", {}))
+            return {"content": json.dumps(instance, ensure_ascii=False)}
+
+        return {"content": self.render(self.config.default_response, messages, model)}
+
+
+class _SafeDict(dict):
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+
+def hash_embedding(text: str, dim: int) -> List[float]:
+    """确定性 embedding：字符 3-gram 做 feature hashing，L2 归一化。相同文本永远得到相同向量。"""
+    vec = [0.0] * dim
+    padded = f"  {text}  "
+    for i in range(len(padded) - 2):
+        h = zlib.crc32(padded[i:i + 3].encode("utf-8"))
+        vec[h % dim] += 1.0 if (h >> 31) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+# ==========================================
+# HTTP 层
+# ==========================================
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    server_version = "OpenAIStub/1.0"
+    protocol_version = "HTTP/1.1"  # 支持 keep-alive，和真实 API 一致
+
+    def log_message(self, format, *args):
+        if os.getenv("STUB_VERBOSE"):
+            super().log_message(format, *args)
+
+    @property
+    def stub(self) -> "StubServer":
+        return self.server.stub  # type: ignore[attr-defined]
+
+    # --- helpers ---
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, payload: Dict[str, Any], status: int = 200):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self) -> str:
+        path = self.path.split("?", 1)[0].rstrip("/")
+        return path[3:] if path.startswith("/v1") else path
+
+    # --- verbs ---
+    def do_GET(self):
+        if self._route() == "/models":
+            self._send_json({"object": "list", "data": [
+                {"id": "stub-chat", "object": "model", "owned_by": "stub"},
+                {"id": "stub-embedding", "object": "model", "owned_by": "stub"},
+            ]})
+        else:
+            self._send_json({"error": {"message": f"Not found: {self.path}"}}, 404)
+
+    def do_POST(self):
+        route = self._route()
+        body = self._read_json()
+        if route == "/stub/config":
+            self.stub.config.update(**body)
+            self._send_json(asdict(self.stub.config))
+            return
+
+        self.stub.requests += 1
+        status = self.stub.maybe_inject_error()
+        if status:
+            self._send_json({"error": {"message": "stub injected error", "type": "server_error"}}, status)
+            return
+
+        if route == "/chat/completions":
+            self._chat(body)
+        elif route == "/embeddings":
+            self._embeddings(body)
+        else:
+            self._send_json({"error": {"message": f"Not found: {self.path}"}}, 404)
+
+    def _chat(self, body: Dict[str, Any]):
+        stub = self.stub
+        reply = stub.synthesizer.chat(body)
+        model = body.get("model", "stub-chat")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:16]}"
+        created = int(time.time())
+        prompt_tokens = sum(len(tokenize(_content_text(m.get("content")))) for m in body.get("messages", []))
+        tokens = tokenize(reply.get("content", ""))
+        if "tool_calls" in reply:
+            tokens = tokenize(json.dumps(reply["tool_calls"]))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_tokens + len(tokens)}
+        finish_reason = "tool_calls" if "tool_calls" in reply else "stop"
+
+        stub.sleep_first_byte()
+
+        if not body.get("stream"):
+            stub.sleep_tokens(len(tokens))
+            message = {"role": "assistant", "content": reply.get("content")}
+            if "tool_calls" in reply:
+                message["tool_calls"] = reply["tool_calls"]
+            self._send_json({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+            return
+
+        # --- SSE streaming ---
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def emit(delta, finish=None, extra=None):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                     "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            if extra:
+                chunk.update(extra)
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        emit({"role": "assistant", "content": ""})
+        if "tool_calls" in reply:
+            stub.sleep_tokens(len(tokens))
+            emit({"tool_calls": [dict(call, index=i) for i, call in enumerate(reply["tool_calls"])]})
+        else:
+            for tok in tokens:
+                stub.sleep_tokens(1)
+                emit({"content": tok})
+        emit({}, finish=finish_reason)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self.wfile.write(f"data: {json.dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model, 'choices': [], 'usage': usage})}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _embeddings(self, body: Dict[str, Any]):
+        stub = self.stub
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dim = int(body.get("dimensions") or stub.config.embedding_dim)
+        limit = stub.config.embedding_max_batch_tokens
+        if limit:
+            requested = sum(len(tokenize(t)) if isinstance(t, str) else len(t) for t in inputs)
+            if requested > limit:
+                # 与 OpenAI 的报错格式一致
+                self._send_json({"error": {"message": f"Requested {requested} tokens, max {limit} tokens per request",
+                                           "type": "invalid_request_error", "code": "max_tokens_per_request"}}, 400)
+                return
+        stub.sleep_first_byte()
+        data = []
+        n_tokens = 0
+        for i, item in enumerate(inputs):
+            # 客户端开启 check_embedding_ctx_length 时会发送 token id 列表，这里同样确定性地处理
+            text = item if isinstance(item, str) else " ".join(map(str, item))
+            n_tokens += len(tokenize(text))
+            data.append({"object": "embedding", "index": i, "embedding": stub.embed(text, dim)})
+        self._send_json({"object": "list", "data": data, "model": body.get("model", "stub-embedding"),
+                         "usage": {"prompt_tokens": n_tokens, "total_tokens": n_tokens}})
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端主动断开 (取消请求 / hedging 的 loser) 是预期行为，不打印堆栈
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class StubServer:
+    def __init__(self, config: Optional[StubConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or StubConfig.from_env()
+        self.synthesizer = ResponseSynthesizer(self.config)
+        self.requests = 0
+        self._rng = random.Random(self.config.seed)
+        self._rng_lock = threading.Lock()
+        self._httpd = _QuietHTTPServer((host, port), StubRequestHandler)
+        self._httpd.stub = self  # type: ignore[attr-defined]
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="openai-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def shutdown(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    # --- 行为控制 ---
+    def _random(self) -> float:
+        with self._rng_lock:
+            return self._rng.random()
+
+    def maybe_inject_error(self) -> Optional[int]:
+        if self.config.error_rate > 0 and self._random() < self.config.error_rate:
+            return self.config.error_status
+        return None
+
+    def sleep_first_byte(self):
+        delay = self.config.latency_ms
+        if self.config.jitter_ms:
+            delay += self._random() * self.config.jitter_ms
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def sleep_tokens(self, n: int):
+        if self.config.tokens_per_sec > 0 and n > 0:
+            time.sleep(n / self.config.tokens_per_sec)
+
+    def embed(self, text: str, dim: int) -> List[float]:
+        return hash_embedding(text, dim)
+
+
+# ==========================================
+# 进程级单例 (供 providers.py 的 "stub" provider 使用)
+# ==========================================
+
+_server: Optional[StubServer] = None
+_server_lock = threading.Lock()
+
+
+def ensure_stub_server() -> str:
+    """返回 stub 的 base_url：优先使用 STUB_API_BASE 指向的外部 server，否则在本进程内启动一个。"""
+    global _server
+    external = os.getenv("STUB_API_BASE")
+    if external:
+        return external
+    with _server_lock:
+        if _server is None:
+            _server = StubServer().start()
+        return _server.base_url
+
+
+def get_stub_server() -> Optional[StubServer]:
+    """进程内 server 实例 (用于运行时调参)；使用外部 server 时返回 None。"""
+    return _server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline OpenAI-compatible stub server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--config", help="JSON file with StubConfig fields")
+    args = parser.parse_args()
+
+    server = StubServer(StubConfig.from_env(args.config), host=args.host, port=args.port)
+    print(f"🧪 OpenAI stub listening on {server.base_url}  (export STUB_API_BASE={server.base_url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,272 @@
+"""
+Runnable 级别的延迟与 Token 遥测 (Telemetry)
+
+问题背景:
+    02 的 `explain_chain | code_chain | summary_chain`、08 的 RAG chain，
+    我们只知道总耗时，不知道是哪一步吃掉了延迟预算或 token。
+
+设计:
+    - TelemetryHandler 是一个 LangChain callback handler，通过 config={"callbacks": [handler]}
+      (或 attach(chain, handler)) 挂到任意 chain 上，chain 里的每个 Runnable 都会变成一个 span:
+        name / kind (chain / llm / retriever / tool) / path (嵌套路径) / depth
+        wall_s      : span 的起止时间
+        queue_s     : span 在 "可以开始" 之后等了多久才真正开始
+                      (= 开始时间 - max(父 span 开始时间, 同一父 span 下在它之前结束的兄弟 span 的结束时间))
+        prompt_tokens / completion_tokens : 来自 LLM 返回的 usage
+        retries     : with_retry 触发的重试次数
+    - span 结束时写一行 JSON 到 JSONL 文件 (可选)，同时交给 TelemetryAggregator 汇总分位数。
+
+Android 类比:
+    Systrace / Perfetto 的 trace section：每一段都有开始、结束和嵌套关系，
+    最后既能导出原始 trace，也能在面板上看 p50 / p95。
+
+用法:
+    telemetry = TelemetryHandler(jsonl_path=".cache/telemetry.jsonl")
+    chain.invoke(input, config={"callbacks": [telemetry]})
+    print(telemetry.aggregator.report())
+"""
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from perf_metrics import summarize
+
+DEFAULT_JSONL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "telemetry.jsonl")
+
+
+@dataclass
+class Span:
+    run_id: str
+    parent_id: Optional[str]
+    name: str
+    kind: str
+    path: str
+    depth: int
+    start: float
+    end: float = 0.0
+    queue_s: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    retries: int = 0
+    error: Optional[str] = None
+    # 内部使用：同一父 span 下已结束子 span 的最晚结束时间
+    _children_done_at: float = field(default=0.0, repr=False)
+
+    @property
+    def wall_s(self) -> float:
+        return self.end - self.start
+
+    def as_record(self, origin: float) -> Dict[str, Any]:
+        record = {k: v for k, v in asdict(self).items() if not k.startswith("_")}
+        record["start"] = round(self.start - origin, 6)   # 相对 handler 创建时间，便于对齐
+        record["end"] = round(self.end - origin, 6)
+        record["wall_s"] = round(self.wall_s, 6)
+        record["queue_s"] = round(self.queue_s, 6)
+        return record
+
+
+class TelemetryAggregator:
+    """进程内汇总：按 span 名字 (或路径) 分组，统计 wall/queue 分位数与 token 总数。"""
+
+    def __init__(self, group_by: str = "path"):
+        self.group_by = group_by
+        self._lock = threading.Lock()
+        self._groups: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, span: Span):
+        key = getattr(span, self.group_by)
+        with self._lock:
+            group = self._groups.setdefault(key, {"kind": span.kind, "depth": span.depth, "wall": [], "queue": [],
+                                                  "prompt_tokens": 0, "completion_tokens": 0,
+                                                  "retries": 0, "errors": 0})
+            group["wall"].append(span.wall_s)
+            group["queue"].append(span.queue_s)
+            group["prompt_tokens"] += span.prompt_tokens
+            group["completion_tokens"] += span.completion_tokens
+            group["retries"] += span.retries
+            group["errors"] += span.error is not None
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            groups = {k: dict(v) for k, v in self._groups.items()}
+        return {
+            key: {
+                "kind": g["kind"],
+                "depth": g["depth"],
+                "wall_s": summarize(g["wall"]),
+                "queue_s": summarize(g["queue"]),
+                "prompt_tokens": g["prompt_tokens"],
+                "completion_tokens": g["completion_tokens"],
+                "retries": g["retries"],
+                "errors": g["errors"],
+            }
+            for key, g in groups.items()
+        }
+
+    def report(self, min_depth: int = 0, max_depth: Optional[int] = None) -> str:
+        rows = [(k, v) for k, v in self.summary().items()
+                if v["depth"] >= min_depth and (max_depth is None or v["depth"] <= max_depth)]
+        rows.sort(key=lambda kv: -kv[1]["wall_s"]["mean"] * kv[1]["wall_s"]["count"])
+        header = f"{'step':<60}{'n':>4}{'p50(ms)':>9}{'p95(ms)':>9}{'queue95':>9}{'tok in':>8}{'tok out':>8}{'retry':>6}"
+        lines = [header, "-" * len(header)]
+        for key, v in rows:
+            label = key if len(key) <= 58 else "…" + key[-57:]
+            lines.append(f"{label:<60}{v['wall_s']['count']:>4}{v['wall_s']['p50'] * 1000:>9.0f}"
+                         f"{v['wall_s']['p95'] * 1000:>9.0f}{v['queue_s']['p95'] * 1000:>9.0f}"
+                         f"{v['prompt_tokens']:>8}{v['completion_tokens']:>8}{v['retries']:>6}")
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._groups.clear()
+
+
+class TelemetryHandler(BaseCallbackHandler):
+    """
+    - jsonl_path:  每个结束的 span 追加一行 JSON (None 表示不落盘)
+    - aggregator:  可多个 handler 共享同一个汇总器
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None, aggregator: Optional[TelemetryAggregator] = None):
+        self.jsonl_path = jsonl_path
+        self.aggregator = aggregator or TelemetryAggregator()
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._spans: Dict[str, Span] = {}
+        self._file = None
+        if jsonl_path:
+            os.makedirs(os.path.dirname(os.path.abspath(jsonl_path)), exist_ok=True)
+            self._file = open(jsonl_path, "a", encoding="utf-8")
+
+    # ------------------------------------------
+    # span 生命周期
+    # ------------------------------------------
+    def _start(self, kind: str, serialized: Optional[Dict[str, Any]], run_id: UUID,
+               parent_run_id: Optional[UUID], kwargs: Dict[str, Any]):
+        now = time.perf_counter()
+        name = kwargs.get("name") or (serialized or {}).get("name") or ((serialized or {}).get("id") or ["?"])[-1]
+        with self._lock:
+            parent = self._spans.get(str(parent_run_id)) if parent_run_id else None
+            if parent is not None and any(t.startswith("retry:attempt:") for t in kwargs.get("tags") or []):
+                # Runnable.with_retry 不触发 on_retry，而是给第 2 次起的尝试打上 retry:attempt:N 标签
+                parent.retries += 1
+            ready_at = max(parent.start, parent._children_done_at) if parent else now
+            self._spans[str(run_id)] = Span(
+                run_id=str(run_id), parent_id=str(parent_run_id) if parent_run_id else None,
+                name=name, kind=kind, path=f"{parent.path} > {name}" if parent else name,
+                depth=parent.depth + 1 if parent else 0, start=now, queue_s=max(0.0, now - ready_at),
+            )
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None):
+        now = time.perf_counter()
+        with self._lock:
+            span = self._spans.pop(str(run_id), None)
+            if span is None:
+                return
+            span.end = now
+            if error is not None:
+                span.error = repr(error)
+            parent = self._spans.get(span.parent_id) if span.parent_id else None
+            if parent is not None:
+                parent._children_done_at = max(parent._children_done_at, now)
+                # token 向上累加，父 span 看到的是整棵子树的用量
+                parent.prompt_tokens += span.prompt_tokens
+                parent.completion_tokens += span.completion_tokens
+            if self._file is not None:
+                self._file.write(json.dumps(span.as_record(self.origin), ensure_ascii=False) + "\n")
+                self._file.flush()
+        self.aggregator.add(span)
+
+    # ------------------------------------------
+    # LangChain callbacks
+    # ------------------------------------------
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._start("chain", serialized, run_id, parent_run_id, kwargs)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start("llm", serialized, run_id, parent_run_id, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start("llm", serialized, run_id, parent_run_id, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_tokens, completion_tokens = _token_usage(response)
+        with self._lock:
+            span = self._spans.get(str(run_id))
+            if span is not None:
+                span.prompt_tokens += prompt_tokens
+                span.completion_tokens += completion_tokens
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        self._start("retriever", serialized, run_id, parent_run_id, kwargs)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        self._start("tool", serialized, run_id, parent_run_id, kwargs)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_retry(self, retry_state, *, run_id, **kwargs):
+        with self._lock:
+            span = self._spans.get(str(run_id))
+            if span is not None:
+                span.retries += 1
+
+    # ------------------------------------------
+    def spans_in_flight(self) -> List[Span]:
+        with self._lock:
+            return list(self._spans.values())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _token_usage(response) -> tuple:
+    """优先读 message.usage_metadata (chat model)，否则读 llm_output["token_usage"]。"""
+    prompt_tokens = completion_tokens = 0
+    found = False
+    for generations in response.generations or []:
+        for gen in generations:
+            usage = getattr(getattr(gen, "message", None), "usage_metadata", None)
+            if usage:
+                found = True
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+    if not found:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+
+def attach(chain, handler: TelemetryHandler):
+    """返回挂好 handler 的 chain (等价于每次调用都传 config={"callbacks": [handler]})。"""
+    return chain.with_config(callbacks=[handler])
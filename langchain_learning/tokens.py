@@ -0,0 +1,60 @@
+"""
+Token 计数
+
+ingest 相关模块 (embedding 分批、token 感知的切分) 需要知道一段文本 "大约多少 token"。
+- 安装了 tiktoken (langchain-openai 的依赖) 时使用 cl100k_base 编码，与 OpenAI 模型一致
+- 否则退回启发式估算：中日韩字符按 1 个 token，其余按 4 个字符 1 个 token
+
+编码器只在第一次调用时加载 (tiktoken 首次加载需要读取词表)。
+"""
+import os
+import re
+import threading
+from typing import Callable, List, Optional
+
+DEFAULT_ENCODING = os.getenv("TOKEN_ENCODING", "cl100k_base")
+
+_CJK_RE = re.compile(r"[　-〿぀-ヿ一-鿿가-힯＀-￯]")
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def heuristic_count(text: str) -> int:
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def get_encoder():
+    """返回 tiktoken 编码器；不可用时返回 None。"""
+    global _encoder
+    if _encoder is not None:  # 快速路径：已初始化后不再加锁 (count_tokens 会被高频调用)
+        return _encoder or None
+    with _encoder_lock:
+        if _encoder is None:
+            try:
+                import tiktoken
+                _encoder = tiktoken.get_encoding(DEFAULT_ENCODING)
+            except Exception:  # 未安装，或离线环境下无法下载词表
+                _encoder = False
+        return _encoder or None
+
+
+def count_tokens(text: str) -> int:
+    encoder = get_encoder()
+    if encoder is None:
+        return heuristic_count(text)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def count_tokens_batch(texts: List[str]) -> List[int]:
+    """批量计数 (tiktoken 的 encode_batch 会用多线程)。"""
+    encoder = get_encoder()
+    if encoder is None:
+        return [heuristic_count(t) for t in texts]
+    return [len(ids) for ids in encoder.encode_batch(texts, disallowed_special=())]
+
+
+def get_token_counter(name: Optional[str] = None) -> Callable[[str], int]:
+    """name="heuristic" 强制使用启发式估算 (最快，不依赖词表)；默认优先 tiktoken。"""
+    return heuristic_count if name == "heuristic" else count_tokens
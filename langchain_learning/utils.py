@@ -1,78 +1,43 @@
-import os
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-# Try importing Google Generative AI, handle if not installed
-try:
-    from langchain_google_genai import ChatGoogleGenerativeAI
-except ImportError:
-    ChatGoogleGenerativeAI = None
+# Provider 的 SDK (langchain_openai / langchain_google_genai) 在 providers.py 中按需 import，
+# 这里不再在模块加载时 import，避免拖慢冷启动
+from providers import (LazyModel, default_chat_provider, default_embeddings_provider, embedding_providers,
+                       get_cached_chat_model, get_chat_model, get_embeddings)
 
 # Load environment variables once when this module is imported
 load_dotenv()
 
-def get_model(provider="openai", temperature=0.7):
+def get_model(provider=None, temperature=0.7, lazy=False, cache=None):
     """
     根据 provider 返回不同的 Model 实现。
     这就像 Android 中的 Product Flavors 或者 Dependency Injection (Hilt/Dagger)。
+
+    同一组 (provider, model, temperature, base_url) 在进程内只会构造一次，
+    所有实例共享同一个 keep-alive 连接池 (见 client_registry.py)。
+    lazy=True 时返回 LazyModel 代理，第一次调用时才 import SDK 并构造 client，
+    适合在模块顶层组装 chain 的脚本。
+    cache=True (或传入 BaseCache 实例) 时挂载持久化响应缓存，仅允许 temperature=0，见 llm_cache.py。
     """
-    # Allow overriding provider via environment variable if not explicitly passed (optional enhancement)
-    # But sticking to the user's logic structure first.
-    
-    if provider == "openai":
-        print(f"🔄 正在初始化 OpenAI Model...")
-        return ChatOpenAI(
-            model="gpt-3.5-turbo",
-            temperature=temperature
-        )
-    
-    elif provider == "deepseek":
-        print(f"🔄 正在初始化 DeepSeek Model (via OpenAI Protocol)...")
-        # DeepSeek 兼容 OpenAI 协议，只需要修改 base_url 和 api_key
-        return ChatOpenAI(
-            model="deepseek-chat",
-            openai_api_key=os.getenv("DEEPSEEK_API_KEY"),
-            openai_api_base=os.getenv("DEEPSEEK_API_BASE"),
-            temperature=temperature
-        )
-        
-    elif provider == "google":
-        print(f"🔄 正在初始化 Google Gemini Model...")
-        if ChatGoogleGenerativeAI is None:
-            raise ImportError("Please install langchain-google-genai to use Google models.")
-            
-        if not os.getenv("GOOGLE_API_KEY"):
-            raise ValueError("请在 .env 中配置 GOOGLE_API_KEY")
-        return ChatGoogleGenerativeAI(
-            model="gemini-pro",
-            temperature=temperature
-        )
-    
+    # 不传 provider 时按 providers.default_chat_provider 选择: 环境变量 LLM_PROVIDER 优先
+    # (例如 LLM_PROVIDER=stub 让所有课程脚本离线运行)，否则有 DEEPSEEK_API_KEY 用 DeepSeek，再回退到 OpenAI。
+    # 显式传入的 provider 不会被环境变量覆盖 (get_hedged_model 的 primary / secondary 必须是两个不同的 model)
+    provider = provider or default_chat_provider()
+    if cache:
+        resolver = lambda p, t: get_cached_chat_model(p, t, cache)
     else:
-        raise ValueError(f"Unknown provider: {provider}")
+        resolver = get_chat_model
+    if lazy:
+        return LazyModel(provider, temperature, resolver=resolver)
+    return resolver(provider, temperature)
 
-def get_embeddings_model(provider="openai"):
+def get_embeddings_model(provider=None):
     """
-    返回 Embeddings 模型
+    返回 Embeddings 模型 (同样经过 client_registry 复用实例与连接池)
     """
-    if provider == "openai":
-        if not os.getenv("OPENAI_API_KEY"):
-             # Fallback or warning? user logic checked this in 08_rag_basic.py
-             pass
-        return OpenAIEmbeddings(model="text-embedding-3-small")
-    
-    # Can add more providers here (e.g., HuggingFace, DeepSeek if they have embeddings endpoint compatible)
-    # For now, DeepSeek often uses OpenAI compatible embeddings or we stick to OpenAI
-    # If provider is deepseek, we might still want to use OpenAI embeddings or a specific one.
-    # For this refactor, I will stick to what was in 08_rag_basic.py which is OpenAIEmbeddings.
-    
-    elif provider == "deepseek":
-         # DeepSeek does not strictly have an embedding model in the same chat API path usually, 
-         # but let's assume we use OpenAI embeddings for now or local. 
-         # The user requirement was just to implement the factory logic, 
-         # and 08_rag_basic used OpenAIEmbeddings.
-         # I will default to OpenAI embeddings for now unless specifically asked otherwise.
-         print("⚠️ DeepSeek embeddings not configured, falling back to OpenAI Embeddings")
-         return OpenAIEmbeddings(model="text-embedding-3-small")
-
-    else:
-        return OpenAIEmbeddings(model="text-embedding-3-small")
+    # 不传 provider 时: EMBEDDINGS_PROVIDER > LLM_PROVIDER > openai；显式传入的 provider 优先
+    provider = provider or default_embeddings_provider()
+    # DeepSeek 没有兼容的 Embeddings 接口，providers.py 中会回退到 OpenAI Embeddings；
+    # 未注册的 provider 也沿用原有行为，直接回退到 OpenAI Embeddings
+    if provider not in embedding_providers():
+        provider = "openai"
+    return get_embeddings(provider)
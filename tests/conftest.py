@@ -0,0 +1,35 @@
+"""
+测试共用的 fixture。
+
+所有测试都离线运行: chat model 走进程内的 stub server (stub_server.py)，
+embedding 走 local_embeddings.LocalHashEmbeddings (与 stub server 同一个算法，不经过 HTTP)，
+缓存文件写到 pytest 的 tmp_path。
+"""
+import pytest
+
+from stub_server import StubConfig, StubServer
+
+# 这些变量会改变 get_model / get_embeddings_model 的默认 provider，测试里一律清掉再按需设置
+PROVIDER_ENV = ("LLM_PROVIDER", "EMBEDDINGS_PROVIDER", "DEEPSEEK_API_KEY", "STUB_API_BASE", "LLM_CACHE_BYPASS")
+
+
+@pytest.fixture(autouse=True)
+def clean_provider_env(monkeypatch):
+    for name in PROVIDER_ENV:
+        monkeypatch.delenv(name, raising=False)
+
+
+@pytest.fixture
+def stub_server():
+    """独立的 stub server (不影响 providers.py 使用的进程级单例)，测试里可以随意改 config。"""
+    server = StubServer(StubConfig()).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def stub_chat(stub_server):
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(model="stub-chat", api_key="stub", base_url=stub_server.base_url, temperature=0,
+                      max_retries=0)
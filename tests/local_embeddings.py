@@ -0,0 +1,18 @@
+"""测试用的进程内 embedding，不需要 stub server / 网络。"""
+from langchain_core.embeddings import Embeddings
+
+from stub_server import hash_embedding
+
+
+class LocalHashEmbeddings(Embeddings):
+    """确定性 embedding: 字符 3-gram feature hashing (stub_server.hash_embedding)，L2 归一化。"""
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.model, self.dimensions = f"stub-hash-{dim}", dim
+
+    def embed_documents(self, texts):
+        return [hash_embedding(text, self.dim) for text in texts]
+
+    def embed_query(self, text):
+        return hash_embedding(text, self.dim)
@@ -0,0 +1,45 @@
+import asyncio
+
+from langchain_core.runnables import RunnableLambda
+
+from batch_runner import run_batch
+
+
+def test_results_keep_input_order_and_isolate_failures():
+    async def work(x):
+        await asyncio.sleep(0.01 * (5 - x))     # 后面的输入先完成
+        if x == 2:
+            raise ValueError("bad item")
+        return x * 10
+
+    report = run_batch(RunnableLambda(work), list(range(5)), max_concurrency=5)
+    assert [r.output for r in report.results] == [0, 10, None, 30, 40]
+    assert [r.index for r in report.results] == list(range(5))
+    assert isinstance(report.results[2].error, ValueError)
+    assert (report.succeeded, report.failed) == (4, 1)
+    assert "ok=4 failed=1" in report.summary_line()
+
+
+def test_max_concurrency_bounds_in_flight_requests():
+    in_flight = peak = 0
+
+    async def work(x):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.02)
+        in_flight -= 1
+        return x
+
+    report = run_batch(RunnableLambda(work), list(range(12)), max_concurrency=3)
+    assert peak == 3
+    # 12 条、并发 3、每条 20ms: 约 4 轮，远小于串行的 240ms
+    assert report.wall_s < 0.2
+    assert report.throughput > 12 / 0.2
+    assert max(r.wait_s for r in report.results) > 0.05
+
+
+def test_batch_against_stub_model(stub_chat):
+    report = run_batch(stub_chat, [f"q{i}" for i in range(6)], max_concurrency=4)
+    assert [r.output.content for r in report.results] == [f"[stub] 已收到: q{i}" for i in range(6)]
+    assert set(report.latency) >= {"p50", "p95"}
@@ -0,0 +1,79 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from langchain_core.documents import Document
+
+from bench_retrieval import evaluate, is_relevant, load_qa, make_retriever
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "langchain_learning")
+TEXT = "Intro line.\nThe home office budget is $1,000 per employee.\nBusiness class only above 6 hours.\n"
+
+
+@pytest.fixture
+def qa_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "policy.txt").write_text(TEXT)
+    rows = [{"question": "home office budget?", "source": "policy.txt", "passage": "home office budget is $1,000"},
+            {"question": "business class?", "source": "policy.txt", "passage": "Business class only above 6 hours"}]
+    (tmp_path / "qa.jsonl").write_text("\n".join(json.dumps(r) for r in rows) + "\n\n")
+    return tmp_path
+
+
+def chunk(text, start, source="policy.txt"):
+    return Document(page_content=text, metadata={"source": source, "start_index": start})
+
+
+def test_load_qa_locates_passages(qa_file):
+    qa = load_qa("qa.jsonl")
+    source, start, end = qa[0]["span"]
+    assert source == str(qa_file / "policy.txt")
+    assert TEXT[start:end] == "home office budget is $1,000"
+
+    (qa_file / "bad.jsonl").write_text(json.dumps({"question": "?", "source": "policy.txt", "passage": "nope"}))
+    with pytest.raises(ValueError, match="Passage not found"):
+        load_qa("bad.jsonl")
+
+
+def test_relevance_needs_half_of_the_passage(qa_file):
+    span = load_qa("qa.jsonl")[0]["span"]
+    _, start, end = span
+    assert is_relevant(chunk(TEXT[start - 4:end], start - 4), span)
+    assert is_relevant(chunk(TEXT[start:start + 16], start), span)            # 16 / 28 个字符
+    assert not is_relevant(chunk(TEXT[start:start + 10], start), span)
+    assert not is_relevant(chunk(TEXT[start:end], start, source="other.txt"), span)
+    assert not is_relevant(Document(page_content=TEXT[start:end], metadata={"source": "policy.txt"}), span)
+
+
+def test_evaluate_reports_recall_and_mrr(qa_file):
+    qa = load_qa("qa.jsonl")
+    budget, business = (item["span"][1] for item in qa)
+    ranked = {
+        "home office budget?": [chunk("Intro line.", 0), chunk(TEXT[budget:], budget)],   # 第 2 名命中
+        "business class?": [chunk("Intro line.", 0)],                                    # 没有命中
+    }
+    result = evaluate(lambda q: ranked[q], qa)
+    assert result["recall"] == 0.5
+    assert result["mrr"] == pytest.approx(0.25)
+    assert result["latency"]["p50"] >= 0 and result["ctx_tokens"] > 0
+
+
+def test_unknown_retriever_is_rejected():
+    with pytest.raises(ValueError, match="Unknown retriever"):
+        make_retriever("colbert", None, None, 4)
+
+
+def test_sweep_on_the_bundled_qa_set(tmp_path):
+    out = tmp_path / "results.json"
+    subprocess.run([sys.executable, "bench_retrieval.py", "--chunk-sizes", "128", "--overlaps", "12", "--ks", "2,4",
+                    "--json", str(out)], cwd=PACKAGE_DIR, check=True, capture_output=True, timeout=120)
+    results = json.loads(out.read_text())
+    assert len(results) == 4 * 2
+    by_name = {(r["retriever"], r["k"]): r for r in results}
+    for r in results:
+        assert 0 <= r["mrr"] <= r["recall"] <= 1
+    assert by_name["hybrid", 4]["recall"] >= 0.8
+    assert by_name["dense", 4]["recall"] >= by_name["dense", 2]["recall"]
+    assert by_name["bm25", 4]["ctx_tokens"] >= by_name["bm25", 2]["ctx_tokens"]
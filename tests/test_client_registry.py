@@ -0,0 +1,58 @@
+import asyncio
+
+from client_registry import ClientKey, ClientRegistry
+from utils import get_model
+
+
+def make_key(provider="openai", model="gpt", temperature=0.7):
+    return ClientKey("chat", provider, model, temperature, None)
+
+
+def test_get_or_create_builds_each_key_once():
+    registry = ClientRegistry()
+    calls = []
+
+    def factory(pool):
+        calls.append(pool)
+        return object()
+
+    first = registry.get_or_create(make_key(), factory)
+    assert registry.get_or_create(make_key(), factory) is first
+    assert registry.get_or_create(make_key(temperature=0), factory) is not first
+    assert len(calls) == 2
+    assert calls[0] is calls[1]          # 所有 client 共享同一个连接池
+    stats = registry.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 2, 2)
+    registry.shutdown()
+
+
+def test_evict_filters_by_key_fields():
+    registry = ClientRegistry()
+    for provider in ("openai", "deepseek", "deepseek"):
+        registry.get_or_create(make_key(provider, model=f"{provider}-{registry.misses}"), lambda pool: object())
+    assert registry.evict(provider="deepseek") == 2
+    assert [k.provider for k in registry.stats()["keys"]] == ["openai"]
+    assert registry.evict() == 1
+    assert registry.stats()["evictions"] == 3
+    registry.shutdown()
+
+
+def test_shutdown_closes_pool_and_recreates_on_demand():
+    registry = ClientRegistry()
+    pool = registry.http_pool()
+    registry.shutdown()
+    assert pool.sync.is_closed
+    assert registry.http_pool() is not pool
+    registry.shutdown()
+
+
+def test_get_model_returns_shared_instance():
+    assert get_model("stub", temperature=0) is get_model("stub", temperature=0)
+    assert get_model("stub", temperature=0) is not get_model("stub", temperature=0.5)
+
+
+def test_async_pool_survives_multiple_event_loops():
+    # 每个 asyncio.run() 都是新的事件循环；共享的 AsyncClient 不能复用上一个 loop 的连接
+    model = get_model("stub", temperature=0)
+    for _ in range(3):
+        assert asyncio.run(model.ainvoke("ping")).content
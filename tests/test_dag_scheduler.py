@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+
+from dag_scheduler import AssignDAG, prompt_variables
+
+
+def step(template, delay=0.05):
+    """Prompt 开头的假 step: 睡 delay 秒后返回渲染好的 prompt 文本 (依赖从 prompt 变量推导)。"""
+    def run(prompt_value):
+        time.sleep(delay)
+        return prompt_value.to_string()
+
+    async def arun(prompt_value):
+        await asyncio.sleep(delay)
+        return prompt_value.to_string()
+
+    return ChatPromptTemplate.from_template(template) | RunnableLambda(run, afunc=arun) | StrOutputParser()
+
+
+def make_dag(**kwargs):
+    return AssignDAG({
+        "explanation": step("explain {topic}"),
+        "pitfalls": step("pitfalls of {topic}"),
+        "code": step("code for {explanation}"),
+        "summary": step("summary: {explanation} / {code} / {pitfalls}"),
+    }, **kwargs)
+
+
+def test_dependencies_come_from_prompt_variables():
+    dag = make_dag()
+    assert {name: set(deps) for name, deps in dag.deps.items()} == {
+        "explanation": set(), "pitfalls": set(), "code": {"explanation"},
+        "summary": {"explanation", "code", "pitfalls"}}
+    assert prompt_variables(step("{a} {b}")) == ["a", "b"]
+
+
+def test_steps_without_prompt_depend_on_all_previous_steps():
+    dag = AssignDAG({"a": step("{topic}"), "b": RunnableLambda(lambda x: 1), "c": step("{topic}")})
+    assert dag.deps == {"a": (), "b": ("a",), "c": ()}
+
+
+def test_explicit_deps_unknown_steps_and_cycles():
+    assert make_dag(deps={"pitfalls": ["code"]}).deps["pitfalls"] == ("code",)
+    with pytest.raises(ValueError, match="unknown"):
+        make_dag(deps={"code": ["missing"]})
+    with pytest.raises(ValueError, match="cycle"):
+        make_dag(deps={"explanation": ["code"]})
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_independent_steps_run_concurrently(mode):
+    dag = make_dag()
+    if mode == "sync":
+        result, trace = dag.invoke_with_trace({"topic": "LiveData"})
+    else:
+        result, trace = asyncio.run(dag.ainvoke_with_trace({"topic": "LiveData"}))
+    assert result["summary"] == ("Human: summary: Human: explain LiveData / Human: code for Human: explain "
+                                 "LiveData / Human: pitfalls of LiveData")
+    # 4 个 step 各 50ms，关键路径只有 3 步
+    assert trace.wall_s < trace.serial_s - 0.03
+    assert trace.critical_path() == ["explanation", "code", "summary"]
+    spans = trace.spans
+    assert spans["pitfalls"].start < spans["explanation"].end
+    assert spans["code"].start >= spans["explanation"].end
+
+
+def test_failed_step_propagates():
+    dag = AssignDAG({"a": step("{topic}"), "b": RunnableLambda(lambda x: 1 / 0)}, deps={"b": []})
+    with pytest.raises(ZeroDivisionError):
+        dag.invoke({"topic": "x"})
+
+
+def test_run_many_isolates_failures_and_bounds_concurrency():
+    in_flight = peak = 0
+
+    async def tracked(values):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            await asyncio.sleep(0.01)     # 同一 topic 的另一个 step 失败时会在这里被取消
+        finally:
+            in_flight -= 1
+        if values["topic"] == "bad":
+            raise ValueError("bad topic")
+        return values["topic"]
+
+    dag = AssignDAG({"a": RunnableLambda(lambda x: x, afunc=tracked),
+                     "b": RunnableLambda(lambda x: x, afunc=tracked)}, deps={"b": []}, output_key="b")
+    runs = dag.run_many([{"topic": t} for t in ("x", "bad", "y", "z")], max_concurrency=3)
+    assert [r.output for r in runs] == ["x", None, "y", "z"]
+    assert isinstance(runs[1].error, ValueError)
+    assert peak == 3
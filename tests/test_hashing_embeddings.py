@@ -0,0 +1,72 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from hashing_embeddings import HashingEmbeddings
+from utils import get_embeddings_model
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "langchain_learning")
+TEXTS = ["home office budget", "Home Office Budget!", "差旅报销需要在三十天内提交", "laptop disk encryption", ""]
+
+
+def cosine(a, b):
+    return float(np.dot(a, b))
+
+
+def test_vectors_are_unit_length_float32():
+    vectors = HashingEmbeddings(dim=128).embed_batch(TEXTS[:4])
+    assert vectors.shape == (4, 128) and vectors.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-5)
+    assert HashingEmbeddings(dim=16).embed_batch([]).shape == (0, 16)
+
+
+def test_batch_matches_single_texts():
+    # 批量计算时 n-gram 不跨越文本边界
+    embeddings = HashingEmbeddings(dim=64)
+    batch = embeddings.embed_documents(TEXTS)
+    for text, vector in zip(TEXTS, batch):
+        np.testing.assert_allclose(vector, embeddings.embed_query(text), atol=1e-6)
+
+
+def test_similarity_reflects_shared_ngrams():
+    embeddings = HashingEmbeddings(dim=512)
+    budget, shouting, zh, laptop = embeddings.embed_batch(TEXTS[:4])
+    assert cosine(budget, shouting) > 0.8                           # 默认转小写
+    assert cosine(budget, shouting) > cosine(budget, laptop) + 0.5
+    zh_query = embeddings.embed_query("报销提交期限")
+    assert cosine(zh_query, zh) > cosine(zh_query, budget)
+    cased = HashingEmbeddings(dim=512, lowercase=False).embed_batch(TEXTS[:2])
+    assert cosine(*cased) < cosine(budget, shouting)
+
+
+def test_deterministic_across_processes():
+    code = ("import json; from hashing_embeddings import HashingEmbeddings; "
+            "print(json.dumps(HashingEmbeddings(dim=32).embed_query('home office 预算')))")
+    outputs = {
+        subprocess.run([sys.executable, "-c", code], cwd=PACKAGE_DIR, capture_output=True, text=True, check=True,
+                       env={**os.environ, "PYTHONHASHSEED": seed}).stdout
+        for seed in ("1", "2")
+    }
+    assert len(outputs) == 1
+    assert json.loads(outputs.pop()) == HashingEmbeddings(dim=32).embed_query("home office 预算")
+
+
+def test_model_id_depends_on_parameters():
+    a, b = HashingEmbeddings(dim=64), HashingEmbeddings(dim=64, ngram_range=(1, 3))
+    assert (a.model, a.dimensions) == ("hashing-char2-4", 64)
+    assert b.model != a.model
+
+
+@pytest.mark.parametrize("use_env", [False, True])
+def test_registered_as_embeddings_provider(monkeypatch, use_env):
+    if use_env:
+        monkeypatch.setenv("EMBEDDINGS_PROVIDER", "hashing")
+        embeddings = get_embeddings_model()
+    else:
+        embeddings = get_embeddings_model("hashing")
+    assert isinstance(embeddings, HashingEmbeddings)
+    assert embeddings is get_embeddings_model("hashing")          # 经过 client_registry 复用
@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from hedging import HedgedModel, HedgeStats, get_hedged_model
+
+
+def fake_model(name, delay=0.0, error=None):
+    """延迟 delay 秒后返回 name (或抛出 error) 的假 model，同步 / 异步各一份实现。"""
+    def invoke(_):
+        time.sleep(delay)
+        if error:
+            raise error
+        return name
+
+    async def ainvoke(_):
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return name
+
+    return RunnableLambda(invoke, afunc=ainvoke)
+
+
+def hedged(primary, secondary, **kwargs):
+    kwargs.setdefault("initial_delay_s", 0.05)
+    return HedgedModel(primary, secondary, **kwargs)
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_fast_primary_is_not_hedged(mode):
+    model = hedged(fake_model("primary"), fake_model("secondary"))
+    call = model.invoke if mode == "sync" else lambda x: asyncio.run(model.ainvoke(x))
+    assert call("q") == "primary"
+    stats = model.stats.snapshot()
+    assert (stats["requests"], stats["hedged"], stats["primary_wins"]) == (1, 0, 1)
+    assert len(model.stats.primary_latencies()) == 1
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_slow_primary_is_hedged_and_records_lower_bound(mode):
+    model = hedged(fake_model("primary", delay=0.5), fake_model("secondary", delay=0.01))
+    call = model.invoke if mode == "sync" else lambda x: asyncio.run(model.ainvoke(x))
+    assert call("q") == "secondary"
+    stats = model.stats.snapshot()
+    assert (stats["hedged"], stats["secondary_wins"], stats["secondary_win_rate"]) == (1, 1, 1.0)
+    # primary 没有返回，窗口里记录的是它至少花了多久 (阈值 + secondary 耗时)
+    [lower_bound] = model.stats.primary_latencies()
+    assert 0.05 <= lower_bound < 0.5
+
+
+def test_primary_failure_fails_over_immediately():
+    model = hedged(fake_model("primary", error=RuntimeError("down")), fake_model("secondary"),
+                   initial_delay_s=5)
+    start = time.perf_counter()
+    assert asyncio.run(model.ainvoke("q")) == "secondary"
+    assert time.perf_counter() - start < 1
+    assert model.stats.primary_latencies() == []    # 失败的 primary 不是延迟样本
+
+
+def test_both_failing_raises_last_error():
+    model = hedged(fake_model("primary", error=RuntimeError("primary down")),
+                   fake_model("secondary", error=RuntimeError("secondary down")))
+    with pytest.raises(RuntimeError, match="secondary down"):
+        model.invoke("q")
+    assert model.stats.snapshot()["failures"] == 1
+
+
+def test_hedge_delay_switches_to_percentile_after_min_samples():
+    stats = HedgeStats(window=100)
+    model = hedged(fake_model("p"), fake_model("s"), percentile=95, min_samples=20, initial_delay_s=2.0,
+                   stats=stats)
+    for ms in range(1, 20):
+        stats.record_primary_latency(ms / 1000)
+    assert model.hedge_delay() == 2.0
+    stats.record_primary_latency(0.020)
+    assert model.hedge_delay() == pytest.approx(0.019)
+
+
+def test_hedged_model_in_chain_cancels_async_loser():
+    flags = []
+
+    async def slow(_):
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            flags.append("cancelled")
+            raise
+        return "primary"
+
+    model = hedged(RunnableLambda(lambda x: x, afunc=slow), fake_model("secondary"))
+    chain = RunnableLambda(str.upper) | model
+
+    async def run():
+        result = await chain.ainvoke("q")
+        await asyncio.sleep(0)       # 让被取消的 primary 处理 CancelledError
+        return result
+
+    assert asyncio.run(run()) == "secondary"
+    assert flags == ["cancelled"]
+
+
+def test_get_hedged_model_rejects_same_provider():
+    with pytest.raises(ValueError):
+        get_hedged_model("stub", "stub")
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration
+
+import llm_cache
+from llm_cache import SQLiteResponseCache, cache_key, with_response_cache
+
+LLM_STRING = "model=stub-chat temperature=0"
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, "time", clock)
+    return clock
+
+
+def generation(text):
+    return [ChatGeneration(message=AIMessage(content=text))]
+
+
+def prompt(text, message_id=None):
+    return json.dumps([{"lc": 1, "type": "constructor", "id": ["HumanMessage"],
+                        "kwargs": {"content": text, "id": message_id}}])
+
+
+def test_key_ignores_message_ids_and_key_order():
+    assert cache_key(prompt("hi", "run-1"), LLM_STRING) == cache_key(prompt("hi", "run-2"), LLM_STRING)
+    assert cache_key(prompt("hi"), LLM_STRING) != cache_key(prompt("hi"), LLM_STRING + " tools=[x]")
+
+
+def test_round_trip_and_stats(tmp_path):
+    cache = SQLiteResponseCache(str(tmp_path / "cache.sqlite"))
+    assert cache.lookup(prompt("q"), LLM_STRING) is None
+    cache.update(prompt("q"), LLM_STRING, generation("answer"))
+    [hit] = cache.lookup(prompt("q"), LLM_STRING)
+    assert hit.message.content == "answer"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["writes"], stats["entries"]) == (1, 1, 1, 1)
+
+
+def test_entries_expire_after_max_age(tmp_path, clock):
+    cache = SQLiteResponseCache(str(tmp_path / "cache.sqlite"), max_age_s=60)
+    cache.update(prompt("q"), LLM_STRING, generation("answer"))
+    clock.now += 59
+    assert cache.lookup(prompt("q"), LLM_STRING) is not None
+    clock.now += 2
+    assert cache.lookup(prompt("q"), LLM_STRING) is None
+    assert cache.stats()["expired"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction_keeps_recently_read_entries(tmp_path, clock):
+    cache = SQLiteResponseCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    for text in ("a", "b"):
+        cache.update(prompt(text), LLM_STRING, generation(text))
+        clock.now += 1
+    cache.lookup(prompt("a"), LLM_STRING)          # a 变成最近访问
+    clock.now += 1
+    cache.update(prompt("c"), LLM_STRING, generation("c"))
+    assert cache.lookup(prompt("b"), LLM_STRING) is None
+    assert cache.lookup(prompt("a"), LLM_STRING) is not None
+    assert cache.lookup(prompt("c"), LLM_STRING) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_max_bytes_evicts_oldest(tmp_path, clock):
+    cache = SQLiteResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=1)
+    cache.update(prompt("a"), LLM_STRING, generation("a"))
+    # 单条就超过上限时连刚写入的也会被淘汰，缓存不会超过 max_bytes
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["bytes"] == 0
+
+
+def test_bypass_neither_reads_nor_writes(tmp_path, monkeypatch):
+    cache = SQLiteResponseCache(str(tmp_path / "cache.sqlite"))
+    monkeypatch.setenv("LLM_CACHE_BYPASS", "1")
+    cache.update(prompt("q"), LLM_STRING, generation("answer"))
+    assert cache.lookup(prompt("q"), LLM_STRING) is None
+    monkeypatch.delenv("LLM_CACHE_BYPASS")
+    assert cache.lookup(prompt("q"), LLM_STRING) is None
+    assert cache.stats()["bypassed"] == 2
+
+
+def test_cached_model_skips_second_request(tmp_path, stub_server, stub_chat):
+    cache = SQLiteResponseCache(str(tmp_path / "cache.sqlite"))
+    model = with_response_cache(stub_chat, cache)
+    messages = [HumanMessage("same question")]
+    first = model.invoke(messages).content
+    requests = stub_server.requests
+    assert model.invoke(messages).content == first
+    assert stub_server.requests == requests
+    assert cache.stats()["hits"] == 1
+
+
+def test_cache_requires_temperature_zero(stub_chat):
+    with pytest.raises(ValueError):
+        with_response_cache(stub_chat.model_copy(update={"temperature": 0.7}), SQLiteResponseCache(":memory:"))
@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from providers import LazyModel
+
+LESSON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "langchain_learning")
+
+
+@pytest.mark.parametrize("module", ["utils", "model_factory", "02_lcel_chain", "05_prompt_partials"])
+def test_import_does_not_load_provider_sdks(module):
+    # 全新子进程里 import，避免本进程已经加载过的 SDK 干扰结果
+    code = (f"import importlib, sys; importlib.import_module({module!r}); "
+            "print(sorted(m for m in ('langchain_openai', 'langchain_google_genai', 'openai') if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=LESSON_DIR, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
+
+
+class RecordingModel:
+    """记录 bind 调用顺序的假 model。"""
+
+    def __init__(self, binds=()):
+        self.binds = binds
+
+    def bind_tools(self, tools):
+        return RecordingModel(self.binds + (("bind_tools", tools),))
+
+    def bind(self, **kwargs):
+        return RecordingModel(self.binds + (("bind", kwargs),))
+
+    def invoke(self, input, config=None, **kwargs):
+        return self.binds
+
+
+def test_lazy_model_resolves_on_first_call_and_replays_binds():
+    resolved = []
+
+    def resolver(provider, temperature):
+        resolved.append((provider, temperature))
+        return RecordingModel()
+
+    lazy = LazyModel("stub", 0.3, resolver=resolver)
+    bound = lazy.bind_tools(["search"]).bind(stop=["\n"])
+    assert resolved == []
+    assert bound.invoke("hi") == (("bind_tools", ["search"]), ("bind", {"stop": ["\n"]}))
+    bound.invoke("again")
+    assert resolved == [("stub", 0.3)]          # 解析结果缓存在实例上
+    assert lazy._resolved is None               # bind 返回新的代理，原代理仍未解析
+
+
+def test_lazy_model_composes_in_lcel_chain():
+    chain = RunnableLambda(lambda x: x.upper()) | LazyModel("stub", resolver=lambda p, t: RunnableLambda(len))
+    assert chain.invoke("abc") == 3
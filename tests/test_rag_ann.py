@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from local_embeddings import LocalHashEmbeddings
+from rag_ann import AnnSpec, AnnStoreBuilder, build_index, index_nbytes
+
+
+def clustered_vectors(n, dim=64, clusters=50, seed=0):
+    """带聚类结构的合成向量 (纯随机向量上 IVF 的 recall 没有参考意义)。"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    points = centers[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dim))
+    return points.astype(np.float32)
+
+
+def recall_at(index, exact, queries, k=8):
+    _, truth = exact.search(queries, k)
+    _, found = index.search(queries, k)
+    return np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)])
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    vectors = clustered_vectors(6000)
+    exact, _, _, _ = build_index(vectors, AnnSpec("flat"))
+    return vectors, exact, clustered_vectors(100, seed=1)
+
+
+def test_parse_and_to_dict():
+    spec = AnnSpec.parse("hnsw:ef_search=128")
+    assert (spec.index_type, spec.ef_search) == ("hnsw", 128)
+    assert spec.to_dict() == {"index_type": "hnsw", "ef_search": 128}
+    assert AnnSpec.parse("").index_type == "flat"
+    with pytest.raises(ValueError):
+        AnnSpec.parse("ivf:nprobes=8")
+    with pytest.raises(ValueError):
+        AnnSpec("lsh")
+
+
+def test_resolve_scales_with_corpus_size():
+    spec = AnnSpec("ivf")
+    assert spec.resolve(500, 64) == {"index_type": "flat"}               # 小于 min_vectors 退回 flat
+    params = spec.resolve(10_000, 64)
+    assert params["nlist"] == 256 and params["nprobe"] == 16             # 4√n 个中心，扫 1/16
+    assert spec.resolve(1_000_000, 64)["nlist"] == 20_000 // 39          # 受训练样本数约束
+    assert AnnSpec("ivfpq", pq_m=7).resolve(10_000, 64)["pq_m"] == 4     # 子向量个数要整除维度
+    assert AnnSpec("ivf", expected_chunks=5_000).resolve(100, 64)["index_type"] == "ivf"
+
+
+@pytest.mark.parametrize("index_type,min_recall", [("ivf", 0.9), ("hnsw", 0.9), ("ivfpq", 0.4)])
+def test_ann_recall_against_flat(corpus, index_type, min_recall):
+    vectors, exact, queries = corpus
+    index, params, _, _ = build_index(vectors, AnnSpec(index_type))
+    assert params["index_type"] == index_type
+    assert index.ntotal == len(vectors)
+    assert recall_at(index, exact, queries) >= min_recall
+
+
+def test_ivfpq_is_much_smaller_than_flat(corpus):
+    vectors, exact, _ = corpus
+    index, _, _, _ = build_index(vectors, AnnSpec("ivfpq"))
+    assert index_nbytes(index) < index_nbytes(exact) / 4
+
+
+def test_store_builder_buffers_then_trains():
+    embeddings = LocalHashEmbeddings(dim=64)
+    docs = [Document(page_content=f"policy chunk {i} about topic {i % 37}", id=f"c{i}") for i in range(300)]
+    builder = AnnStoreBuilder(embeddings, AnnSpec("ivf", min_vectors=100, train_size=200))
+    for start in range(0, len(docs), 64):
+        builder.add_documents(docs[start:start + 64])
+        if start + 64 < 200:
+            assert builder._vectorstore is None              # 训练样本攒够之前只缓冲
+    store = builder.finish()
+    assert builder.resolved["index_type"] == "ivf"
+    assert store.index.ntotal == 300
+    assert store.index.is_trained and store.index.nprobe == builder.resolved["nprobe"]
+    assert store.get_by_ids(["c7"])[0].page_content == docs[7].page_content
+
+
+def test_small_corpus_falls_back_to_flat():
+    builder = AnnStoreBuilder(LocalHashEmbeddings(dim=32), AnnSpec("hnsw"))
+    builder.add_documents([Document(page_content="alpha"), Document(page_content="beta")])
+    store = builder.finish()
+    assert builder.resolved == {"index_type": "flat"}
+    assert store.similarity_search("alpha", k=1)[0].page_content == "alpha"
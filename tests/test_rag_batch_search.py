@@ -0,0 +1,193 @@
+import asyncio
+import sqlite3
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+import rag_batch_search
+from hashing_embeddings import HashingEmbeddings
+from rag_ann import AnnSpec, AnnStoreBuilder
+from rag_batch_search import BatchVectorRetriever
+from rag_embeddings import CachedEmbeddings
+from rag_quantized import QuantizedVectorStore
+from rag_retrievers import BM25Index, HybridRetriever
+
+TOPICS = ["travel", "budget", "laptop", "remote", "leave", "expense", "security", "training", "hiring", "benefits"]
+TEXTS = [f"policy {i}: {TOPICS[i % 10]} rules, section {i // 10}" for i in range(120)]
+QUERIES = ["travel rules", "laptop security", "section 3 budget", "remote work", "hiring benefits"]
+
+
+class RecordingEmbeddings(Embeddings):
+    """记录调用次数；包含 fail_on 的文本会让 embedding 请求失败。"""
+
+    def __init__(self, fail_on=None):
+        self.inner = HashingEmbeddings(dim=64)
+        self.model, self.dimensions = self.inner.model, 64
+        self.fail_on = fail_on
+        self.calls = []
+
+    def _check(self, texts):
+        self.calls.append(list(texts))
+        if self.fail_on and any(self.fail_on in t for t in texts):
+            raise RuntimeError(f"cannot embed {self.fail_on!r}")
+
+    def embed_documents(self, texts):
+        self._check(texts)
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        self._check([text])
+        return self.inner.embed_query(text)
+
+
+class RunRecorder(BaseCallbackHandler):
+    def __init__(self):
+        self.starts, self.ends, self.errors = [], [], []
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, tags=None, metadata=None,
+                           **kwargs):
+        self.starts.append({"query": query, "run_id": run_id, "parent": parent_run_id, "tags": tags,
+                            "name": kwargs.get("name")})
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self.ends.append(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self.errors.append(run_id)
+
+
+def contents(results):
+    return [[d.page_content for d in docs] for docs in results]
+
+
+def expected(store, k=4):
+    return contents(store.as_retriever(search_kwargs={"k": k}).batch(QUERIES))
+
+
+@pytest.fixture
+def embeddings():
+    return RecordingEmbeddings()
+
+
+@pytest.fixture
+def store(embeddings):
+    store = FAISS.from_texts(TEXTS, embeddings)
+    embeddings.calls.clear()
+    return store
+
+
+def test_batch_matches_as_retriever_with_one_embedding_call(store, embeddings):
+    retriever = BatchVectorRetriever(vectorstore=store, k=4)
+    want = expected(store)
+    embeddings.calls.clear()
+    assert contents(retriever.batch(QUERIES)) == want
+    assert embeddings.calls == [QUERIES]
+    assert [d.page_content for d in retriever.invoke(QUERIES[0])] == want[0]
+    assert retriever.batch([]) == []
+
+
+def test_small_score_blocks_give_the_same_results(store, monkeypatch):
+    monkeypatch.setattr(rag_batch_search, "MAX_SCORE_BYTES", 4 * len(TEXTS) * 2)   # 每块 2 条查询
+    assert contents(BatchVectorRetriever(vectorstore=store, k=4).batch(QUERIES)) == expected(store)
+
+
+def test_inner_product_and_normalized_stores():
+    for kwargs in ({"distance_strategy": DistanceStrategy.MAX_INNER_PRODUCT}, {"normalize_L2": True}):
+        store = FAISS.from_texts(TEXTS, HashingEmbeddings(dim=64), **kwargs)
+        assert contents(BatchVectorRetriever(vectorstore=store, k=3).batch(QUERIES)) == expected(store, k=3)
+
+
+def test_ann_and_quantized_stores(embeddings):
+    builder = AnnStoreBuilder(embeddings, AnnSpec("hnsw", min_vectors=50))
+    builder.add_documents([Document(page_content=t) for t in TEXTS])
+    hnsw = builder.finish()
+    assert builder.resolved["index_type"] == "hnsw"
+    assert contents(BatchVectorRetriever(vectorstore=hnsw, k=4).batch(QUERIES)) == expected(hnsw)
+
+    quantized = QuantizedVectorStore.from_texts(TEXTS, embeddings, dtype="float16")
+    assert contents(BatchVectorRetriever(vectorstore=quantized, k=4).batch(QUERIES)) == expected(quantized)
+
+
+def test_each_input_gets_its_own_retriever_run(store):
+    recorder = RunRecorder()
+    retriever = BatchVectorRetriever(vectorstore=store, k=2, tags=["dense"])
+    retriever.batch(QUERIES[:2], [{"callbacks": [recorder], "tags": ["q0"], "run_name": "first"},
+                                  {"callbacks": [recorder], "tags": ["q1"]}])
+    assert [s["query"] for s in recorder.starts] == QUERIES[:2]
+    assert [set(s["tags"]) for s in recorder.starts] == [{"q0", "dense"}, {"q1", "dense"}]
+    assert [s["name"] for s in recorder.starts] == ["first", "BatchVectorRetriever"]
+    assert recorder.ends == [s["run_id"] for s in recorder.starts]
+
+
+def test_hybrid_batch_nests_dense_runs(store):
+    recorder = RunRecorder()
+    bm25 = BM25Index()
+    bm25.add_documents([Document(page_content=t) for t in TEXTS])
+    dense = BatchVectorRetriever(vectorstore=store, k=8)
+    hybrid = HybridRetriever(vector_retriever=dense, bm25=bm25, k=3, fetch_k=8)
+    results = hybrid.batch(QUERIES, {"callbacks": [recorder]})
+    assert contents(results) == [[d.page_content for d in hybrid.invoke(q)] for q in QUERIES]
+    hybrid_runs = [s["run_id"] for s in recorder.starts if s["parent"] is None]
+    assert len(hybrid_runs) == len(QUERIES)
+    assert [s["parent"] for s in recorder.starts if s["parent"] is not None] == hybrid_runs
+
+
+def test_return_exceptions_falls_back_to_single_queries():
+    embeddings = RecordingEmbeddings(fail_on="boom")
+    store = FAISS.from_texts(TEXTS, embeddings)
+    retriever = BatchVectorRetriever(vectorstore=store, k=2)
+    recorder = RunRecorder()
+    inputs = ["travel rules", "boom", "laptop security"]
+    results = retriever.batch(inputs, {"callbacks": [recorder]}, return_exceptions=True)
+    assert isinstance(results[1], RuntimeError)
+    assert contents([results[0], results[2]]) == contents(store.as_retriever(search_kwargs={"k": 2}).batch(
+        [inputs[0], inputs[2]]))
+    assert len(recorder.errors) == 1 and len(recorder.ends) == 2
+
+    recorder = RunRecorder()
+    with pytest.raises(RuntimeError):
+        retriever.batch(inputs, {"callbacks": [recorder]})
+    assert len(recorder.errors) == len(inputs)
+
+
+def test_abatch(store):
+    retriever = BatchVectorRetriever(vectorstore=store, k=4)
+    recorder = RunRecorder()
+    assert contents(asyncio.run(retriever.abatch(QUERIES, {"callbacks": [recorder]}))) == expected(store)
+    assert len(recorder.ends) == len(QUERIES)
+    assert [d.page_content for d in asyncio.run(retriever.ainvoke(QUERIES[1]))] == expected(store)[1]
+
+
+def test_prefetching_serves_invokes_then_clears(store, embeddings):
+    retriever = BatchVectorRetriever(vectorstore=store, k=4)
+    want = expected(store)
+    embeddings.calls.clear()
+    with retriever.prefetching(QUERIES + QUERIES[:1]) as count:
+        assert count == len(QUERIES)                      # 重复的问题只检索一次
+        assert [d.page_content for d in retriever.invoke(QUERIES[0])] == want[0]
+        assert embeddings.calls == [QUERIES]              # invoke 取的是暂存结果
+        assert retriever.clear_prefetched() == len(QUERIES) - 1
+    retriever.prefetch(QUERIES)
+    with retriever.prefetching(QUERIES[:1]):
+        pass
+    assert retriever.clear_prefetched() == 0              # 离开 with 块时清空
+
+
+def test_cached_embeddings_use_query_keys(tmp_path):
+    inner = RecordingEmbeddings()
+    cached = CachedEmbeddings(inner, path=str(tmp_path / "cache.sqlite"), cache_queries=True)
+    store = FAISS.from_texts(TEXTS, cached)
+    before = cached.totals.total
+    BatchVectorRetriever(vectorstore=store, k=2).batch(QUERIES)
+    inner.calls.clear()
+    cached.embed_query(QUERIES[0])                        # 批量检索写入的就是 query 缓存
+    assert inner.calls == []
+    assert cached.totals.total == before                  # 问题不计入 chunk 统计
+    with sqlite3.connect(str(tmp_path / "cache.sqlite")) as conn:
+        query_keys = conn.execute("SELECT COUNT(*) FROM embeddings WHERE hash LIKE 'query:%'").fetchone()[0]
+    assert query_keys == len(QUERIES)
+    assert asyncio.run(cached.aembed_queries(QUERIES)) == cached.embed_queries(QUERIES)
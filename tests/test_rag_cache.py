@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+from local_embeddings import LocalHashEmbeddings
+from rag_cache import SemanticAnswerCache, corpus_fingerprint
+
+
+@pytest.fixture
+def chain_calls():
+    return []
+
+
+@pytest.fixture
+def cached(chain_calls):
+    def answer(inputs):
+        chain_calls.append(inputs["input"])
+        return {"input": inputs["input"], "answer": f"answer to {inputs['input']}"}
+
+    return SemanticAnswerCache(RunnableLambda(answer), LocalHashEmbeddings(), threshold=0.9, index_version="v1")
+
+
+def test_similar_question_hits_cache(cached, chain_calls):
+    cached.invoke({"input": "How much is the home office budget?"})
+    hit = cached.invoke({"input": "How much is the home office budget"})
+    assert chain_calls == ["How much is the home office budget?"]
+    assert hit["answer"] == "answer to How much is the home office budget?"
+    assert hit["input"] == "How much is the home office budget"
+    assert hit["cache_hit"]["similarity"] >= 0.9
+    assert cached.stats()["hit_rate"] == 0.5
+
+
+def test_unrelated_question_misses(cached, chain_calls):
+    cached.invoke({"input": "How much is the home office budget?"})
+    cached.invoke({"input": "Can I fly business class to New York?"})
+    assert len(chain_calls) == 2
+
+
+def test_new_index_version_invalidates_entries(cached, chain_calls):
+    cached.invoke({"input": "What tech stack do we use?"})
+    assert cached.set_index_version("v1") is False
+    assert cached.set_index_version("v2") is True
+    cached.invoke({"input": "What tech stack do we use?"})
+    assert len(chain_calls) == 2
+    assert cached.stats()["invalidations"] == 1
+
+
+def test_eviction_drops_least_recently_hit(chain_calls):
+    cache = SemanticAnswerCache(RunnableLambda(lambda x: chain_calls.append(x["input"]) or x["input"]),
+                                LocalHashEmbeddings(), threshold=0.95, max_entries=2)
+    for q in ("alpha question", "beta question", "alpha question", "gamma question"):
+        cache.invoke({"input": q})
+    assert cache.stats()["evictions"] == 1
+    cache.invoke({"input": "alpha question"})   # 最近命中过，仍在缓存里
+    cache.invoke({"input": "beta question"})    # 被淘汰，重新执行
+    assert chain_calls == ["alpha question", "beta question", "gamma question", "beta question"]
+
+
+def test_async_path_shares_the_cache(cached, chain_calls):
+    async def run():
+        await cached.ainvoke({"input": "What tech stack do we use?"})
+        return await cached.ainvoke({"input": "What tech stack do we use"})
+
+    assert "cache_hit" in asyncio.run(run())
+    assert len(chain_calls) == 1
+
+
+def test_corpus_fingerprint_tracks_content_and_model():
+    docs = [Document(page_content="a"), Document(page_content="b")]
+    base = corpus_fingerprint(docs, LocalHashEmbeddings())
+    assert base == corpus_fingerprint(list(docs), LocalHashEmbeddings())
+    assert base != corpus_fingerprint(docs[:1], LocalHashEmbeddings())
+    assert base != corpus_fingerprint(docs, LocalHashEmbeddings(dim=64))
@@ -0,0 +1,107 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+try:
+    from langchain.retrievers import ContextualCompressionRetriever
+except ImportError:
+    from langchain_classic.retrievers import ContextualCompressionRetriever
+
+from rag_compression import DOCUMENT_SEPARATOR, SentenceCompressor, split_sentences, truncate_to_tokens
+from tokens import count_tokens
+
+POLICY = (
+    "1.1 Home Office Budget\n"
+    "Each employee receives a home office budget of 500 dollars per year. "
+    "Unused budget does not roll over. "
+    "Purchases above the budget need manager approval.\n"
+    "1.2 Travel\n"
+    "Business class is allowed on flights longer than six hours. "
+    "All other flights are economy class. "
+    "Hotel bookings go through the travel portal."
+)
+SECURITY = (
+    "Laptops must use full disk encryption. "
+    "Passwords are rotated every ninety days. "
+    "Lost devices must be reported within one hour."
+)
+
+
+def docs():
+    return [Document(page_content=POLICY, metadata={"source": "policy.txt"}),
+            Document(page_content=SECURITY, metadata={"source": "security.txt"})]
+
+
+def context_tokens(documents):
+    return count_tokens(DOCUMENT_SEPARATOR.join(d.page_content for d in documents))
+
+
+def test_split_sentences_merges_headings_and_keeps_numbering():
+    sentences = split_sentences(POLICY)
+    assert sentences[0] == "1.1 Home Office Budget Each employee receives a home office budget of 500 dollars per year."
+    assert sentences[3].startswith("1.2 Travel Business class")
+    assert split_sentences("3. Engineering Standards apply to all teams.") == [
+        "3. Engineering Standards apply to all teams."]
+    assert split_sentences("员工每年享有十五天年假。年假可以顺延。") == ["员工每年享有十五天年假。", "年假可以顺延。"]
+    assert split_sentences("Trailing heading") == ["Trailing heading"]
+
+
+@pytest.mark.parametrize("budget", [8, 15, 30, 60, 120])
+def test_context_never_exceeds_the_budget(budget):
+    compressor = SentenceCompressor(token_budget=budget)
+    for query in ("home office budget", "business class flights", "laptop encryption", "unrelated question"):
+        compressed = compressor.compress_documents(docs(), query)
+        assert compressed
+        assert context_tokens(compressed) <= budget
+        assert compressor.last_report.tokens_after == context_tokens(compressed)
+
+
+def test_keeps_relevant_sentences_in_original_order():
+    compressor = SentenceCompressor(token_budget=60)
+    compressed = compressor.compress_documents(docs(), "What is the home office budget and does it roll over?")
+    assert len(compressed) == 1 and compressed[0].metadata == {"source": "policy.txt", "compressed": True}
+    text = compressed[0].page_content
+    assert "500 dollars" in text and "does not roll over" in text
+    assert text.index("500 dollars") < text.index("roll over")
+    assert "encryption" not in text
+    report = compressor.last_report
+    assert report.tokens_before == context_tokens(docs()) and report.tokens_saved > 0
+
+
+def test_neighbor_fill_adds_the_next_sentence():
+    query = "home office"
+    without = SentenceCompressor(token_budget=60, fill_neighbors=False).compress_documents(docs(), query)
+    with_fill = SentenceCompressor(token_budget=60).compress_documents(docs(), query)
+    assert "roll over" not in without[0].page_content
+    assert "roll over" in with_fill[0].page_content
+
+
+def test_overlapping_sentences_are_kept_once():
+    overlap = Document(page_content="Unused budget does not roll over. Remote work needs approval.")
+    compressed = SentenceCompressor(token_budget=200).compress_documents(docs()[:1] + [overlap], "budget roll over")
+    joined = " ".join(d.page_content for d in compressed)
+    assert joined.count("Unused budget does not roll over.") == 1
+
+
+def test_oversized_top_sentence_is_truncated():
+    long_sentence = "The budget " + "covers chairs desks monitors and lamps " * 20 + "for every employee."
+    compressed = SentenceCompressor(token_budget=10).compress_documents([Document(page_content=long_sentence)],
+                                                                        "budget")
+    assert compressed[0].page_content.startswith("The budget")
+    assert count_tokens(compressed[0].page_content) <= 10
+    assert truncate_to_tokens("short", 10) == "short"
+
+
+def test_plugs_into_contextual_compression_retriever():
+    class FixedRetriever(BaseRetriever):
+        def _get_relevant_documents(self, query, *, run_manager):
+            return docs()
+
+    compressor = SentenceCompressor(token_budget=40)
+    retriever = ContextualCompressionRetriever(base_compressor=compressor, base_retriever=FixedRetriever())
+    retriever.invoke("laptop encryption")
+    retriever.invoke("business class")
+    assert compressor.totals.queries == 2
+    assert compressor.totals.tokens_before == 2 * context_tokens(docs())
+    assert compressor.totals.tokens_after <= 80
+    assert compressor.compress_documents([], "anything") == []
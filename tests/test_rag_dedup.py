@@ -0,0 +1,126 @@
+import random
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from hashing_embeddings import HashingEmbeddings
+from rag_dedup import MinHasher, NearDuplicateFilter, dependent_duplicates, lsh_params, shingle_hashes
+from rag_ingest import ingest_directory
+
+WORDS = ("policy employee budget remote office travel flight class manager approval security laptop "
+         "password leave vacation expense receipt hotel meal review").split()
+DISCLAIMER = ("This document is confidential and intended for employees only. If you have any questions "
+              "about this policy, please contact the HR team at hr@example.com.")
+
+
+def sentence(rng, words=40):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def perturb(text, edits, rng):
+    words = text.split()
+    for _ in range(edits):
+        words[rng.randrange(len(words))] = rng.choice(WORDS)
+    return " ".join(words)
+
+
+def jaccard(a, b):
+    x, y = set(shingle_hashes(a).tolist()), set(shingle_hashes(b).tolist())
+    return len(x & y) / len(x | y)
+
+
+def doc(text, doc_id, source=None):
+    source = source or doc_id.rpartition(":")[0]
+    return Document(page_content=text, id=doc_id,
+                    metadata={"source": source, "start_index": int(doc_id.rpartition(":")[2])})
+
+
+def test_minhash_estimates_jaccard():
+    rng = random.Random(0)
+    hasher = MinHasher(num_perm=256)
+    for edits in (0, 2, 6, 15, 40):
+        a = sentence(rng)
+        b = perturb(a, edits, rng)
+        sig = hasher.signatures([a, b])
+        assert np.mean(sig[0] == sig[1]) == pytest.approx(jaccard(a, b), abs=0.1)
+    empty = hasher.signatures(["", "   "])
+    assert (empty == np.iinfo(np.uint32).max).all()
+
+
+def test_lsh_curve_sits_below_the_threshold():
+    for threshold in (0.5, 0.7, 0.85, 0.95):
+        bands, rows = lsh_params(threshold, 128)
+        assert bands * rows == 128
+        assert (1 / bands) ** (1 / rows) <= threshold
+
+
+def test_canonical_map_records_duplicates_by_id():
+    rng = random.Random(1)
+    unique = [sentence(rng) for _ in range(20)]
+    docs = [doc(text, f"a.txt:{i * 1000}") for i, text in enumerate(unique)]
+    docs.insert(3, doc(DISCLAIMER, "a.txt:99"))
+    docs += [doc(DISCLAIMER, "b.txt:0"), doc(DISCLAIMER.replace("HR team", "HR  team"), "c.txt:50"),
+             doc(perturb(unique[4], 1, rng), "b.txt:700")]
+    dedup = NearDuplicateFilter(threshold=0.85)
+    kept = dedup.filter(docs)
+    assert [d.id for d in kept] == [d.id for d in docs[:21]]
+    assert dedup.merged == {
+        "a.txt:99": [{"id": "b.txt:0", "source": "b.txt", "start_index": 0},
+                     {"id": "c.txt:50", "source": "c.txt", "start_index": 50}],
+        "a.txt:4000": [{"id": "b.txt:700", "source": "b.txt", "start_index": 700}],
+    }
+    assert (dedup.report.chunks, dedup.report.duplicates) == (24, 3)
+    assert dedup.report.tokens_skipped > 0 and "3/24" in dedup.report.summary_line(dim=64)
+
+
+def test_threshold_controls_what_counts_as_duplicate():
+    rng = random.Random(2)
+    base = sentence(rng, 60)
+    variant = perturb(base, 12, rng)
+    similarity = jaccard(base, variant)
+    assert 0.4 < similarity < 0.8
+    strict = NearDuplicateFilter(threshold=0.9)
+    assert len(strict.filter([doc(base, "a:0"), doc(variant, "a:1")])) == 2
+    loose = NearDuplicateFilter(threshold=max(0.1, similarity - 0.2))
+    assert len(loose.filter([doc(base, "a:0"), doc(variant, "a:1")])) == 1
+
+
+def test_filter_stream_dedups_across_batches():
+    rng = random.Random(3)
+    texts = [sentence(rng) for _ in range(30)]
+    docs = [doc(t, f"a.txt:{i}") for i, t in enumerate(texts + texts[:10])]
+    stream = NearDuplicateFilter()
+    assert [d.id for d in stream.filter_stream(docs, batch_size=7)] == [d.id for d in docs[:30]]
+    assert stream.report.duplicates == 10
+
+
+def test_ingest_skips_duplicates_and_annotates_canonical(tmp_path):
+    rng = random.Random(4)
+    data = tmp_path / "data"
+    data.mkdir()
+    for name in ("a.txt", "b.txt", "c.txt"):
+        (data / name).write_text("\n\n".join([sentence(rng, 20), DISCLAIMER, sentence(rng, 20)]) + "\n")
+    splitter = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=0, add_start_index=True)
+    dedup = NearDuplicateFilter()
+    seen = []
+    store, report = ingest_directory(str(data), HashingEmbeddings(dim=64), splitter, dedup=dedup,
+                                     on_batch=seen.extend)
+    assert report.duplicates == 2 and store.index.ntotal == report.chunks == 7
+    canonical = next(d for d in seen if d.page_content == DISCLAIMER)
+    stored = store.docstore.search(canonical.id)
+    assert canonical.id.startswith("a.txt:")
+    assert [d["source"] for d in stored.metadata["duplicates"]] == [str(data / "b.txt"), str(data / "c.txt")]
+    assert dedup.apply_to_documents(seen) == 1 and canonical.metadata["duplicates"] == stored.metadata["duplicates"]
+
+
+def test_dependent_duplicates():
+    canonical = doc(DISCLAIMER, "a.txt:0")
+    canonical.metadata["duplicates"] = [{"id": "a.txt:500"}, {"id": "b.txt:0"}, {"source": "legacy.txt"}]
+    other = doc("unique", "b.txt:100")
+    assert dependent_duplicates([canonical, other], ["a.txt"]) == {
+        "a.txt:0": [{"id": "b.txt:0"}, {"source": "legacy.txt"}]}      # 同文件的重复不算；没有 id 的按外部处理
+    assert dependent_duplicates([canonical, other], ["b.txt"]) == {}    # 改的是重复项所在的文件
+    canonical.metadata["duplicates"] = [{"id": "a.txt:500"}, {"id": "b.txt:0"}]
+    assert dependent_duplicates([canonical], ["a.txt", "b.txt"]) == {}
@@ -0,0 +1,148 @@
+import asyncio
+import sqlite3
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from local_embeddings import LocalHashEmbeddings
+from rag_embeddings import BatchedEmbeddings, CachedEmbeddings, embedding_model_id, is_payload_error
+
+
+class CountingEmbeddings(Embeddings):
+    """记录每次请求内容的 LocalHashEmbeddings。"""
+
+    def __init__(self, dim=64):
+        self.inner = LocalHashEmbeddings(dim=dim)
+        self.model = self.inner.model
+        self.dimensions = dim
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return self.inner.embed_query(text)
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "embeddings.sqlite")
+
+
+def test_only_new_or_changed_chunks_are_computed(cache_path):
+    inner = CountingEmbeddings()
+    cached = CachedEmbeddings(inner, path=cache_path)
+    first = cached.embed_documents(["alpha", "beta", "alpha"])
+    assert inner.calls == [["alpha", "beta"]]             # 同一批里的重复只算一次
+    assert cached.last_report.computed == 2
+
+    # 新进程 (新实例) 读同一个缓存文件：只有改过的 chunk 需要计算
+    inner = CountingEmbeddings()
+    cached = CachedEmbeddings(inner, path=cache_path)
+    second = cached.embed_documents(["beta", "alpha", "gamma"])
+    assert inner.calls == [["gamma"]]
+    assert (cached.last_report.reused, cached.last_report.computed) == (2, 1)
+    np.testing.assert_allclose(second[:2], [first[1], first[0]], atol=1e-6)
+    assert cached.stats()["entries"] == 3
+
+
+def test_cache_is_keyed_by_model(cache_path):
+    CachedEmbeddings(CountingEmbeddings(dim=64), path=cache_path).embed_documents(["alpha"])
+    other = CountingEmbeddings(dim=32)
+    vectors = CachedEmbeddings(other, path=cache_path).embed_documents(["alpha"])
+    assert other.calls == [["alpha"]]
+    assert len(vectors[0]) == 32
+    assert embedding_model_id(CachedEmbeddings(other, path=":memory:")) == embedding_model_id(other)
+
+
+def test_queries_use_their_own_keys(cache_path):
+    inner = CountingEmbeddings()
+    cached = CachedEmbeddings(inner, path=cache_path, cache_queries=True)
+    cached.embed_documents(["alpha"])
+    inner.calls.clear()
+    cached.embed_query("budget?")
+    cached.embed_query("budget?")
+    both = cached.embed_queries(["budget?", "leave?"])
+    np.testing.assert_allclose(both, [cached.embed_query("budget?"), cached.embed_query("leave?")], atol=1e-6)
+    assert inner.calls == [["budget?"], ["leave?"]]       # 两条路径共用同一份 query 缓存
+    with sqlite3.connect(cache_path) as conn:
+        keys = [row[0] for row in conn.execute("SELECT hash FROM embeddings")]
+    assert sum(key.startswith("query:") for key in keys) == 2
+    assert cached.totals.total == 1                       # 问题不计入 chunk 统计
+    assert cached.stats()["entries"] == 1                 # 也不计入缓存条目
+
+
+def test_queries_are_not_cached_by_default(cache_path):
+    inner = CountingEmbeddings()
+    cached = CachedEmbeddings(inner, path=cache_path)
+    cached.embed_query("q")
+    cached.embed_queries(["q"])
+    assert inner.calls == [["q"], ["q"]]
+    with sqlite3.connect(cache_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] == 0
+
+
+def test_async_methods_share_the_cache(cache_path):
+    inner = CountingEmbeddings()
+    cached = CachedEmbeddings(inner, path=cache_path)
+
+    async def run():
+        await cached.aembed_documents(["alpha"])
+        return await cached.aembed_documents(["alpha"])
+
+    asyncio.run(run())
+    assert inner.calls == [["alpha"]]
+
+
+def test_batches_respect_size_and_token_limits():
+    inner = CountingEmbeddings()
+    batched = BatchedEmbeddings(inner, max_batch_tokens=10_000, max_batch_size=3, max_concurrency=1)
+    texts = [f"chunk {i}" for i in range(7)]
+    assert batched.embed_documents(texts) == inner.inner.embed_documents(texts)
+    assert [len(call) for call in inner.calls[:3]] == [3, 3, 1]
+    assert batched.last_report.batches == 3
+
+    inner.calls.clear()
+    long_texts = ["word " * 40] * 4                        # 每条约 40 token
+    BatchedEmbeddings(inner, max_batch_tokens=100, max_concurrency=1).embed_documents(long_texts)
+    assert [len(call) for call in inner.calls] == [2, 2]
+
+
+def test_concurrent_batches_keep_input_order():
+    inner = CountingEmbeddings()
+    texts = [f"text number {i}" for i in range(50)]
+    vectors = BatchedEmbeddings(inner, max_batch_size=4, max_concurrency=8).embed_documents(texts)
+    assert vectors == inner.inner.embed_documents(texts)
+
+
+def test_payload_errors_split_the_batch_and_lower_the_limit(stub_server):
+    stub_server.config.update(embedding_max_batch_tokens=30)
+    remote = OpenAIEmbeddings(model="stub-embedding", api_key="stub", base_url=stub_server.base_url,
+                              check_embedding_ctx_length=False, max_retries=0)
+    texts = [f"policy paragraph number {i}" for i in range(12)]    # 每条约 7 个 stub token
+    batched = BatchedEmbeddings(remote, max_batch_tokens=10_000, max_concurrency=2)
+    vectors = batched.embed_documents(texts)
+
+    stub_server.config.update(embedding_max_batch_tokens=0)
+    assert vectors == remote.embed_documents(texts)
+    report = batched.last_report
+    assert report.retried_batches >= 1
+    assert report.batch_token_limit < 10_000
+
+
+def test_other_errors_are_not_retried():
+    class Broken(CountingEmbeddings):
+        def embed_documents(self, texts):
+            self.calls.append(list(texts))
+            raise RuntimeError("connection reset")
+
+    inner = Broken()
+    with pytest.raises(RuntimeError):
+        BatchedEmbeddings(inner, max_concurrency=1).embed_documents(["a", "b"])
+    assert len(inner.calls) == 1
+    assert not is_payload_error(RuntimeError("connection reset"))
+    assert is_payload_error(RuntimeError("Requested 500 tokens, max 300 tokens per request"))
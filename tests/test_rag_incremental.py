@@ -0,0 +1,240 @@
+import faiss
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from hashing_embeddings import HashingEmbeddings
+from rag_batch_search import BatchVectorRetriever
+from rag_incremental import (TOMBSTONE_ID, IncrementalFAISS, apply_to_bm25, diff_sources, empty_like,
+                             open_corpus_index)
+from rag_index_store import load_index
+from rag_ingest import ingest_directory
+from rag_mmr import MMRRetriever
+from rag_quantized import QuantizedVectorStore
+from rag_retrievers import BM25Index
+
+TOPICS = ["travel", "budget", "laptop", "remote", "leave", "expense", "security", "training"]
+QUERIES = ["travel rules", "laptop security section", "budget paragraph 3", "remote work policy"]
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.inner = HashingEmbeddings(dim=64)
+        self.model, self.dimensions = self.inner.model, 64
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.inner.embed_query(text)
+
+
+def paragraphs(name, count, start=0):
+    return [f"{name} paragraph {i}: the {TOPICS[i % 8]} policy section {i} applies to every employee."
+            for i in range(start, start + count)]
+
+
+def write(path, paras):
+    path.write_text("\n\n".join(paras) + "\n")
+
+
+@pytest.fixture
+def splitter():
+    return RecursiveCharacterTextSplitter(chunk_size=120, chunk_overlap=0, add_start_index=True)
+
+
+@pytest.fixture
+def data(tmp_path):
+    root = tmp_path / "data"
+    root.mkdir()
+    write(root / "a.txt", paragraphs("alpha", 12))
+    write(root / "b.txt", paragraphs("beta", 12))
+    return root
+
+
+def build(data, splitter, embeddings=None):
+    bm25 = BM25Index()
+    store, _ = ingest_directory(str(data), embeddings or HashingEmbeddings(dim=64), splitter,
+                                on_batch=bm25.add_documents)
+    return store, bm25
+
+
+def live_chunks(store):
+    return sorted((d.id, d.page_content, d.metadata["start_index"]) for d in store.live_documents())
+
+
+def search(store, query, k=4):
+    return [d.page_content for d in store.similarity_search(query, k=k)]
+
+
+def bm25_scores(bm25, query):
+    return {bm25.documents[i].id: score for i, score in bm25.search_ids(query, k=100)}
+
+
+def test_diff_sources():
+    assert diff_sources({"a": "1", "b": "2", "c": "3"}, {"a": "1", "b": "9", "d": "4"}) == (["b", "d"], ["c"])
+
+
+def test_sync_upserts_only_changed_chunks(data, splitter):
+    embeddings = CountingEmbeddings()
+    store, bm25 = build(data, splitter, embeddings)
+    store = IncrementalFAISS.from_faiss(store, compact_ratio=1.0)
+    assert store.docstore.search("a.txt:0").page_content.startswith("alpha paragraph 0")
+
+    # 文件开头插入一段、改写一段、删掉一段：后面的 chunk 正文不变但偏移都变了
+    edited = paragraphs("alpha", 12)
+    edited[5] = "alpha paragraph 5 was rewritten: remote work needs approval."
+    del edited[8]
+    write(data / "a.txt", ["alpha preface: this handbook describes the travel rules for all staff members."] + edited)
+    embeddings.embedded = 0
+    report = store.sync_files([str(data / "a.txt")], splitter=splitter, base_dir=str(data))
+
+    assert (report.files_changed, len(report.added), len(report.removed)) == (1, 2, 2)
+    assert len(report.moved) == 10 and report.unchanged == 0
+    assert embeddings.embedded == 2                        # 只有新正文需要 embedding
+    assert report.tombstones == 2 and store.index.ntotal == 24 + 2
+
+    fresh, fresh_bm25 = build(data, splitter)
+    assert live_chunks(store) == sorted((d.id, d.page_content, d.metadata["start_index"])
+                                        for d in IncrementalFAISS.from_faiss(fresh).live_documents())
+    for query in QUERIES:
+        assert search(store, query) == search(fresh, query)
+
+    assert apply_to_bm25(bm25, report)
+    fresh_bm25.finalize()
+    for query in QUERIES:
+        # 文档顺序不同 (新增的排在末尾)，同分时名次可能不同：按 chunk ID 比较分数
+        assert bm25_scores(bm25, query) == pytest.approx(bm25_scores(fresh_bm25, query))
+
+
+def test_removed_files_are_tombstoned_and_filtered(data, splitter):
+    store = IncrementalFAISS.from_faiss(build(data, splitter)[0], compact_ratio=1.0)
+    (data / "b.txt").unlink()
+    report = store.sync_files([], [str(data / "b.txt")], base_dir=str(data))
+    assert (report.files_removed, len(report.removed), report.tombstones) == (1, 12, 12)
+    assert all(d.id.startswith("a.txt:") for d in store.live_documents())
+    for query in ("beta paragraph 3", "travel policy"):
+        assert all(text.startswith("alpha") for text in search(store, query, k=6))
+        assert all(d.page_content.startswith("alpha")
+                   for d in BatchVectorRetriever(vectorstore=store, k=6).batch([query])[0])
+        assert all(d.page_content.startswith("alpha")
+                   for d in MMRRetriever(vectorstore=store, k=4, fetch_k=8).invoke(query))
+
+
+def test_compaction_renumbers_positions(data, splitter):
+    store = IncrementalFAISS.from_faiss(build(data, splitter)[0], compact_ratio=1.0)
+    (data / "b.txt").unlink()
+    store.sync_files([], [str(data / "b.txt")], base_dir=str(data))
+    before = {query: search(store, query) for query in QUERIES}
+    assert store.compact() == 12
+    assert store.index.ntotal == 12 and not store.tombstones
+    assert sorted(store.index_to_docstore_id) == list(range(12))
+    assert TOMBSTONE_ID not in store.index_to_docstore_id.values()
+    assert {query: search(store, query) for query in QUERIES} == before
+    assert store.compact() == 0
+
+    # 超过 compact_ratio 时 sync_files 自动压缩
+    auto = IncrementalFAISS.from_faiss(build(data, splitter)[0], compact_ratio=0.2)
+    write(data / "a.txt", paragraphs("alpha", 6))
+    report = auto.sync_files([str(data / "a.txt")], splitter=splitter, base_dir=str(data))
+    assert report.compacted == 6 and report.tombstones == 0 and auto.index.ntotal == 6
+
+
+def test_batch_searcher_follows_compaction_to_the_same_size(data, splitter):
+    store = IncrementalFAISS.from_faiss(build(data, splitter)[0], compact_ratio=0.2)
+    retriever = BatchVectorRetriever(vectorstore=store, k=4)
+    assert len(retriever.batch(QUERIES)) == len(QUERIES)    # 视图和范数已按旧索引缓存
+    old_index = store.index
+    write(data / "a.txt", paragraphs("gamma", 12))
+    report = store.sync_files([str(data / "a.txt")], splitter=splitter, base_dir=str(data))
+    assert report.compacted == 12 and store.index is not old_index
+    assert store.index.ntotal == 24                          # 压缩回原来的大小，只看 ntotal 发现不了
+    del old_index
+    fresh = build(data, splitter)[0]
+    assert ([[d.page_content for d in docs] for docs in retriever.batch(QUERIES)]
+            == [search(fresh, query) for query in QUERIES])
+
+def test_tombstones_survive_save_and_mmap_load(tmp_path, data, splitter):
+    embeddings = HashingEmbeddings(dim=64)
+    store = IncrementalFAISS.from_faiss(build(data, splitter)[0], compact_ratio=1.0)
+    write(data / "a.txt", paragraphs("alpha", 10))
+    store.sync_files([str(data / "a.txt")], splitter=splitter, base_dir=str(data))
+    store.save_local(str(tmp_path / "index"))
+
+    loaded = IncrementalFAISS.from_faiss(load_index(str(tmp_path / "index"), embeddings))
+    assert loaded.tombstones == store.tombstones and len(loaded.tombstones) == 2
+    assert live_chunks(loaded) == live_chunks(store)
+    assert loaded.compact() == 2                           # 映射的只读索引也能压缩 (写入的是新索引)
+    assert loaded.index.ntotal == 22
+    assert search(loaded, "travel policy") == search(store, "travel policy")
+
+
+def test_quantized_copy_skips_tombstones_without_compacting(tmp_path, data, splitter):
+    embeddings = HashingEmbeddings(dim=64)
+    store = IncrementalFAISS.from_faiss(build(data, splitter)[0], compact_ratio=1.0)
+    write(data / "a.txt", paragraphs("alpha", 10))
+    store.sync_files([str(data / "a.txt")], splitter=splitter, base_dir=str(data))
+    store.save_local(str(tmp_path / "index"))
+
+    loaded = IncrementalFAISS.from_faiss(load_index(str(tmp_path / "index"), embeddings))
+    index, tombstones = loaded.index, set(loaded.tombstones)
+    quantized = QuantizedVectorStore.from_faiss(loaded, dtype="int8")
+    assert loaded.index is index and loaded.tombstones == tombstones       # 传入的库没有被压缩
+    report = quantized.memory_report()
+    assert report.rescore and report.rescore_bytes == 0                   # 仍然从映射的索引重排
+    assert sorted(d.id for d in quantized.documents) == sorted(d.id for d in loaded.live_documents())
+    for query in QUERIES:
+        exact = {d.id: score for d, score in loaded.similarity_search_with_score(query, k=len(quantized.documents))}
+        results = quantized.similarity_search_with_score(query, k=4)
+        assert [score for _, score in results] == pytest.approx(sorted(exact.values())[:4], rel=1e-5)
+        assert all(score == pytest.approx(exact[d.id], rel=1e-5) for d, score in results)
+
+def test_empty_like_keeps_training():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(2000, 16)).astype(np.float32)
+    ivf = faiss.IndexIVFFlat(faiss.IndexFlatL2(16), 16, 8)
+    ivf.train(vectors)
+    ivf.add(vectors)
+    empty = empty_like(ivf)
+    assert empty.is_trained and empty.ntotal == 0 and empty.nlist == 8
+    assert ivf.ntotal == 2000
+    flat = empty_like(faiss.IndexFlatIP(16))
+    assert isinstance(flat, faiss.IndexFlat) and flat.metric_type == faiss.METRIC_INNER_PRODUCT
+
+
+def test_bm25_without_chunk_ids_needs_rebuild(data, splitter):
+    store = IncrementalFAISS.from_faiss(build(data, splitter)[0], compact_ratio=1.0)
+    write(data / "a.txt", paragraphs("alpha", 10))
+    report = store.sync_files([str(data / "a.txt")], splitter=splitter, base_dir=str(data))
+    legacy = BM25Index()
+    legacy.add_documents(d.model_copy(update={"id": None}) for d in store.live_documents())
+    assert not apply_to_bm25(legacy, report)
+
+
+def test_open_corpus_index_builds_loads_and_updates(tmp_path, data, splitter):
+    embeddings = CountingEmbeddings()
+    params = {"chunk_size": 120, "chunk_overlap": 0}
+
+    def open_index():
+        return open_corpus_index(str(data), str(tmp_path / "index"), embeddings, lambda: splitter, params)
+
+    built = open_index()
+    assert not built.loaded and built.live_chunks == 24 and len(built.bm25) == 24
+    loaded = open_index()
+    assert loaded.loaded and loaded.manifest.fingerprint() == built.manifest.fingerprint()
+
+    write(data / "b.txt", paragraphs("beta", 10))
+    embeddings.embedded = 0
+    updated = open_index()
+    assert not updated.loaded and embeddings.embedded == 0          # 只删了两段，不需要 embedding
+    assert updated.live_chunks == 22 and updated.vectorstore.tombstones
+    fresh, fresh_bm25 = build(data, splitter)
+    fresh_bm25.finalize()
+    assert live_chunks(updated.vectorstore) == live_chunks(IncrementalFAISS.from_faiss(fresh))
+    for query in QUERIES:
+        assert search(updated.vectorstore, query) == search(fresh, query)
+        assert bm25_scores(updated.bm25, query) == pytest.approx(bm25_scores(fresh_bm25, query))
+
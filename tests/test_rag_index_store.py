@@ -0,0 +1,129 @@
+import os
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from local_embeddings import LocalHashEmbeddings
+from rag_index_store import build_manifest, load_or_build_index, load_sidecar, read_manifest
+
+SPLITTER = {"chunk_size": 200, "chunk_overlap": 20}
+
+
+@pytest.fixture
+def embeddings():
+    return LocalHashEmbeddings(dim=64)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data = tmp_path / "data"
+    (data / "sub").mkdir(parents=True)
+    (data / "a.txt").write_text("alpha policy text")
+    (data / "sub" / "b.txt").write_text("beta policy text")
+    return data
+
+
+def sources(data_dir):
+    return [str(data_dir / "a.txt"), str(data_dir / "sub" / "b.txt")]
+
+
+def test_manifest_is_independent_of_working_directory(data_dir, embeddings, monkeypatch):
+    absolute = build_manifest(sources(data_dir), embeddings, SPLITTER, base_dir=str(data_dir))
+    assert set(absolute.sources) == {"a.txt", os.path.join("sub", "b.txt")}
+    monkeypatch.chdir(data_dir.parent)
+    relative = build_manifest(["data/a.txt", "data/sub/b.txt"], embeddings, SPLITTER, base_dir="data")
+    assert relative.matches(absolute)
+    # 默认 base_dir 是源文件的公共目录
+    assert build_manifest(sources(data_dir), embeddings, SPLITTER).matches(absolute)
+
+
+def test_manifest_match_rules(data_dir, embeddings):
+    manifest = build_manifest(sources(data_dir), embeddings, SPLITTER, base_dir=str(data_dir))
+    (data_dir / "a.txt").write_text("alpha policy text, revised")
+    edited = build_manifest(sources(data_dir), embeddings, SPLITTER, base_dir=str(data_dir))
+    assert not edited.matches(manifest)
+    assert edited.same_build_params(manifest)
+    assert edited.fingerprint() != manifest.fingerprint()
+
+    resplit = build_manifest(sources(data_dir), embeddings, {**SPLITTER, "chunk_size": 300},
+                             base_dir=str(data_dir))
+    other_model = build_manifest(sources(data_dir), LocalHashEmbeddings(dim=32), SPLITTER, base_dir=str(data_dir))
+    assert not resplit.same_build_params(edited)
+    assert not other_model.same_build_params(edited)
+
+
+def test_build_then_warm_start_from_mmap(tmp_path, data_dir, embeddings):
+    index_dir = str(tmp_path / "index")
+    manifest = build_manifest(sources(data_dir), embeddings, SPLITTER, base_dir=str(data_dir))
+    builds = []
+
+    def build():
+        builds.append(1)
+        docs = [Document(page_content=t) for t in ("alpha policy", "beta policy")]
+        return FAISS.from_documents(docs, embeddings), {"extra": {"docs": 2}}
+
+    store, loaded = load_or_build_index(index_dir, manifest, embeddings, build)
+    assert (loaded, len(builds)) == (False, 1)
+    store, loaded = load_or_build_index(index_dir, manifest, embeddings, build)
+    assert (loaded, len(builds)) == (True, 1)
+    # IO_FLAG_MMAP_IFC: flat 索引的向量是映射的文件，不是私有拷贝
+    assert store.index.codes.is_owned is False
+    assert store.similarity_search("alpha", k=1)[0].page_content == "alpha policy"
+    assert load_sidecar(index_dir, "extra") == {"docs": 2}
+    assert read_manifest(index_dir).num_chunks == 2
+
+
+def test_source_change_uses_update_fn_or_rebuilds(tmp_path, data_dir, embeddings):
+    index_dir = str(tmp_path / "index")
+    manifest = build_manifest(sources(data_dir), embeddings, SPLITTER, base_dir=str(data_dir))
+    build = lambda: FAISS.from_documents([Document(page_content="v1")], embeddings)
+    load_or_build_index(index_dir, manifest, embeddings, build)
+
+    (data_dir / "a.txt").write_text("changed")
+    changed = build_manifest(sources(data_dir), embeddings, SPLITTER, base_dir=str(data_dir))
+    updates = []
+
+    def update(store, previous):
+        updates.append(previous.fingerprint())
+        store.add_documents([Document(page_content="v2")])
+        return store
+
+    store, loaded = load_or_build_index(index_dir, changed, embeddings, build, update_fn=update)
+    assert updates == [manifest.fingerprint()]
+    assert (loaded, store.index.ntotal) == (False, 2)
+    assert read_manifest(index_dir).matches(changed)
+
+    (data_dir / "a.txt").write_text("changed again")
+    again = build_manifest(sources(data_dir), embeddings, SPLITTER, base_dir=str(data_dir))
+    store, _ = load_or_build_index(index_dir, again, embeddings, build)     # 没有 update_fn: 全量重建
+    assert store.index.ntotal == 1
+
+
+def test_corrupt_index_is_rebuilt(tmp_path, data_dir, embeddings):
+    index_dir = tmp_path / "index"
+    manifest = build_manifest(sources(data_dir), embeddings, SPLITTER, base_dir=str(data_dir))
+    build = lambda: FAISS.from_documents([Document(page_content="v1")], embeddings)
+    load_or_build_index(str(index_dir), manifest, embeddings, build)
+    (index_dir / "index.faiss").write_bytes(b"garbage")
+    store, loaded = load_or_build_index(str(index_dir), manifest, embeddings, build)
+    assert (loaded, store.index.ntotal) == (False, 1)
+
+
+def test_update_fn_can_ask_for_a_full_rebuild(tmp_path, data_dir, embeddings):
+    index_dir = str(tmp_path / "index")
+    manifest = build_manifest(sources(data_dir), embeddings, SPLITTER, base_dir=str(data_dir))
+    builds = []
+
+    def build():
+        builds.append(1)
+        return FAISS.from_documents([Document(page_content=f"v{len(builds)}")], embeddings)
+
+    load_or_build_index(index_dir, manifest, embeddings, build)
+    (data_dir / "a.txt").write_text("changed")
+    changed = build_manifest(sources(data_dir), embeddings, SPLITTER, base_dir=str(data_dir))
+    # 例如 canonical chunk 所在的文件变了 (rag_dedup.dependent_duplicates)：update_fn 返回 None
+    store, loaded = load_or_build_index(index_dir, changed, embeddings, build, update_fn=lambda store, prev: None)
+    assert (loaded, len(builds)) == (False, 2)
+    assert store.similarity_search("v2", k=1)[0].page_content == "v2"
+    assert read_manifest(index_dir).matches(changed)
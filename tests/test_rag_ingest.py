@@ -0,0 +1,80 @@
+import os
+
+import pytest
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from local_embeddings import LocalHashEmbeddings
+from rag_ingest import chunk_id, ingest_directory, iter_chunks, iter_files, iter_segments, source_key
+
+PARAGRAPH = "Employees may work remotely up to three days per week with manager approval. "
+
+
+def corpus_text(paragraphs=60):
+    return "\n\n".join(f"{i}. " + PARAGRAPH * (1 + i % 3) for i in range(paragraphs))
+
+
+@pytest.fixture
+def splitter():
+    return RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=40, add_start_index=True)
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    root = tmp_path / "data"
+    (root / "nested").mkdir(parents=True)
+    (root / ".hidden").mkdir()
+    (root / "b.txt").write_text(corpus_text())
+    (root / "nested" / "a.md").write_text(corpus_text(10))
+    (root / "notes.pdf").write_text("ignored")
+    (root / ".hidden" / "c.txt").write_text("ignored")
+    return root
+
+
+def test_iter_files_is_sorted_and_filtered(corpus):
+    assert [os.path.relpath(p, corpus) for p in iter_files(str(corpus))] == [
+        "b.txt", os.path.join("nested", "a.md")]
+    assert list(iter_files(str(corpus / "b.txt"))) == [str(corpus / "b.txt")]
+
+
+def test_segments_cover_the_file_and_cut_at_paragraphs(corpus):
+    path = str(corpus / "b.txt")
+    text = open(path).read()
+    segments = list(iter_segments(path, segment_chars=1000))
+    assert "".join(s for _, s in segments) == text
+    assert all(len(s) <= 1000 for _, s in segments)
+    assert all(s.endswith("\n\n") for _, s in segments[:-1])
+    assert [offset for offset, _ in segments] == [sum(len(s) for _, s in segments[:i]) for i in range(len(segments))]
+
+
+def test_chunk_offsets_point_into_the_file(corpus, splitter):
+    text = open(corpus / "b.txt").read()
+    chunks = list(iter_chunks(str(corpus / "b.txt"), splitter, segment_chars=1000))
+    assert len(chunks) > 20
+    for doc in chunks:
+        start = doc.metadata["start_index"]
+        assert text[start:start + len(doc.page_content)] == doc.page_content
+        assert doc.id == f"b.txt:{start}"
+
+
+def test_chunk_ids_do_not_depend_on_working_directory(corpus, splitter, monkeypatch):
+    absolute = [d.id for d in iter_chunks(str(corpus), splitter)]
+    monkeypatch.chdir(corpus.parent)
+    relative = [d.id for d in iter_chunks("data", splitter)]
+    assert absolute == relative
+    assert source_key("data/nested/a.md") == "a.md"
+    assert chunk_id("data/nested/a.md", 7, base_dir="data") == os.path.join("nested", "a.md") + ":7"
+
+
+def test_ingest_directory_streams_batches(corpus, splitter):
+    batches = []
+    store, report = ingest_directory(str(corpus), LocalHashEmbeddings(dim=64), splitter, batch_size=16,
+                                     segment_chars=1000, on_batch=batches.append)
+    assert (report.files, report.chunks) == (2, store.index.ntotal)
+    assert report.batches == len(batches) == -(-report.chunks // 16)
+    assert all(len(b) <= 16 for b in batches)
+    assert report.chars == sum(len(open(p).read()) for p in iter_files(str(corpus)))
+
+
+def test_ingest_directory_without_matches_raises(tmp_path, splitter):
+    with pytest.raises(ValueError, match="No documents"):
+        ingest_directory(str(tmp_path), LocalHashEmbeddings(dim=64), splitter)
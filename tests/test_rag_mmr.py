@@ -0,0 +1,67 @@
+import asyncio
+
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+from local_embeddings import LocalHashEmbeddings
+from rag_mmr import MMRRetriever, fetch_candidates, mmr_select
+from rag_quantized import QuantizedVectorStore
+
+# 相邻 chunk 有 overlap 时几乎重复：前两条只差一个词
+TEXTS = [
+    "The home office budget is 500 dollars per employee per year.",
+    "The home office budget is 500 dollars per employee each year.",
+    "Home office purchases above the budget need manager approval.",
+    "Business class is allowed on flights longer than six hours.",
+    "Laptops must use full disk encryption.",
+]
+
+
+@pytest.fixture
+def faiss_store():
+    return FAISS.from_texts(TEXTS, LocalHashEmbeddings(dim=256))
+
+
+@pytest.mark.parametrize("lambda_mult", [0.0, 0.3, 0.5, 0.9])
+@pytest.mark.parametrize("fetch_k", [5, 40])
+def test_matches_langchain_implementation(lambda_mult, fetch_k):
+    rng = np.random.default_rng(fetch_k)
+    query = rng.standard_normal(32).astype(np.float32)
+    candidates = (query + rng.standard_normal((fetch_k, 32)) * 2).astype(np.float32)
+    assert mmr_select(query, candidates, 4, lambda_mult) == maximal_marginal_relevance(
+        query, list(candidates), lambda_mult, 4)
+
+
+def test_edge_cases():
+    candidates = np.eye(3, dtype=np.float32)
+    assert mmr_select(candidates[0], candidates, k=0) == []
+    assert sorted(mmr_select(candidates[0], candidates, k=10)) == [0, 1, 2]
+    # λ = 1 退化为纯相关性排序
+    query = np.array([1.0, 0.5, 0.2], dtype=np.float32)
+    assert mmr_select(query, candidates, k=3, lambda_mult=1.0) == [0, 1, 2]
+
+
+def test_near_duplicates_are_skipped(faiss_store):
+    query = "home office budget per employee"
+    plain = [d.page_content for d in faiss_store.similarity_search(query, k=2)]
+    assert set(plain) == set(TEXTS[:2])                 # 相似度检索取回两条几乎相同的 chunk
+    mmr = [d.page_content for d in MMRRetriever(vectorstore=faiss_store, k=2, fetch_k=5).invoke(query)]
+    assert mmr[0] in TEXTS[:2] and mmr[1] not in TEXTS[:2]
+
+
+def test_candidates_come_with_stored_vectors(faiss_store):
+    embeddings = faiss_store.embedding_function
+    docs, vectors = fetch_candidates(faiss_store, embeddings.embed_query("laptop encryption"), fetch_k=3)
+    assert docs[0].page_content == TEXTS[4]
+    np.testing.assert_allclose(vectors, embeddings.embed_documents([d.page_content for d in docs]), atol=1e-6)
+
+
+@pytest.mark.parametrize("rescore", [True, False])
+def test_quantized_store_and_async(faiss_store, rescore):
+    store = QuantizedVectorStore.from_faiss(faiss_store, dtype="float16", rescore=rescore)
+    retriever = MMRRetriever(vectorstore=store, k=2, fetch_k=5)
+    expected = MMRRetriever(vectorstore=faiss_store, k=2, fetch_k=5).invoke("home office budget")
+    assert retriever.invoke("home office budget") == expected
+    assert asyncio.run(retriever.ainvoke("home office budget")) == expected
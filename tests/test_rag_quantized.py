@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+
+from local_embeddings import LocalHashEmbeddings
+from rag_index_store import load_index
+from rag_quantized import QuantizedVectors, QuantizedVectorStore, is_mapped_index, rescore
+
+TEXTS = [f"policy section {i}: {topic} rules for employees" for i, topic in
+         enumerate(["travel", "budget", "laptop", "remote", "leave", "expense", "security", "training"] * 8)]
+
+
+@pytest.fixture
+def embeddings():
+    return LocalHashEmbeddings(dim=128)
+
+
+def exact_distances(vectors, queries):
+    return ((queries[:, None, :] - vectors[None, :, :]) ** 2).sum(-1)
+
+
+@pytest.mark.parametrize("dtype,atol", [("float16", 0.05), ("int8", 1.0)])
+def test_distances_approximate_float32(dtype, atol):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, 32)).astype(np.float32)
+    queries = rng.normal(size=(3, 32)).astype(np.float32)
+    quantized = QuantizedVectors(dtype).fit(vectors)      # int8 的量化区间按全部数据统计
+    quantized.add(vectors[:300])
+    quantized.add(vectors[300:])
+    np.testing.assert_allclose(quantized.distances(queries), exact_distances(vectors, queries), atol=atol)
+    _, ids = quantized.search(queries, k=5)
+    assert ids.shape == (3, 5)
+
+
+def test_rescore_restores_exact_order():
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(200, 16)).astype(np.float32)
+    query = rng.normal(size=(1, 16)).astype(np.float32)
+    dist, ids = rescore(query, np.arange(200)[None, :], vectors, k=5)
+    expected = np.argsort(exact_distances(vectors, query)[0])[:5]
+    assert ids[0].tolist() == expected.tolist()
+    assert dist[0] == pytest.approx(exact_distances(vectors, query)[0][expected], rel=1e-5)
+
+
+@pytest.mark.parametrize("dtype,ratio", [("float16", 0.5), ("int8", 0.75)])
+def test_memory_report_counts_codes_only(embeddings, dtype, ratio):
+    store = QuantizedVectorStore.from_texts(TEXTS, embeddings, dtype=dtype)
+    report = store.memory_report()
+    assert (report.num_vectors, report.dim, report.rescore) == (len(TEXTS), 128, False)
+    assert report.float32_bytes == len(TEXTS) * 128 * 4
+    assert report.saved_ratio == pytest.approx(ratio, abs=0.05)
+    assert dtype in report.summary_line()
+
+
+def test_from_faiss_rescore_only_when_index_is_mapped(tmp_path, embeddings):
+    faiss_store = FAISS.from_texts(TEXTS, embeddings)
+    in_memory = QuantizedVectorStore.from_faiss(faiss_store)
+    assert not is_mapped_index(faiss_store.index)
+    assert in_memory.full_vectors is None                 # 内存里的索引不保留私有 float32 副本
+
+    forced = QuantizedVectorStore.from_faiss(faiss_store, rescore=True)
+    assert forced.memory_report().rescore_bytes == len(TEXTS) * 128 * 4
+    assert forced.memory_report().saved_ratio < 0
+
+    faiss_store.save_local(str(tmp_path))
+    mapped_store = load_index(str(tmp_path), embeddings)
+    assert is_mapped_index(mapped_store.index)
+    mapped = QuantizedVectorStore.from_faiss(mapped_store)
+    report = mapped.memory_report()
+    assert report.rescore and report.rescore_bytes == 0
+    assert "from mmap" in report.summary_line()
+    for query in ("travel rules", "policy section 17", "laptop security"):
+        # 重排后是精确的 float32 距离 (同分的 chunk 名次可能不同，所以比较分数)
+        assert ([score for _, score in mapped.similarity_search_with_score(query, k=4)]
+                == pytest.approx([score for _, score in faiss_store.similarity_search_with_score(query, k=4)],
+                                 rel=1e-5))
+
+
+def test_save_and_load_mmap_full_vectors(tmp_path, embeddings):
+    vectors = np.asarray(embeddings.embed_documents(TEXTS), dtype=np.float32)
+    store = QuantizedVectorStore.from_texts(TEXTS, embeddings)
+    store.save(str(tmp_path), full_vectors=vectors)
+    loaded = QuantizedVectorStore.load(str(tmp_path), embeddings)
+    assert isinstance(loaded.full_vectors, np.memmap)
+    assert loaded.memory_report().rescore_bytes == 0
+    assert loaded.similarity_search("budget rules", k=2) == store.similarity_search("budget rules", k=2)
+
+
+def test_unknown_dtype_is_rejected():
+    with pytest.raises(ValueError):
+        QuantizedVectors("int4")
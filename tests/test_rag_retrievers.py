@@ -0,0 +1,101 @@
+import math
+from collections import Counter
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from local_embeddings import LocalHashEmbeddings
+from rag_retrievers import BM25Index, HybridRetriever, reciprocal_rank_fusion, tokenize
+
+CORPUS = [
+    "Employees may fly business class on flights longer than six hours.",
+    "Economy class is required for all domestic flights.",
+    "Section 4.1.2 covers the home office budget of 500 dollars.",
+    "The home office budget renews every calendar year.",
+    "Laptops must use full disk encryption and a strong password.",
+    "Remote work requires manager approval for more than three days a week.",
+    "员工每年享有十五天带薪年假。",
+    "差旅费用需要在出行后三十天内提交报销。",
+]
+
+
+def make_docs(texts=CORPUS):
+    return [Document(page_content=t, metadata={"source": "policy.txt", "start_index": i * 100})
+            for i, t in enumerate(texts)]
+
+
+def reference_bm25(texts, query, k1=1.2, b=0.75):
+    """逐文档按 BM25 公式直接计算 (与 BM25Index 相同的 idf 形式)。"""
+    docs = [Counter(tokenize(t)) for t in texts]
+    avgdl = sum(sum(d.values()) for d in docs) / len(docs)
+    scores = []
+    for d in docs:
+        dl = sum(d.values())
+        score = 0.0
+        for term in set(tokenize(query)):
+            df = sum(term in other for other in docs)
+            if not df or term not in d:
+                continue
+            idf = math.log1p((len(docs) - df + 0.5) / (df + 0.5))
+            tf = d[term]
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+        scores.append(score)
+    return scores
+
+
+def test_tokenize_keeps_codes_and_splits_cjk():
+    assert tokenize("What is in Section 4.1.2 for GPT-4?") == ["section", "4.1.2", "gpt-4"]
+    assert tokenize("年假") == ["年", "假", "年假"]
+
+
+@pytest.mark.parametrize("query", ["business class flights", "home office budget", "4.1.2", "年假", "报销 费用"])
+def test_scores_match_reference_bm25(query):
+    index = BM25Index(max_df_ratio=1.0)
+    index.add_documents(make_docs())
+    index.finalize()
+    expected = reference_bm25(CORPUS, query)
+    results = index.search_ids(query, k=len(CORPUS))
+    assert results
+    for doc_id, score in results:
+        assert score == pytest.approx(expected[doc_id], rel=1e-5)
+    ranked = sorted((i for i, s in enumerate(expected) if s > 0), key=lambda i: -expected[i])
+    assert [doc_id for doc_id, _ in results] == ranked
+
+
+def test_exact_terms_rank_first_and_frequent_terms_are_skipped():
+    index = BM25Index(max_df_ratio=0.2)                # 8 个文档: df > 1 的词查询时跳过
+    index.add_documents(make_docs())
+    assert index.search("business class", k=1)[0].page_content.startswith("Employees may fly business")
+    assert index.search("4.1.2", k=1)[0].page_content.startswith("Section 4.1.2")
+    assert index.search("class flights") == []         # 两个词都出现在 2 个文档里
+    assert index.search("nonexistent words") == []
+
+
+def test_search_finalizes_lazily_after_new_documents():
+    index = BM25Index()
+    index.add_documents(make_docs()[:4])
+    assert len(index.search("encryption")) == 0
+    index.add_documents(make_docs()[4:])
+    assert index.search("encryption", k=1)[0].page_content.startswith("Laptops")
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    a, b, c = make_docs()[:3]
+    fused = reciprocal_rank_fusion([[a, b], [c, b]], k=3)
+    assert fused[0] is b                              # 两路都召回
+    assert fused[1:] == [a, c]                        # 同分时先出现的在前
+    assert reciprocal_rank_fusion([[a, b], [c, b]], k=1, weights=(0.0, 1.0)) == [c]
+
+
+def test_hybrid_retriever_fuses_dense_and_bm25():
+    docs = make_docs()
+    store = FAISS.from_documents(docs, LocalHashEmbeddings(dim=256))
+    bm25 = BM25Index()
+    bm25.add_documents(docs)
+    retriever = HybridRetriever(vector_retriever=store.as_retriever(search_kwargs={"k": 4}), bm25=bm25, k=2,
+                                fetch_k=4)
+    results = retriever.invoke("Section 4.1.2")
+    assert len(results) == 2
+    assert results[0].page_content.startswith("Section 4.1.2")
+    assert len({(d.metadata["start_index"]) for d in retriever.batch(["年假", "budget"])[0]}) == 2
@@ -0,0 +1,74 @@
+import random
+
+import pytest
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from rag_splitter import FastRecursiveSplitter
+from tokens import count_tokens
+
+WORDS = "policy employee budget remote office travel flight manager approval laptop leave expense".split()
+ZH = ["员工每年享有十五天带薪年假。", "差旅费用需在出行后三十天内提交报销。", "远程办公需要提前与直属经理确认。"]
+
+
+def mixed_text(paragraphs=40, seed=7):
+    rng = random.Random(seed)
+    out = []
+    for _ in range(paragraphs):
+        lines = []
+        for _ in range(rng.randint(1, 4)):
+            if rng.random() < 0.3:
+                lines.append("".join(rng.choice(ZH) for _ in range(rng.randint(1, 6))))
+            else:
+                lines.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 60))))
+        out.append("\n".join(lines))
+    return "\n\n".join(out)
+
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(100, 0), (200, 40), (500, 50)])
+def test_matches_langchain_recursive_splitter(chunk_size, chunk_overlap):
+    text = mixed_text()
+    reference = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                               length_function=len, add_start_index=True)
+    fast = FastRecursiveSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=len,
+                                 add_start_index=True)
+    assert fast.split_text(text) == reference.split_text(text)
+    # 按字符计长时 LangChain 的 start_index 回查是准确的，两者的偏移应完全一致
+    assert ([d.metadata["start_index"] for d in fast.create_documents([text])]
+            == [d.metadata["start_index"] for d in reference.create_documents([text])])
+
+
+def test_start_index_points_at_the_chunk_even_for_repeated_text():
+    # 重复段落让 "text.find 回查" 式的定位容易错位；下标直接来自切分过程
+    text = "\n\n".join(["same paragraph about the travel budget policy"] * 12 + [mixed_text(5)])
+    splitter = FastRecursiveSplitter(chunk_size=20, chunk_overlap=8, add_start_index=True)
+    docs = splitter.create_documents([text], metadatas=[{"source": "x"}])
+    starts = [d.metadata["start_index"] for d in docs]
+    assert starts == sorted(starts) and len(set(starts)) == len(starts)
+    for doc in docs:
+        start = doc.metadata["start_index"]
+        assert text[start:start + len(doc.page_content)] == doc.page_content
+        assert doc.metadata["source"] == "x"
+
+
+def test_chunks_respect_the_token_budget():
+    text = mixed_text(80)
+    chunks = FastRecursiveSplitter(chunk_size=64, chunk_overlap=8).split_text(text)
+    assert len(chunks) > 10
+    assert max(count_tokens(c) for c in chunks) <= 64
+
+
+def test_overlap_repeats_the_tail_of_the_previous_chunk():
+    text = " ".join(f"w{i}" for i in range(200))
+    chunks = FastRecursiveSplitter(chunk_size=30, chunk_overlap=10, length_function=len).split_text(text)
+    for prev, cur in zip(chunks, chunks[1:]):
+        assert cur.split()[0] in prev.split()
+
+
+def test_split_documents_keeps_metadata_and_rejects_bad_overlap():
+    docs = FastRecursiveSplitter(chunk_size=10, chunk_overlap=2, length_function=len).split_documents(
+        [Document(page_content="alpha beta gamma delta", metadata={"page": 3})])
+    assert [d.page_content for d in docs] == ["alpha beta", "gamma", "delta"]
+    assert all(d.metadata == {"page": 3} for d in docs)
+    with pytest.raises(ValueError):
+        FastRecursiveSplitter(chunk_size=10, chunk_overlap=11)
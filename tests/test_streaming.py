@@ -0,0 +1,56 @@
+import asyncio
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from streaming import QueueSink, SSESink, StreamRecorder, astream_chain, stream_chain
+
+
+def make_chain(stub_chat):
+    return ChatPromptTemplate.from_template("{topic}") | stub_chat | StrOutputParser()
+
+
+def test_stream_chain_pushes_tokens_and_measures_ttft(stub_server, stub_chat):
+    stub_server.config.update(latency_ms=60, tokens_per_sec=200)
+    sink = QueueSink()
+    recorder = StreamRecorder()
+    result = stream_chain(make_chain(stub_chat), {"topic": "one two three"}, sink=sink, recorder=recorder)
+    sink.close()
+
+    received = []
+    while (chunk := sink.queue.get_nowait()) is not None:
+        received.append(chunk)
+    assert "".join(received) == result.text == "[stub] 已收到: one two three"
+    metrics = result.metrics
+    assert metrics.chunks == len(received) > 3
+    assert 0.06 <= metrics.ttft_s < metrics.total_s
+    assert 0 < metrics.tokens_per_sec <= 250
+    assert recorder.summary()["runs"] == 1
+
+
+def test_astream_chain_awaits_async_sink(stub_chat):
+    received = []
+
+    async def sink(chunk):
+        await asyncio.sleep(0)
+        received.append(chunk)
+
+    result = asyncio.run(astream_chain(make_chain(stub_chat), {"topic": "hello"}, sink=sink))
+    assert "".join(received) == result.text == "[stub] 已收到: hello"
+
+
+def test_sse_sink_formats_multiline_chunks():
+    out = []
+    sink = SSESink(out.append, event="token")
+    sink("a\nb")
+    sink.close()
+    assert out == ["event: token\ndata: a\ndata: b\n\n", "data: [DONE]\n\n"]
+
+
+def test_recorder_summarizes_runs(stub_chat):
+    recorder = StreamRecorder()
+    for topic in ("a", "b", "c"):
+        stream_chain(make_chain(stub_chat), {"topic": topic}, sink=None, recorder=recorder)
+    summary = recorder.summary()
+    assert summary["runs"] == 3
+    assert summary["ttft_s"]["count"] == 3
@@ -0,0 +1,100 @@
+import time
+
+import pytest
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import OpenAIEmbeddings
+from pydantic import BaseModel
+
+from providers import default_chat_provider, default_embeddings_provider
+from utils import get_embeddings_model, get_model
+
+
+class Weather(BaseModel):
+    city: str
+    celsius: float
+
+
+def test_default_response_echoes_last_user_message(stub_chat):
+    assert stub_chat.invoke("hello stub").content == "[stub] 已收到: hello stub"
+
+
+def test_rules_match_in_order(stub_server, stub_chat):
+    stub_server.config.update(rules=[
+        {"last_user": "budget", "response": "The budget is $500 ({n_messages} messages)"},
+        {"match": ".*", "response": "fallback"},
+    ])
+    assert stub_chat.invoke("home office budget?").content == "The budget is $500 (1 messages)"
+    assert stub_chat.invoke("anything else").content == "fallback"
+
+
+def test_tool_calls_are_synthesized_from_schema(stub_chat):
+    def get_weather(city: str, celsius: float) -> str:
+        """Look up the weather for a city."""
+        return city
+
+    message = stub_chat.bind_tools([get_weather]).invoke("weather in 21 degree Paris?")
+    assert [call["name"] for call in message.tool_calls] == ["get_weather"]
+    assert message.tool_calls[0]["args"]["celsius"] == 21
+
+
+def test_json_schema_in_prompt_gets_a_valid_instance(stub_chat):
+    parser = PydanticOutputParser(pydantic_object=Weather)
+    prompt = ChatPromptTemplate.from_template("{format_instructions}\nWeather in {city}?")
+    chain = prompt.partial(format_instructions=parser.get_format_instructions()) | stub_chat | parser
+    assert isinstance(chain.invoke({"city": "Paris"}), Weather)
+
+
+def test_streaming_yields_tokens(stub_chat):
+    chunks = [c.content for c in stub_chat.stream("one two three")]
+    assert len(chunks) > 3
+    assert "".join(chunks) == "[stub] 已收到: one two three"
+
+
+def test_latency_and_error_injection(stub_server, stub_chat):
+    stub_server.config.update(latency_ms=80)
+    start = time.perf_counter()
+    stub_chat.invoke("slow")
+    assert time.perf_counter() - start >= 0.08
+
+    stub_server.config.update(latency_ms=0, error_rate=1.0, error_status=503)
+    with pytest.raises(Exception) as excinfo:
+        stub_chat.invoke("fail")
+    assert getattr(excinfo.value, "status_code", None) == 503
+
+
+def test_embeddings_are_deterministic_and_normalized(stub_server):
+    embeddings = OpenAIEmbeddings(model="stub-embedding", api_key="stub", base_url=stub_server.base_url,
+                                  check_embedding_ctx_length=False)
+    first, second, other = embeddings.embed_documents(["same text", "same text", "different"])
+    assert first == second != other
+    assert len(first) == stub_server.config.embedding_dim
+    assert sum(v * v for v in first) == pytest.approx(1.0)
+
+
+def test_chain_runs_against_stub_provider(monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "stub")
+    chain = ChatPromptTemplate.from_template("Q: {q}") | get_model(lazy=True)
+    assert chain.invoke({"q": "ping"}).content == "[stub] 已收到: Q: ping"
+
+
+def test_environment_only_fills_in_the_default_provider(monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "stub")
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "sk-test")
+    assert default_chat_provider() == "stub"
+    assert get_model(lazy=True).provider == "stub"
+    # 显式传入的 provider 不会被 LLM_PROVIDER 覆盖
+    assert get_model("deepseek", lazy=True).provider == "deepseek"
+
+    monkeypatch.delenv("LLM_PROVIDER")
+    assert default_chat_provider() == "deepseek"
+    monkeypatch.delenv("DEEPSEEK_API_KEY")
+    assert default_chat_provider() == "openai"
+
+
+def test_embeddings_provider_precedence(monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "stub")
+    assert default_embeddings_provider() == "stub"
+    monkeypatch.setenv("EMBEDDINGS_PROVIDER", "hashing")
+    assert default_embeddings_provider() == "hashing"
+    assert type(get_embeddings_model()).__name__ == "HashingEmbeddings"
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda, RunnableParallel
+
+from telemetry import TelemetryHandler, attach
+
+
+def test_spans_nest_and_tokens_roll_up(tmp_path, stub_chat):
+    path = tmp_path / "telemetry.jsonl"
+    telemetry = TelemetryHandler(jsonl_path=str(path))
+    chain = (ChatPromptTemplate.from_template("{q}") | stub_chat | StrOutputParser()).with_config(run_name="qa")
+    chain.invoke({"q": "hello there"}, config={"callbacks": [telemetry]})
+    telemetry.close()
+
+    records = {r["path"]: r for r in map(json.loads, path.read_text().splitlines())}
+    assert set(records) == {"qa", "qa > ChatPromptTemplate", "qa > ChatOpenAI", "qa > StrOutputParser"}
+    llm = records["qa > ChatOpenAI"]
+    assert (llm["kind"], llm["depth"]) == ("llm", 1)
+    assert llm["prompt_tokens"] > 0 and llm["completion_tokens"] > 0
+    # 父 span 汇总整棵子树的 token
+    assert records["qa"]["completion_tokens"] == llm["completion_tokens"]
+    assert records["qa"]["wall_s"] >= llm["wall_s"]
+    assert telemetry.spans_in_flight() == []
+
+
+def test_queue_time_measures_wait_after_siblings():
+    telemetry = TelemetryHandler()
+    chain = RunnableLambda(lambda x: x, name="first") | RunnableLambda(lambda x: x, name="second")
+    attach(chain.with_config(run_name="seq"), telemetry).invoke(1)
+    summary = telemetry.aggregator.summary()
+    assert summary["seq > second"]["queue_s"]["max"] < 0.05
+    assert summary["seq > first"]["depth"] == 1
+
+
+def test_errors_and_retries_are_recorded():
+    attempts = []
+
+    def flaky(x):
+        attempts.append(x)
+        if len(attempts) < 3:
+            raise ValueError("flaky")
+        return x
+
+    telemetry = TelemetryHandler()
+    chain = RunnableLambda(flaky, name="flaky").with_retry(stop_after_attempt=3, wait_exponential_jitter=False)
+    assert chain.invoke(1, config={"callbacks": [telemetry]}) == 1
+    failing = RunnableParallel(bad=RunnableLambda(lambda x: 1 / 0, name="bad"))
+    with pytest.raises(ZeroDivisionError):
+        failing.invoke(1, config={"callbacks": [telemetry]})
+
+    summary = telemetry.aggregator.summary()
+    retried = next(v for k, v in summary.items() if v["depth"] == 0 and v["retries"])
+    assert retried["retries"] == 2
+    assert summary["RunnableParallel<bad> > bad"]["errors"] == 1
+    assert "step" in telemetry.aggregator.report()